@@ -1,3 +1,3 @@
 """Recsys package for T-ECD experiments."""
 
-__all__ = ["models"]
+__all__ = ["models", "eval", "enrichment", "features", "clustering", "profiles"]
@@ -0,0 +1,395 @@
+"""Out-of-core user clustering over the feature store.
+
+The clustering notebook fits StandardScaler, PCA and KMeans (plus LOF and
+UMAP) on one materialised DataFrame, so it only ever sees a subsample of
+users. Here everything is fitted from chunks of ``users.parquet``:
+
+- one pass accumulates count, mean and the scatter matrix (Chan's pairwise
+  update), which gives both the scaler (mean/std) and PCA (eigenvectors of
+  the correlation matrix) exactly, without holding the data
+- mini-batch k-means (Sculley, 2010) on the projected chunks for a few
+  epochs, seeded with k-means++ on the first chunk
+- assignment is a chunked, vectorized nearest-centroid argmin
+- k-means numbers its centroids arbitrarily, and differently on every
+  refit. Centroids are therefore matched one-to-one to the socdem_cluster
+  ids of users.pq (the groups in data/support/socdem_cluster.json). The
+  Hungarian match maximises agreement on the contingency table. The saved
+  assignments use those ids, so the web service can treat them as its
+  named segments.
+
+The model is a handful of small arrays written as .npy plus JSON, and every
+user can be re-scored in one streaming pass over the store.
+"""
+from __future__ import annotations
+
+import json
+import time
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Optional, Sequence, Tuple, Union
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from .models.retrieval import _nearest
+
+# user-level features of the clustering notebook that the feature store provides
+DEFAULT_FEATURES = (
+    "days",
+    "total_amount",
+    "mean_amount",
+    "median_amount",
+    "max_amount",
+    "mean_events",
+    "unique_categories_mean",
+    "auto_day_share",
+    "home_day_share",
+    "high_spend_share",
+    "weekend_share",
+    "pre_ny_share",
+    "gifts_q1_share",
+    "bts_share",
+    "summer_share",
+    "salary_window_share",
+    "social_benefits_share",
+)
+
+
+@dataclass
+class ClusteringConfig:
+    features: Tuple[str, ...] = DEFAULT_FEATURES  # missing columns are skipped
+    n_components: int = 10
+    n_clusters: int = 5
+    epochs: int = 3  # mini-batch k-means passes over the store
+    batch_size: int = 65_536
+    seed: int = 0
+
+
+def feature_matrix(batch: Union[pa.RecordBatch, pa.Table], columns: Sequence[str]) -> np.ndarray:
+    """[rows, len(columns)] float64 with nulls/NaN as 0 (the notebook's fillna(0))."""
+
+    out = np.zeros((batch.num_rows, len(columns)))
+    for j, name in enumerate(columns):
+        column = batch.column(name)
+        if column.null_count:
+            column = column.fill_null(0)
+        out[:, j] = column.to_numpy(zero_copy_only=False)
+    np.nan_to_num(out, copy=False, nan=0.0, posinf=0.0, neginf=0.0)
+    return out
+
+
+class MomentAccumulator:
+    """Running count, mean and scatter matrix, merged chunk by chunk."""
+
+    def __init__(self, dim: int):
+        self.n = 0
+        self.mean = np.zeros(dim)
+        self.scatter = np.zeros((dim, dim))  # sum of (x - mean)(x - mean)^T
+
+    def update(self, X: np.ndarray) -> None:
+        m = len(X)
+        if not m:
+            return
+        batch_mean = X.mean(axis=0)
+        centered = X - batch_mean
+        delta = batch_mean - self.mean
+        total = self.n + m
+        self.scatter += centered.T @ centered + np.outer(delta, delta) * (self.n * m / total)
+        self.mean += delta * (m / total)
+        self.n = total
+
+    def std(self) -> np.ndarray:
+        std = np.sqrt(np.diag(self.scatter) / max(self.n, 1))
+        return np.where(std > 0, std, 1.0)  # constant columns scale to 0, as in StandardScaler
+
+    def pca(self, n_components: int) -> Tuple[np.ndarray, np.ndarray]:
+        """(components [k, dim], explained variance ratio [k]) of the standardised data."""
+
+        std = self.std()
+        cov = self.scatter / max(self.n, 1) / np.outer(std, std)
+        values, vectors = np.linalg.eigh(cov)
+        order = np.argsort(values)[::-1][:n_components]
+        values = np.maximum(values[order], 0)
+        components = vectors[:, order].T
+        # sign convention: largest-magnitude loading positive, so reruns give the same axes
+        signs = np.sign(components[np.arange(len(components)), np.abs(components).argmax(axis=1)])
+        components *= np.where(signs == 0, 1, signs)[:, None]
+        return components, values / max(np.trace(cov), 1e-12)
+
+
+class MiniBatchKMeans:
+    """Sculley's mini-batch k-means: per-centre learning rate 1 / points seen."""
+
+    def __init__(self, n_clusters: int, seed: int = 0):
+        self.n_clusters = n_clusters
+        self.rng = np.random.default_rng(seed)
+        self.centroids: Optional[np.ndarray] = None
+        self.counts: Optional[np.ndarray] = None
+
+    def _init(self, X: np.ndarray) -> None:
+        """k-means++ seeding on the first chunk."""
+
+        centroids = [X[self.rng.integers(len(X))]]
+        dist = ((X - centroids[0]) ** 2).sum(axis=1)
+        for _ in range(1, min(self.n_clusters, len(X))):
+            probs = dist / dist.sum() if dist.sum() > 0 else None
+            centroids.append(X[self.rng.choice(len(X), p=probs)])
+            dist = np.minimum(dist, ((X - centroids[-1]) ** 2).sum(axis=1))
+        self.centroids = np.array(centroids)
+        self.counts = np.zeros(len(self.centroids))
+
+    def partial_fit(self, X: np.ndarray) -> "MiniBatchKMeans":
+        if not len(X):
+            return self
+        if self.centroids is None:
+            self._init(X)
+        assign = _nearest(X, self.centroids)
+        batch_counts = np.bincount(assign, minlength=len(self.centroids)).astype(np.float64)
+        sums = np.zeros_like(self.centroids)
+        np.add.at(sums, assign, X)
+        seen = batch_counts > 0
+        self.counts += batch_counts
+        # c <- c + (batch_count / total_count) * (batch_mean - c): the per-point 1/n update, batched
+        rate = np.where(seen, batch_counts / np.maximum(self.counts, 1), 0)[:, None]
+        batch_mean = sums / np.maximum(batch_counts, 1)[:, None]
+        self.centroids += rate * (batch_mean - self.centroids) * seen[:, None]
+        return self
+
+
+class ClusterModel:
+    """Scaler + PCA projection + centroids; ``predict`` is a nearest-centroid lookup."""
+
+    def __init__(
+        self,
+        features: Sequence[str],
+        mean: np.ndarray,
+        std: np.ndarray,
+        components: np.ndarray,
+        centroids: np.ndarray,
+        meta: Optional[dict] = None,
+    ):
+        self.features = list(features)
+        self.mean = mean
+        self.std = std
+        self.components = components
+        self.centroids = centroids
+        self.meta = meta or {}
+
+    def transform(self, X: np.ndarray) -> np.ndarray:
+        return ((X - self.mean) / self.std) @ self.components.T
+
+    def predict(self, X: np.ndarray) -> np.ndarray:
+        return _nearest(self.transform(X).astype(np.float32), self.centroids.astype(np.float32)).astype(np.int32)
+
+    def predict_batch(self, batch: Union[pa.RecordBatch, pa.Table]) -> np.ndarray:
+        return self.predict(feature_matrix(batch, self.features))
+
+    @property
+    def label_map(self) -> Optional[np.ndarray]:
+        """socdem_cluster id per centroid (-1: unmatched), or None before ``align_clusters``."""
+
+        labels = self.meta.get("label_map")
+        return None if labels is None else np.asarray(labels, dtype=np.int32)
+
+    def save(self, path: Union[str, Path]) -> None:
+        path = Path(path)
+        path.mkdir(parents=True, exist_ok=True)
+        for name in ("mean", "std", "components", "centroids"):
+            np.save(path / f"{name}.npy", getattr(self, name))
+        info = {"features": self.features, **self.meta}
+        (path / "clustering.json").write_text(json.dumps(info, ensure_ascii=False, indent=2), encoding="utf-8")
+
+    @classmethod
+    def load(cls, path: Union[str, Path]) -> "ClusterModel":
+        path = Path(path)
+        info = json.loads((path / "clustering.json").read_text(encoding="utf-8"))
+        arrays = {name: np.load(path / f"{name}.npy") for name in ("mean", "std", "components", "centroids")}
+        features = info.pop("features")
+        return cls(features, meta=info, **arrays)
+
+
+def store_batches(store: Union[str, Path], columns: Sequence[str], batch_size: int) -> Iterable[pa.RecordBatch]:
+    """Chunks of the feature store's users.parquet (only the requested columns are read)."""
+
+    yield from pq.ParquetFile(Path(store) / "users.parquet").iter_batches(batch_size=batch_size, columns=list(columns))
+
+
+def store_features(store: Union[str, Path], features: Sequence[str]) -> Tuple[str, ...]:
+    """The requested features that exist in the store's users.parquet."""
+
+    names = set(pq.read_schema(Path(store) / "users.parquet").names)
+    return tuple(name for name in features if name in names)
+
+
+def fit_clusters(
+    make_batches: Callable[[], Iterable[pa.RecordBatch]],
+    cfg: ClusteringConfig,
+    log_every: int = 1,
+) -> ClusterModel:
+    """Fit scaler + PCA in one pass and mini-batch k-means in ``cfg.epochs`` more."""
+
+    start = time.perf_counter()
+    first = next(iter(make_batches()), None)
+    if first is None:
+        raise ValueError("feature store is empty")
+    features = [name for name in cfg.features if name in first.schema.names]
+    if not features:
+        raise ValueError(f"none of the features {list(cfg.features)} are in the store")
+
+    moments = MomentAccumulator(len(features))
+    for batch in make_batches():
+        moments.update(feature_matrix(batch, features))
+    components, explained = moments.pca(min(cfg.n_components, len(features)))
+    std = moments.std()
+    model = ClusterModel(features, moments.mean, std, components, np.zeros((0, len(components))))
+
+    kmeans = MiniBatchKMeans(cfg.n_clusters, seed=cfg.seed)
+    for epoch in range(cfg.epochs):
+        for batch in make_batches():
+            kmeans.partial_fit(model.transform(feature_matrix(batch, features)))
+        if log_every and (epoch + 1) % log_every == 0:
+            print(f"k-means epoch {epoch + 1}/{cfg.epochs}: {time.perf_counter() - start:.1f}s")
+
+    model.centroids = kmeans.centroids
+    model.meta = {
+        "config": asdict(cfg),
+        "users": moments.n,
+        "explained_variance_ratio": explained.tolist(),
+        "cluster_sizes_seen": kmeans.counts.tolist(),
+    }
+    return model
+
+
+def socdem_labels(users_path: Union[str, Path], user_key: str = "user_id") -> Tuple[np.ndarray, np.ndarray]:
+    """(sorted fixed-width user keys, socdem_cluster) of the users in users.pq with a known cluster."""
+
+    from .models.vocab import _utf8_array
+    from .profiles import read_users
+
+    users = read_users(users_path, user_key)
+    labels = users["socdem_cluster"].to_numpy()
+    known = labels >= 0
+    keys, _ = _utf8_array(users["user_id"])
+    keys, labels = keys[known], labels[known]
+    order = np.argsort(keys, kind="stable")
+    return keys[order], labels[order].astype(np.int32)
+
+
+def align_clusters(
+    model: ClusterModel,
+    batches: Iterable[pa.RecordBatch],
+    labels: Tuple[np.ndarray, np.ndarray],
+    user_key: str = "user_id",
+) -> np.ndarray:
+    """Match centroids to socdem_cluster ids and store the map in ``model.meta``.
+
+    Counts (centroid, socdem_cluster) pairs over users found in ``labels``,
+    then picks the one-to-one matching with the largest agreement
+    (Hungarian algorithm). Centroids left without a label map to -1.
+    """
+
+    from scipy.optimize import linear_sum_assignment
+
+    from .models.vocab import _utf8_array
+
+    label_keys, label_values = labels
+    n_labels = int(label_values.max()) + 1 if len(label_values) else 0
+    n_centroids = len(model.centroids)
+    counts = np.zeros((n_centroids, max(n_labels, 1)), dtype=np.int64)
+    for batch in batches:
+        keys, _ = _utf8_array(batch.column(user_key))
+        pos = np.minimum(np.searchsorted(label_keys, keys), max(len(label_keys) - 1, 0))
+        found = (label_keys[pos] == keys) if len(label_keys) else np.zeros(len(keys), dtype=bool)
+        if found.any():
+            predicted = model.predict_batch(batch)[found]
+            counts += np.bincount(
+                predicted * counts.shape[1] + label_values[pos[found]], minlength=counts.size
+            ).reshape(counts.shape)
+
+    label_map = np.full(n_centroids, -1, dtype=np.int32)
+    if counts.sum():
+        rows, cols = linear_sum_assignment(counts, maximize=True)
+        label_map[rows] = cols
+    matched = int(counts[np.flatnonzero(label_map >= 0), label_map[label_map >= 0]].sum())
+    model.meta["label_map"] = label_map.tolist()
+    model.meta["label_agreement"] = matched / max(int(counts.sum()), 1)
+    model.meta["label_contingency"] = counts.tolist()
+    return label_map
+
+
+def assign_clusters(
+    model: ClusterModel,
+    batches: Iterable[pa.RecordBatch],
+    user_key: str = "user_id",
+) -> Tuple[pa.Array, np.ndarray]:
+    """(user_ids, cluster ids) for every row of the batches."""
+
+    users, clusters = [], []
+    for batch in batches:
+        users.append(batch.column(user_key))
+        clusters.append(model.predict_batch(batch))
+    if not users:
+        return pa.array([], pa.string()), np.zeros(0, dtype=np.int32)
+    return pa.concat_arrays(users), np.concatenate(clusters)
+
+
+def cluster_factor_means(
+    user_factors: np.ndarray,
+    user_keys: np.ndarray,
+    user_key_ids: np.ndarray,
+    cluster_keys: np.ndarray,
+    clusters: np.ndarray,
+    chunk_size: int = 1 << 20,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """(mean factor per cluster id [n_clusters, dim], users per cluster) over users that have both.
+
+    ``user_keys``/``user_key_ids`` are a frozen Vocabulary's sorted keys and
+    row ids (the ALS layout), ``cluster_keys``/``clusters`` the sorted output
+    of ``save_assignments``. Both sides are sorted, so the join is a chunked
+    searchsorted and the factor matrix is only read a chunk at a time.
+    """
+
+    n_clusters = int(clusters.max()) + 1 if len(clusters) else 0
+    sums = np.zeros((n_clusters, user_factors.shape[1]))
+    counts = np.zeros(n_clusters, dtype=np.int64)
+    for lo in range(0, len(user_keys), chunk_size):
+        keys = user_keys[lo : lo + chunk_size]
+        pos = np.minimum(np.searchsorted(cluster_keys, keys), max(len(cluster_keys) - 1, 0))
+        found = cluster_keys[pos] == keys if len(cluster_keys) else np.zeros(len(keys), dtype=bool)
+        labels = np.asarray(clusters[pos[found]])
+        rows = np.asarray(user_key_ids[lo : lo + chunk_size])[found]
+        known = labels >= 0
+        labels, rows = labels[known], rows[known]
+        if len(rows):
+            np.add.at(sums, labels, np.asarray(user_factors[rows], dtype=np.float64))
+            counts += np.bincount(labels, minlength=n_clusters)
+    return (sums / np.maximum(counts, 1)[:, None]).astype(np.float32), counts
+
+
+def save_assignments(
+    path: Union[str, Path], users: pa.Array, clusters: np.ndarray, label_map: Optional[np.ndarray] = None
+) -> Dict[str, Path]:
+    """Sorted fixed-width keys + row ids + cluster per row as .npy (web artifact layout).
+
+    With ``label_map`` the centroid indices are written as socdem_cluster ids.
+    """
+
+    from .models.vocab import _utf8_array
+
+    if label_map is not None:
+        clusters = np.asarray(label_map)[clusters]
+
+    path = Path(path)
+    path.mkdir(parents=True, exist_ok=True)
+    keys, _ = _utf8_array(users)
+    order = np.argsort(keys, kind="stable")
+    files = {
+        "cluster_keys": path / "cluster_keys.npy",
+        "cluster_key_ids": path / "cluster_key_ids.npy",
+        "clusters": path / "clusters.npy",
+    }
+    np.save(files["cluster_keys"], keys[order])
+    np.save(files["cluster_key_ids"], np.arange(len(order), dtype=np.int64))
+    np.save(files["clusters"], clusters[order].astype(np.int32))
+    return files
@@ -0,0 +1,100 @@
+"""Event enrichment: keyword flags resolved once per distinct value.
+
+The notebooks' ``detect_keyword_flag`` concatenates up to six columns into
+one lowercase string per event and runs ``str.contains`` once per keyword.
+Here every flag column is dictionary-encoded, the keywords of a rule are
+compiled into a single alternation (RE2 turns a set of literals into one
+automaton, the Aho-Corasick construction) and matched against the distinct
+values only. Rows get their flags by taking the per-value bitmask with the
+dictionary indices, so the per-event work is an integer gather and an OR
+across columns.
+"""
+from __future__ import annotations
+
+import re
+from dataclasses import dataclass, field
+from typing import Dict, Optional, Sequence, Union
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+
+AUTO_KEYWORDS = ("auto", "car", "fuel", "gas", "azs", "sto", "parking", "tire", "taxi")
+HOME_KEYWORDS = ("home", "repair", "remont", "stroi", "furniture", "kitchen", "flat", "rent", "mortgage", "paint")
+DEFAULT_RULES = {"auto": AUTO_KEYWORDS, "home": HOME_KEYWORDS}
+DEFAULT_FLAG_COLUMNS = ("category", "category_id", "brand_id", "domain", "subdomain", "item_id", "action_type")
+
+
+def keyword_pattern(keywords: Sequence[str]) -> str:
+    """Escaped alternation of lowercase literals (longest first)."""
+
+    literals = sorted({keyword.lower() for keyword in keywords if keyword}, key=lambda k: (-len(k), k))
+    if not literals:
+        raise ValueError("a flag rule needs at least one keyword")
+    return "|".join(re.escape(literal) for literal in literals)
+
+
+@dataclass
+class KeywordFlagger:
+    """Per-event flags ``<rule>_related``: any flag column contains any of the rule's keywords."""
+
+    rules: Dict[str, Sequence[str]] = field(default_factory=lambda: dict(DEFAULT_RULES))
+    columns: Sequence[str] = DEFAULT_FLAG_COLUMNS
+    suffix: str = "_related"
+
+    def __post_init__(self):
+        if len(self.rules) > 64:
+            raise ValueError("at most 64 flag rules fit the uint64 bitmask")
+        self._patterns = [keyword_pattern(keywords) for keywords in self.rules.values()]
+
+    @property
+    def names(self) -> list:
+        return [f"{rule}{self.suffix}" for rule in self.rules]
+
+    def value_masks(self, values: pa.Array) -> np.ndarray:
+        """uint64 bitmask per value (bit i: rule i matched); nulls get 0."""
+
+        lowered = pc.utf8_lower(pc.cast(values, pa.string()))
+        masks = np.zeros(len(values), dtype=np.uint64)
+        for bit, pattern in enumerate(self._patterns):
+            hit = pc.fill_null(pc.match_substring_regex(lowered, pattern), False)
+            masks |= hit.to_numpy(zero_copy_only=False).astype(np.uint64) << np.uint64(bit)
+        return masks
+
+    def masks(self, batch: Union[pa.RecordBatch, pa.Table]) -> np.ndarray:
+        """Row bitmasks: per column, distinct values are matched once and gathered by dictionary index."""
+
+        out = np.zeros(batch.num_rows, dtype=np.uint64)
+        for name in self.columns:
+            if name not in batch.schema.names:
+                continue
+            column = batch.column(name)
+            if isinstance(column, pa.ChunkedArray):
+                column = column.combine_chunks()
+            encoded = column if pa.types.is_dictionary(column.type) else pc.dictionary_encode(column)
+            if not len(encoded.dictionary):
+                continue
+            value_masks = self.value_masks(encoded.dictionary)
+            indices = encoded.indices.to_numpy(zero_copy_only=False)
+            valid = encoded.is_valid().to_numpy(zero_copy_only=False)
+            if valid.all():
+                out |= value_masks[indices]
+            else:
+                out[valid] |= value_masks[indices[valid].astype(np.int64)]
+        return out
+
+    def flags(self, batch: Union[pa.RecordBatch, pa.Table], masks: Optional[np.ndarray] = None) -> Dict[str, np.ndarray]:
+        masks = self.masks(batch) if masks is None else masks
+        return {
+            name: ((masks >> np.uint64(bit)) & np.uint64(1)).astype(bool)
+            for bit, name in enumerate(self.names)
+        }
+
+    def enrich(self, batch: pa.RecordBatch) -> pa.RecordBatch:
+        """The batch with one boolean column per rule appended."""
+
+        flags = self.flags(batch)
+        return pa.RecordBatch.from_arrays(
+            [*batch.columns, *(pa.array(values) for values in flags.values())],
+            names=[*batch.schema.names, *flags],
+        )
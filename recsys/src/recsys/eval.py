@@ -0,0 +1,195 @@
+"""Offline evaluation of top-k recommenders on time-split T-ECD extracts.
+
+Any model with ``recommend(user_ids, k)`` returning a ``[n_users, k]`` array
+(or list of lists) of item ids can be scored. Relevant items are held as a
+CSR matrix (users x items) and hits are found with one sorted-key lookup
+per chunk of users, so all metrics are vectorized NumPy over chunks:
+
+- recall@k: hits / |relevant|
+- NDCG@k: binary gains, ideal DCG over min(|relevant|, k) positions
+- MAP@k: average precision normalised by min(|relevant|, k)
+- coverage: share of the training catalogue recommended to anyone
+- novelty: mean self-information -log2(p(item)), p = share of train users
+"""
+from __future__ import annotations
+
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Protocol, Sequence, Tuple, Union
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as pads
+
+from .models.data_pipeline import _timestamps_us
+from .models.vocab import Vocabulary
+
+
+class Recommender(Protocol):
+    def recommend(self, user_ids: Sequence[str], k: int) -> Any: ...
+
+
+@dataclass
+class SplitConfig:
+    user_key: str = "user_id"
+    item_key: str = "product_id"
+    timestamp_key: str = "timestamp"
+    test_days: int = 7  # last N days of the extract become the test period
+    cutoff: Optional[str] = None  # explicit ISO timestamp; overrides test_days
+
+
+def read_extract(path: Union[str, Path, Sequence[str]], columns: Optional[List[str]] = None) -> pa.Table:
+    """Parquet file(s)/directory written by stream_tecd or extract_shards."""
+
+    source = [str(p) for p in path] if isinstance(path, (list, tuple)) else str(path)
+    return pads.dataset(source, format="parquet").to_table(columns=columns)
+
+
+def time_split(table: pa.Table, cfg: SplitConfig) -> Tuple[pa.Table, pa.Table, np.datetime64]:
+    """(train, test, cutoff): events before the cutoff train, the rest test."""
+
+    table = table.filter(pc.and_(pc.is_valid(table[cfg.user_key]), pc.is_valid(table[cfg.item_key])))
+    ts = _timestamps_us(table[cfg.timestamp_key])
+    if cfg.cutoff is not None:
+        cutoff = np.datetime64(cfg.cutoff, "us")
+    else:
+        cutoff = ts[~np.isnat(ts)].max() - np.timedelta64(cfg.test_days, "D")
+    is_test = ts > cutoff
+    return table.filter(pa.array(~is_test)), table.filter(pa.array(is_test)), cutoff
+
+
+@dataclass
+class GroundTruth:
+    """Relevant items per evaluated user, CSR over the shared item vocabulary."""
+
+    user_ids: np.ndarray  # object [U]
+    indptr: np.ndarray  # int64 [U + 1]
+    indices: np.ndarray  # int64 [nnz], sorted within each row
+    items: Vocabulary
+    item_counts: np.ndarray  # int64 [V], train users per item
+    train_users: int
+
+    def __len__(self) -> int:
+        return len(self.user_ids)
+
+
+def build_ground_truth(train: pa.Table, test: pa.Table, cfg: SplitConfig) -> GroundTruth:
+    """Distinct (user, item) test pairs plus train popularity for novelty."""
+
+    chunks = train[cfg.item_key].chunks + test[cfg.item_key].chunks
+    items = Vocabulary.build(pa.chunked_array([pc.cast(chunk, pa.string()) for chunk in chunks], pa.string()))
+    n_items = len(items)
+
+    test_users = pc.cast(test[cfg.user_key], pa.string()).combine_chunks().dictionary_encode()
+    user_codes = test_users.indices.to_numpy(zero_copy_only=False).astype(np.int64)
+    item_codes = items.encode_batch(test[cfg.item_key])
+    keys = np.unique(user_codes * n_items + item_codes)
+    rows, cols = np.divmod(keys, n_items)
+    user_ids = test_users.dictionary.to_numpy(zero_copy_only=False)
+    indptr = np.searchsorted(rows, np.arange(len(user_ids) + 1))
+
+    train_pairs = pa.table({
+        "u": pc.cast(train[cfg.user_key], pa.string()),
+        "i": pa.array(items.encode_batch(train[cfg.item_key])),
+    }).group_by(["u", "i"]).aggregate([])
+    item_counts = np.bincount(train_pairs["i"].to_numpy(), minlength=n_items)
+    train_users = pc.count_distinct(train[cfg.user_key]).as_py()
+
+    return GroundTruth(
+        user_ids=user_ids,
+        indptr=indptr.astype(np.int64),
+        indices=cols.astype(np.int64),
+        items=items,
+        item_counts=item_counts,
+        train_users=train_users,
+    )
+
+
+def _as_matrix(recs: Any, n: int, k: int) -> np.ndarray:
+    """[n, k] object/int matrix from an array or ragged list (padded with None)."""
+
+    out = np.full((n, k), None, dtype=object)
+    if isinstance(recs, np.ndarray) and recs.ndim == 2:
+        width = min(recs.shape[1], k)
+        out[:, :width] = recs[:, :width]
+        return out
+    for row, items in enumerate(recs):
+        items = list(items)[:k]
+        out[row, : len(items)] = items
+    return out
+
+
+def evaluate(
+    model: Recommender,
+    truth: GroundTruth,
+    k: int = 10,
+    chunk_size: int = 50_000,
+) -> Dict[str, float]:
+    """Mean recall/NDCG/MAP@k over users with test items, plus coverage/novelty."""
+
+    n_items = len(truth.items)
+    discounts = 1.0 / np.log2(np.arange(k) + 2)
+    ideal = np.concatenate([[0.0], np.cumsum(discounts)])
+    p_item = np.maximum(truth.item_counts, 1) / max(truth.train_users, 1)
+    self_info = -np.log2(np.minimum(p_item, 1.0))
+    recommended = np.zeros(n_items, dtype=bool)
+    totals = {"recall": 0.0, "ndcg": 0.0, "map": 0.0, "novelty": 0.0}
+    novelty_n = 0
+    start = time.perf_counter()
+
+    for lo in range(0, len(truth), chunk_size):
+        hi = min(lo + chunk_size, len(truth))
+        users = truth.user_ids[lo:hi]
+        recs = _as_matrix(model.recommend(list(users), k), hi - lo, k)
+        valid = recs != None  # noqa: E711 - padded slots
+        ids = truth.items.encode_batch(recs.reshape(-1)).reshape(recs.shape)
+        known = valid & (ids > truth.items.unk_id)
+
+        rel_keys = np.repeat(np.arange(hi - lo, dtype=np.int64), np.diff(truth.indptr[lo:hi + 1])) * n_items
+        rel_keys += truth.indices[truth.indptr[lo]:truth.indptr[hi]]
+        rec_keys = np.arange(hi - lo, dtype=np.int64)[:, None] * n_items + ids
+        pos = np.minimum(np.searchsorted(rel_keys, rec_keys), max(len(rel_keys) - 1, 0))
+        hits = known & (rel_keys[pos] == rec_keys) if len(rel_keys) else np.zeros_like(known)
+
+        n_rel = np.diff(truth.indptr[lo:hi + 1])
+        denom = np.minimum(n_rel, k)
+        totals["recall"] += float((hits.sum(axis=1) / n_rel).sum())
+        totals["ndcg"] += float(((hits * discounts).sum(axis=1) / ideal[denom]).sum())
+        precision_at = np.cumsum(hits, axis=1) / np.arange(1, k + 1)
+        totals["map"] += float(((precision_at * hits).sum(axis=1) / denom).sum())
+
+        recommended[ids[known]] = True
+        totals["novelty"] += float(self_info[ids[known]].sum())
+        novelty_n += int(known.sum())
+
+    n_users = max(len(truth), 1)
+    catalogue = max(int((truth.item_counts > 0).sum()), 1)
+    return {
+        "users": len(truth),
+        f"recall@{k}": totals["recall"] / n_users,
+        f"ndcg@{k}": totals["ndcg"] / n_users,
+        f"map@{k}": totals["map"] / n_users,
+        "coverage": float((recommended & (truth.item_counts > 0)).sum()) / catalogue,
+        "novelty": totals["novelty"] / max(novelty_n, 1),
+        "seconds": time.perf_counter() - start,
+    }
+
+
+class PopularModel:
+    """Most-interacted items in train (distinct users), same list for everyone."""
+
+    def __init__(self, top_items: np.ndarray):
+        self.top_items = top_items
+
+    @classmethod
+    def fit(cls, train: pa.Table, cfg: SplitConfig, k_max: int = 100) -> "PopularModel":
+        pairs = pa.table({"u": train[cfg.user_key], "i": pc.cast(train[cfg.item_key], pa.string())})
+        counts = pairs.group_by(["u", "i"]).aggregate([]).group_by("i").aggregate([("u", "count")])
+        order = pc.sort_indices(counts, sort_keys=[("u_count", "descending"), ("i", "ascending")])
+        top = counts.take(order[:k_max])["i"].to_numpy(zero_copy_only=False)
+        return cls(np.asarray(top, dtype=object))
+
+    def recommend(self, user_ids: Sequence[str], k: int) -> np.ndarray:
+        return np.broadcast_to(self.top_items[:k], (len(user_ids), min(k, len(self.top_items))))
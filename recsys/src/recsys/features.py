@@ -0,0 +1,739 @@
+"""Incremental per-user spend/activity features over T-ECD event shards.
+
+Replaces the batch aggregation of the feature-engineering and clustering
+notebooks (groupby over all concatenated events). Each new shard is reduced
+to ``(user, day, category)`` groups with Arrow kernels and folded into
+per-user running state:
+
+- additive counters: days, amount/events totals, summed daily category
+  counts, days per calendar flag (weekend, pre-New-Year, salary window, ...)
+- max daily amount, first/last active day
+- a t-digest of daily amounts per user, giving median/p75/p90 without
+  keeping the daily history; ``high_spend_share`` counts days at or above
+  the user's p75 as known when the day was folded (prequential)
+- per-(user, category) amount/events for ``top_category``
+- days with an auto/home keyword event (``recsys.enrichment`` flags)
+
+The last day seen stays pending (a day can span two shards) and is folded
+by the next ingest or ``flush``. Each user keeps a bitmap of the days
+folded so far, relative to ``day_epoch``. A late day the user has not had
+yet is folded normally; one before the epoch moves the epoch back. A
+(user, day) that was already closed is rejected and counted as
+``late_events``; folding it again would double-count the day. Shards
+should therefore be ingested in day order; build_features sorts them by
+their first day.
+
+A fold reads only the new events and the state of the users they touch.
+Those users are found by a binary search over the saved tables, and their
+new rows go into small delta tables. The full tables are merged once, on
+``save``.
+
+The store is a directory of parquet files sorted by user_id
+(``users.parquet`` with raw state plus derived feature columns,
+``categories.parquet``, ``pending.parquet``) and ``state.json``.
+"""
+from __future__ import annotations
+
+import json
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence, Set, Tuple, Union
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+from .enrichment import DEFAULT_FLAG_COLUMNS, DEFAULT_RULES, KeywordFlagger
+from .models.data_pipeline import _timestamps_us
+from .models.vocab import _utf8_array
+
+# (day-flag column, derived share column) in the notebooks' naming
+CALENDAR_FLAGS = {
+    "weekend_days": "weekend_share",
+    "pre_ny_days": "pre_ny_share",
+    "gifts_q1_days": "gifts_q1_share",
+    "back_to_school_days": "bts_share",
+    "summer_days": "summer_share",
+    "salary_window_days": "salary_window_share",
+    "social_benefits_days": "social_benefits_share",
+}
+_SUM_COLUMNS = ["days", "total_amount", "total_events", "category_days", "high_spend_days", *CALENDAR_FLAGS]
+_GROUP_FIELDS = [
+    ("user_id", pa.string()),
+    ("day", pa.int32()),
+    ("category", pa.string()),
+    ("amount", pa.float64()),
+    ("events", pa.int64()),
+]
+
+
+def _group_schema(flags: Sequence[str] = ()) -> pa.Schema:
+    """(user, day, category) groups plus one "any event flagged" column per keyword rule."""
+
+    return pa.schema(_GROUP_FIELDS + [(name, pa.bool_()) for name in flags])
+
+
+@dataclass
+class FeatureConfig:
+    user_key: str = "user_id"
+    timestamp_key: str = "timestamp"
+    action_key: str = "action_type"
+    amount_keys: Tuple[str, ...] = ("price", "amount", "sum", "value")  # first present column wins
+    category_keys: Tuple[str, ...] = ("category", "category_id", "subdomain", "domain", "brand_id")
+    exclude_actions: Set[str] = field(default_factory=lambda: {"view"})  # compared lowercase
+    anchor_date: str = "2023-01-01"  # duration timestamps are offsets from this date, as in the notebooks
+    quantiles: Tuple[float, ...] = (0.5, 0.75, 0.9)
+    high_spend_quantile: float = 0.75
+    digest_compression: float = 100.0  # t-digest delta: at most ~delta/2 centroids per user
+    # calendar windows (clustering notebook FEATURE_PARAMS)
+    salary_window: Tuple[int, int] = (25, 5)  # day >= start or day <= end
+    social_benefits_window: Tuple[int, int] = (10, 20)
+    pre_ny_start_day: int = 15
+    gifts_q1_end_day: int = 8  # February plus March 1..N
+    back_to_school: Tuple[Tuple[int, int], Tuple[int, int]] = ((8, 15), (9, 15))
+    summer_months: Tuple[int, ...] = (6, 7, 8)
+    # keyword flags (recsys.enrichment): share of days with a flagged event per rule
+    flag_rules: Dict[str, Tuple[str, ...]] = field(default_factory=lambda: dict(DEFAULT_RULES))
+    flag_columns: Tuple[str, ...] = DEFAULT_FLAG_COLUMNS
+
+
+def _first_present(names: Sequence[str], candidates: Sequence[str]) -> Optional[str]:
+    return next((name for name in candidates if name in names), None)
+
+
+def batch_day_numbers(batch: pa.RecordBatch, cfg: FeatureConfig) -> np.ndarray:
+    """Days since 1970-01-01 per row (int64, ``np.iinfo.min`` where unknown)."""
+
+    column = batch.column(cfg.timestamp_key)
+    ts = _timestamps_us(column)
+    missing = np.isnat(ts)
+    days = ts.astype("datetime64[D]").view(np.int64)
+    if pa.types.is_duration(column.type):
+        days = days + np.datetime64(cfg.anchor_date, "D").view(np.int64)
+    days[missing] = np.iinfo(np.int64).min
+    return days
+
+
+def daily_category_groups(
+    batch: pa.RecordBatch, cfg: FeatureConfig, flagger: Optional[KeywordFlagger] = None
+) -> Optional[pa.Table]:
+    """(user_id, day, category) -> amount sum, event count and keyword flags for one record batch."""
+
+    names = batch.schema.names
+    if cfg.user_key not in names or cfg.timestamp_key not in names:
+        return None
+    keep = pc.is_valid(batch.column(cfg.user_key))
+    if cfg.exclude_actions and cfg.action_key in names:
+        actions = pc.utf8_lower(pc.cast(batch.column(cfg.action_key), pa.string()))
+        excluded = pc.is_in(actions, value_set=pa.array(sorted(a.lower() for a in cfg.exclude_actions), pa.string()))
+        keep = pc.and_(keep, pc.invert(pc.fill_null(excluded, False)))
+    batch = batch.filter(keep)
+    days = batch_day_numbers(batch, cfg)
+    known = days != np.iinfo(np.int64).min
+    if not known.all():
+        batch, days = batch.filter(pa.array(known)), days[known]
+    if not batch.num_rows:
+        return None
+
+    amount_key = _first_present(names, cfg.amount_keys)
+    category_key = _first_present(names, cfg.category_keys)
+    amount = (
+        pc.fill_null(pc.cast(batch.column(amount_key), pa.float64(), safe=False), 0.0)
+        if amount_key
+        else pa.array(np.zeros(batch.num_rows))
+    )
+    category = (
+        pc.cast(batch.column(category_key), pa.string())
+        if category_key
+        else pa.nulls(batch.num_rows, pa.string())
+    )
+    columns = {
+        "user_id": pc.cast(batch.column(cfg.user_key), pa.string()),
+        "day": pa.array(days.astype(np.int32)),
+        "category": category,
+        "amount": amount,
+    }
+    flags = flagger.flags(batch) if flagger is not None else {}
+    columns.update((name, pa.array(values)) for name, values in flags.items())
+    grouped = pa.table(columns).group_by(["user_id", "day", "category"]).aggregate(
+        [("amount", "sum"), ("amount", "count"), *((name, "any") for name in flags)]
+    )
+    return _regroup(grouped, list(flags))
+
+
+def _regroup(grouped: pa.Table, flags: Sequence[str]) -> pa.Table:
+    """Normalise group_by output (amount_sum/amount_count or amount_sum/events_sum) to _group_schema."""
+
+    events = grouped["amount_count"] if "amount_count" in grouped.column_names else grouped["events_sum"]
+    columns = {
+        "user_id": grouped["user_id"],
+        "day": grouped["day"],
+        "category": grouped["category"],
+        "amount": grouped["amount_sum"],
+        "events": pc.cast(events, pa.int64()),
+    }
+    columns.update((name, grouped[f"{name}_any"]) for name in flags)
+    return pa.table(columns, schema=_group_schema(flags))
+
+
+def _merge_groups(tables: List[pa.Table], flags: Sequence[str]) -> pa.Table:
+    tables = [t for t in tables if t is not None and t.num_rows]
+    if not tables:
+        return _group_schema(flags).empty_table()
+    combined = pa.concat_tables(tables)
+    if len(tables) == 1:
+        return combined
+    grouped = combined.group_by(["user_id", "day", "category"]).aggregate(
+        [("amount", "sum"), ("events", "sum"), *((name, "any") for name in flags)]
+    )
+    return _regroup(grouped, flags)
+
+
+def calendar_flags(days: np.ndarray, cfg: FeatureConfig) -> Dict[str, np.ndarray]:
+    """Boolean calendar flags per day number, keyed like CALENDAR_FLAGS."""
+
+    dates = days.astype("datetime64[D]")
+    month_start = dates.astype("datetime64[M]")
+    month = month_start.view(np.int64) % 12 + 1
+    day = (dates - month_start.astype("datetime64[D]")).view(np.int64) + 1
+    (bts_start_month, bts_start_day), (bts_end_month, bts_end_day) = cfg.back_to_school
+    return {
+        "weekend_days": (days + 3) % 7 >= 5,  # 1970-01-01 was a Thursday
+        "pre_ny_days": (month == 12) & (day >= cfg.pre_ny_start_day),
+        "gifts_q1_days": (month == 2) | ((month == 3) & (day <= cfg.gifts_q1_end_day)),
+        "back_to_school_days": ((month == bts_start_month) & (day >= bts_start_day))
+        | ((month == bts_end_month) & (day <= bts_end_day)),
+        "summer_days": np.isin(month, cfg.summer_months),
+        "salary_window_days": (day >= cfg.salary_window[0]) | (day <= cfg.salary_window[1]),
+        "social_benefits_days": (day >= cfg.social_benefits_window[0]) & (day <= cfg.social_benefits_window[1]),
+    }
+
+
+def _digest_compress(
+    owner: np.ndarray, means: np.ndarray, weights: np.ndarray, n_owners: int, compression: float
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """One merging pass of a t-digest for many owners at once.
+
+    Input is sorted by (owner, mean). Centroids whose midpoint falls into the
+    same unit of the k1 scale ``delta / (2 pi) * asin(2q - 1)`` are merged, so
+    clusters stay small in the tails and exact for short histories.
+    """
+
+    if not len(owner):
+        return owner, means, weights
+    totals = np.bincount(owner, weights, minlength=n_owners)
+    before = np.r_[0.0, np.cumsum(totals)][:-1]
+    mid = (np.cumsum(weights) - weights / 2 - before[owner]) / totals[owner]
+    bucket = np.floor(compression / (2 * np.pi) * np.arcsin(np.clip(2 * mid - 1, -1, 1))).astype(np.int64)
+    new_cluster = np.r_[True, (owner[1:] != owner[:-1]) | (bucket[1:] != bucket[:-1])]
+    starts = np.flatnonzero(new_cluster)
+    merged_weights = np.add.reduceat(weights, starts)
+    merged_means = np.add.reduceat(means * weights, starts) / merged_weights
+    return owner[starts], merged_means, merged_weights
+
+
+def _digest_quantiles(
+    owner: np.ndarray, means: np.ndarray, weights: np.ndarray, n_owners: int, qs: Sequence[float]
+) -> np.ndarray:
+    """[n_owners, len(qs)] quantiles interpolated between centroid midpoints (NaN for empty owners)."""
+
+    out = np.full((n_owners, len(qs)), np.nan)
+    if not len(owner):
+        return out
+    counts = np.bincount(owner, minlength=n_owners)
+    first = np.r_[0, np.cumsum(counts)][:-1]
+    last = first + counts - 1
+    totals = np.bincount(owner, weights, minlength=n_owners)
+    before = np.r_[0.0, np.cumsum(totals)][:-1]
+    # owner + position of the centroid midpoint in [0, 1): increasing over the whole array
+    key = owner + (np.cumsum(weights) - weights / 2 - before[owner]) / totals[owner]
+    present = np.flatnonzero(counts)
+    for k, q in enumerate(qs):
+        right = np.searchsorted(key, present + q)
+        lo, hi = first[present], last[present]
+        left = np.clip(right - 1, lo, hi)
+        right = np.clip(right, lo, hi)
+        span = key[right] - key[left]
+        frac = np.where(span > 0, (present + q - key[left]) / np.where(span > 0, span, 1), 0.0)
+        out[present, k] = means[left] + np.clip(frac, 0, 1) * (means[right] - means[left])
+    return out
+
+
+def _flag_days(flag: str) -> str:
+    return flag.replace("_related", "") + "_days"  # auto_related -> auto_days
+
+
+def _flag_share(flag: str) -> str:
+    return flag.replace("_related", "") + "_day_share"  # notebooks' auto_day_share / home_day_share
+
+
+def _quantile_column(q: float) -> str:
+    return f"daily_amount_q{round(q * 100):02d}"
+
+
+class FeatureStore:
+    """Per-user feature state in a directory, updated shard by shard."""
+
+    USERS_FILE = "users.parquet"
+    CATEGORIES_FILE = "categories.parquet"
+    PENDING_FILE = "pending.parquet"
+    STATE_FILE = "state.json"
+
+    def __init__(self, path: Union[str, Path], cfg: Optional[FeatureConfig] = None):
+        self.path = Path(path)
+        state_path = self.path / self.STATE_FILE
+        self.state = json.loads(state_path.read_text(encoding="utf-8")) if state_path.exists() else {}
+        if cfg is None:
+            saved = self.state.get("config", {})
+            cfg = FeatureConfig(**{k: tuple(v) if isinstance(v, list) else v for k, v in saved.items()})
+            cfg.exclude_actions = set(cfg.exclude_actions)
+        self.cfg = cfg
+        self.flagger = KeywordFlagger(dict(cfg.flag_rules), cfg.flag_columns) if cfg.flag_rules else None
+        self.flags = self.flagger.names if self.flagger is not None else []
+        self._reset_base(self._read(self.USERS_FILE), self._read(self.CATEGORIES_FILE))
+        self.pending = self._read(self.PENDING_FILE) or _group_schema(self.flags).empty_table()
+        self.sources: List[str] = list(self.state.get("sources", []))
+        # bit i of a user's folded_days is day_epoch + i; set on the first fold
+        self.day_epoch: Optional[int] = self.state.get("day_epoch")
+
+    def _read(self, name: str) -> Optional[pa.Table]:
+        path = self.path / name
+        return pq.read_table(path) if path.exists() else None
+
+    def _reset_base(self, users: Optional[pa.Table], categories: Optional[pa.Table]) -> None:
+        """Saved tables become the sorted base; folds since then live in small delta tables."""
+
+        self._base_users = users.combine_chunks() if users is not None else None
+        self._base_categories = categories.combine_chunks() if categories is not None else None
+        self._user_keys = _utf8_array(users["user_id"])[0] if users is not None else None
+        self._category_keys = _utf8_array(categories["user_id"])[0] if categories is not None else None
+        self._delta_users: Optional[pa.Table] = None
+        self._delta_categories: Optional[pa.Table] = None
+        self._users, self._categories = self._base_users, self._base_categories
+
+    @property
+    def users(self) -> Optional[pa.Table]:
+        """State of all users sorted by user_id (the base with the delta laid over it)."""
+
+        if self._users is None:
+            self._users = _overlay(self._base_users, self._delta_users, self._normalize_users, ["user_id"])
+        return self._users
+
+    @property
+    def categories(self) -> Optional[pa.Table]:
+        if self._categories is None:
+            delta = self._delta_categories
+            self._categories = _overlay(
+                self._base_categories, delta, lambda t: t.select(delta.schema.names).cast(delta.schema), ["user_id", "category"]
+            )
+        return self._categories
+
+    def _state_schema(self) -> pa.Schema:
+        fields = [("user_id", pa.string())]
+        for name in _SUM_COLUMNS + [_flag_days(flag) for flag in self.flags]:
+            fields.append((name, pa.float64() if name == "total_amount" else pa.int64()))
+        fields += [
+            ("max_amount", pa.float64()),
+            ("first_day", pa.date32()),
+            ("last_day", pa.date32()),
+            ("digest_means", pa.list_(pa.float64())),
+            ("digest_weights", pa.list_(pa.float64())),
+            ("top_category", pa.string()),
+            *((_quantile_column(q), pa.float64()) for q in self.cfg.quantiles),
+            ("folded_days", pa.binary()),
+        ]
+        return pa.schema(fields)
+
+    def _normalize_users(self, table: pa.Table) -> pa.Table:
+        """State columns only; columns added by newer configs start at 0 (numbers) or null."""
+
+        columns = []
+        for f in self._state_schema():
+            if f.name in table.column_names:
+                columns.append(table[f.name].cast(f.type))
+            elif pa.types.is_integer(f.type) or pa.types.is_floating(f.type):
+                columns.append(pa.array(np.zeros(table.num_rows), f.type))
+            else:
+                columns.append(pa.nulls(table.num_rows, f.type))
+        return pa.table(columns, schema=self._state_schema())
+
+    # ingest
+
+    def ingest(self, batches: Iterable[pa.RecordBatch], source: Optional[str] = None) -> Dict[str, int]:
+        """Fold one shard's batches in; days before the latest one seen are closed."""
+
+        if source is not None and source in self.sources:
+            return {"events": 0, "folded_days": 0, "users": 0, "late_events": 0, "skipped": 1}
+        groups, events = [], 0
+        for batch in batches:
+            grouped = daily_category_groups(batch, self.cfg, self.flagger)
+            if grouped is not None:
+                groups.append(grouped)
+                events += int(pc.sum(grouped["events"]).as_py())
+        pending = _merge_groups([self.pending, *groups], self.flags)
+        stats = {"events": events, "folded_days": 0, "users": 0, "late_events": 0, "skipped": 0}
+        if pending.num_rows:
+            latest = pc.max(pending["day"]).as_py()
+            is_open = pc.equal(pending["day"], latest)
+            stats.update(self._fold(pending.filter(pc.invert(is_open))))
+            pending = pending.filter(is_open)
+        self.pending = pending
+        if source is not None:
+            self.sources.append(source)
+        return stats
+
+    def flush(self) -> Dict[str, int]:
+        """Close the pending day too (end of the data or before reading features)."""
+
+        stats = self._fold(self.pending)
+        self.pending = _group_schema(self.flags).empty_table()
+        return stats
+
+    def _fold(self, groups: pa.Table) -> Dict[str, int]:
+        if not groups.num_rows:
+            return {"folded_days": 0, "users": 0, "late_events": 0}
+        cfg = self.cfg
+        daily = groups.group_by(["user_id", "day"]).aggregate(
+            [("amount", "sum"), ("events", "sum"), ("category", "count"), *((name, "any") for name in self.flags)]
+        )
+        daily = daily.sort_by([("user_id", "ascending"), ("day", "ascending")])
+        users = daily["user_id"].combine_chunks()
+        day = daily["day"].to_numpy().astype(np.int64)
+        amount = daily["amount_sum"].to_numpy()
+        n = len(day)
+        starts = np.flatnonzero(np.r_[True, pc.not_equal(users[1:], users[:-1]).to_numpy(zero_copy_only=False)])
+        ends = np.r_[starts[1:], n]
+        touched = users.take(pa.array(starts))
+        # a day before the epoch (backfill, a new user's early history) moves the epoch back
+        # instead of being rejected: every bitmap gets whole zero bytes in front
+        if self.day_epoch is None:
+            self.day_epoch = int(day.min())
+        elif day.min() < self.day_epoch:
+            self._rebase(-(-(self.day_epoch - int(day.min())) // 8))
+        old = self._old_users(touched)
+        day_owner = np.repeat(np.arange(len(starts)), np.diff(np.r_[starts, n]))
+
+        # a (user, day) already folded comes back only from a late or overlapping shard: it is
+        # rejected, since its daily amount is already in the digest, max and day counters
+        bit = day - self.day_epoch
+        sizes = pc.fill_null(pc.binary_length(old["folded_days"]), 0).to_numpy(zero_copy_only=False)
+        width = max(int(sizes.max()) if len(sizes) else 0, int(bit.max()) // 8 + 1, 1)
+        folded = _bitmap_matrix(old["folded_days"], width)
+        late = ((folded[day_owner, bit >> 3] >> (bit & 7)) & 1) == 1
+        if late.any():
+            late_events = int(daily["events_sum"].to_numpy()[late].sum())
+            late_keys = _user_day_keys(daily.filter(pa.array(late)))
+            stats = self._fold(groups.filter(pc.invert(pc.is_in(_user_day_keys(groups), value_set=late_keys))))
+            stats["late_events"] += late_events
+            return stats
+        np.bitwise_or.at(folded, (day_owner, bit >> 3), (1 << (bit & 7)).astype(np.uint8))
+
+        new = {
+            "days": np.diff(np.r_[starts, n]),
+            "total_amount": np.add.reduceat(amount, starts),
+            "total_events": np.add.reduceat(daily["events_sum"].to_numpy(), starts),
+            "category_days": np.add.reduceat(daily["category_count"].to_numpy(), starts),
+            "max_amount": np.maximum.reduceat(amount, starts),
+            "first_day": day[starts],
+            "last_day": day[ends - 1],
+        }
+        for name, flag in calendar_flags(day, cfg).items():
+            new[name] = np.add.reduceat(flag.astype(np.int64), starts)
+        for name in self.flags:
+            flagged = daily[f"{name}_any"].to_numpy(zero_copy_only=False).astype(np.int64)
+            new[_flag_days(name)] = np.add.reduceat(flagged, starts)
+
+        # t-digests: only touched users' centroids are read back, merged with the new days and recompressed
+        lengths = pc.fill_null(pc.list_value_length(old["digest_means"]), 0).to_numpy(zero_copy_only=False)
+        owner = np.repeat(np.arange(len(starts)), lengths)
+        means = pc.list_flatten(old["digest_means"]).to_numpy()
+        weights = pc.list_flatten(old["digest_weights"]).to_numpy()
+        threshold = _digest_quantiles(owner, means, weights, len(starts), [cfg.high_spend_quantile])[:, 0]
+        owner = np.concatenate([owner, day_owner])
+        means = np.concatenate([means, amount])
+        weights = np.concatenate([weights, np.ones(n)])
+        order = np.lexsort((means, owner))
+        owner, means, weights = _digest_compress(owner[order], means[order], weights[order], len(starts), cfg.digest_compression)
+        quantiles = _digest_quantiles(owner, means, weights, len(starts), [*cfg.quantiles, cfg.high_spend_quantile])
+        # users without history compare their first days with the threshold of those days themselves
+        threshold = np.where(np.isnan(threshold), quantiles[:, -1], threshold)
+        new["high_spend_days"] = np.add.reduceat((amount >= threshold[day_owner]).astype(np.int64), starts)
+        offsets = pa.array(np.r_[0, np.cumsum(np.bincount(owner, minlength=len(starts)))].astype(np.int32))
+        means = pa.ListArray.from_arrays(offsets, pa.array(means))
+        weights = pa.ListArray.from_arrays(offsets, pa.array(weights))
+        quantiles = quantiles[:, :-1]
+
+        categories = self._fold_categories(groups, touched)
+        new["top_category"] = _top_categories(categories, touched)
+        new["folded_days"] = _bitmap_array(folded)
+        rows = self._merged_users(touched, old, new, means, weights, quantiles)
+        self._delta_users = _replace_rows(self._delta_users, touched, rows)
+        self._users = None
+        return {"folded_days": n, "users": len(starts), "late_events": 0}
+
+    def _rebase(self, shift: int) -> None:
+        """Move ``day_epoch`` back by ``shift`` bytes (8 * shift days) in every saved and delta bitmap."""
+
+        self.day_epoch -= 8 * shift
+        for name in ("_base_users", "_delta_users"):
+            table = getattr(self, name)
+            if table is not None and "folded_days" in table.column_names:
+                i = table.schema.get_field_index("folded_days")
+                setattr(self, name, table.set_column(i, "folded_days", _prepend_zero_bytes(table["folded_days"], shift)))
+        self._users = None
+
+    def _old_users(self, touched: pa.Array) -> pa.Table:
+        """State rows aligned with ``touched``; null rows for users seen for the first time.
+
+        The delta is probed with a hash lookup, the base with a binary search
+        over its sorted keys, so the cost follows the touched users only.
+        """
+
+        schema = self._state_schema()
+        index = np.full(len(touched), -1, dtype=np.int64)
+        parts, found = [], 0
+        delta = self._delta_users
+        if delta is not None and delta.num_rows:
+            pos = _index_in(touched, delta["user_id"])
+            hit = np.flatnonzero(pos >= 0)
+            parts.append(delta.take(pa.array(pos[hit])))
+            index[hit] = np.arange(len(hit))
+            found = len(hit)
+        if self._base_users is not None and self._base_users.num_rows:
+            rest = np.flatnonzero(index < 0)
+            pos = _sorted_positions(self._user_keys, _utf8_array(touched.take(pa.array(rest)))[0])
+            hit = pos >= 0
+            parts.append(self._normalize_users(self._base_users.take(pa.array(pos[hit]))))
+            index[rest[hit]] = found + np.arange(int(hit.sum()))
+        if not parts or not (index >= 0).any():
+            return pa.table([pa.nulls(len(touched), f.type) for f in schema], schema=schema)
+        return pa.concat_tables(parts).take(pa.array(index, mask=index < 0))
+
+    def _fold_categories(self, groups: pa.Table, touched: pa.Array) -> pa.Table:
+        """Full (user, category) totals of the touched users; they replace those users' delta rows."""
+
+        names = ["user_id", "category", "amount", "events"]
+        new = groups.filter(pc.is_valid(groups["category"]))
+        new = new.group_by(["user_id", "category"]).aggregate([("amount", "sum"), ("events", "sum")]).rename_columns(names)
+        parts = [new]
+        covered = np.zeros(len(touched), dtype=bool)
+        delta = self._delta_categories
+        if delta is not None and delta.num_rows:
+            parts.append(delta.filter(pc.is_in(delta["user_id"], value_set=touched)))
+            covered = pc.is_in(touched, value_set=delta["user_id"]).to_numpy(zero_copy_only=False)
+        base = self._base_categories
+        if base is not None and base.num_rows:
+            keys = _utf8_array(touched.filter(pa.array(~covered)))[0]
+            lo, hi = _sorted_ranges(self._category_keys, keys)
+            counts = hi - lo
+            rows = np.repeat(lo - np.r_[0, np.cumsum(counts)][:-1], counts) + np.arange(counts.sum())
+            parts.append(base.take(pa.array(rows)).select(names))
+        schema = new.schema
+        merged = pa.concat_tables([part.cast(schema) for part in parts])
+        merged = merged.group_by(["user_id", "category"]).aggregate([("amount", "sum"), ("events", "sum")])
+        merged = merged.rename_columns(names).sort_by([("user_id", "ascending"), ("category", "ascending")])
+        self._delta_categories = _replace_rows(delta, touched, merged)
+        self._categories = None
+        return merged
+
+    def _merged_users(
+        self, touched: pa.Array, old: pa.Table, new: dict, means: pa.Array, weights: pa.Array, quantiles: np.ndarray
+    ) -> pa.Table:
+        """New state rows of the touched users: old counters combined with the folded days."""
+
+        def merged(name: str, combine, fill):
+            values = old[name]
+            if pa.types.is_date(values.type):
+                values = pc.cast(values, pa.int32())
+            return combine(pc.fill_null(values, fill).to_numpy().astype(np.asarray(new[name]).dtype), new[name])
+
+        columns = {"user_id": touched}
+        for name in _SUM_COLUMNS + [_flag_days(flag) for flag in self.flags]:
+            columns[name] = merged(name, np.add, 0)
+        columns["max_amount"] = merged("max_amount", np.maximum, 0.0)
+        first = merged("first_day", np.minimum, np.iinfo(np.int32).max)
+        last = merged("last_day", np.maximum, np.iinfo(np.int32).min)
+        columns["first_day"] = pa.array(first.astype(np.int32), pa.date32())
+        columns["last_day"] = pa.array(last.astype(np.int32), pa.date32())
+        columns["digest_means"] = means
+        columns["digest_weights"] = weights
+        columns["top_category"] = new["top_category"].cast(pa.string())
+        for k, q in enumerate(self.cfg.quantiles):
+            columns[_quantile_column(q)] = quantiles[:, k]
+        columns["folded_days"] = new["folded_days"]
+        return pa.table(columns, schema=self._state_schema())
+
+    # read / persist
+
+    def features(self) -> pa.Table:
+        """Per-user feature table in the notebooks' naming (state columns dropped)."""
+
+        if self.users is None:
+            return pa.table({"user_id": pa.array([], pa.string())})
+        users = self.users
+        days = np.maximum(users["days"].to_numpy(), 1).astype(np.float64)
+        columns = {
+            "user_id": users["user_id"],
+            "first_day": users["first_day"],
+            "last_day": users["last_day"],
+            "days": users["days"],
+            "total_amount": users["total_amount"],
+            "mean_amount": users["total_amount"].to_numpy() / days,
+            "max_amount": users["max_amount"],
+            "mean_events": users["total_events"].to_numpy() / days,
+            "unique_categories_mean": users["category_days"].to_numpy() / days,
+            "high_spend_share": users["high_spend_days"].to_numpy() / days,
+        }
+        for q in self.cfg.quantiles:
+            columns[_quantile_column(q)] = users[_quantile_column(q)]
+        if 0.5 in self.cfg.quantiles:
+            columns["median_amount"] = users[_quantile_column(0.5)]
+        for flag, share in CALENDAR_FLAGS.items():
+            columns[share] = users[flag].to_numpy() / days
+        for flag in self.flags:
+            columns[_flag_share(flag)] = users[_flag_days(flag)].to_numpy() / days
+        columns["top_category"] = users["top_category"]
+        return pa.table(columns)
+
+    def save(self) -> None:
+        """Write all files to temporaries first, then swap them in (state.json last)."""
+
+        self.path.mkdir(parents=True, exist_ok=True)
+        outputs = {self.PENDING_FILE: self.pending}
+        if self.users is not None:
+            features = self.features()
+            derived = [name for name in features.column_names if name not in self.users.column_names]
+            outputs[self.USERS_FILE] = _hstack(self.users, features.select(derived))
+        if self.categories is not None:
+            outputs[self.CATEGORIES_FILE] = self.categories
+        for name, table in outputs.items():
+            pq.write_table(table, self.path / f"{name}.tmp")
+        for name in outputs:
+            (self.path / f"{name}.tmp").replace(self.path / name)
+
+        config = asdict(self.cfg)
+        config["exclude_actions"] = sorted(config["exclude_actions"])
+        state = {
+            "config": config,
+            "sources": self.sources,
+            "users": self.users.num_rows if self.users is not None else 0,
+            "day_epoch": self.day_epoch,
+        }
+        tmp = self.path / f"{self.STATE_FILE}.tmp"
+        tmp.write_text(json.dumps(state, ensure_ascii=False, indent=2), encoding="utf-8")
+        tmp.replace(self.path / self.STATE_FILE)
+        self.state = state
+        self._reset_base(outputs.get(self.USERS_FILE), outputs.get(self.CATEGORIES_FILE))
+
+
+def _hstack(left: pa.Table, right: pa.Table) -> pa.Table:
+    for name in right.column_names:
+        left = left.append_column(name, right[name])
+    return left
+
+
+def _overlay(base: Optional[pa.Table], delta: Optional[pa.Table], normalize, sort_keys: List[str]) -> Optional[pa.Table]:
+    """Base rows of users not in the delta plus the delta, sorted by ``sort_keys``."""
+
+    if delta is None:
+        return base
+    if base is not None and base.num_rows:
+        kept = base.filter(pc.invert(pc.is_in(base["user_id"], value_set=pc.unique(delta["user_id"]))))
+        delta = pa.concat_tables([normalize(kept), delta])
+    return delta.sort_by([(key, "ascending") for key in sort_keys])
+
+
+def _replace_rows(table: Optional[pa.Table], users: pa.Array, rows: pa.Table) -> pa.Table:
+    """``table`` without the rows of ``users``, plus ``rows``."""
+
+    if table is None or not table.num_rows:
+        return rows
+    kept = table.filter(pc.invert(pc.is_in(table["user_id"], value_set=users)))
+    return pa.concat_tables([kept, rows.cast(table.schema)])
+
+
+def _index_in(keys: pa.Array, values: pa.ChunkedArray) -> np.ndarray:
+    """Position of each key in ``values``, -1 if absent."""
+
+    pos = pc.index_in(keys, value_set=values).to_numpy(zero_copy_only=False)
+    return np.where(np.isnan(pos.astype(np.float64)), -1, pos).astype(np.int64)
+
+
+def _sorted_ranges(sorted_keys: np.ndarray, keys: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """[lo, hi) rows of each key in a sorted S-array (empty when absent)."""
+
+    lo = np.searchsorted(sorted_keys, keys, side="left")
+    hi = np.searchsorted(sorted_keys, keys, side="right")
+    # searchsorted casts to the array's width: a longer key could land on its prefix
+    if keys.dtype.itemsize > sorted_keys.dtype.itemsize:
+        too_long = np.char.str_len(keys) > sorted_keys.dtype.itemsize
+        hi[too_long] = lo[too_long]
+    return lo, hi
+
+
+def _sorted_positions(sorted_keys: np.ndarray, keys: np.ndarray) -> np.ndarray:
+    """Row of each key in a sorted array of unique S-keys, -1 if absent."""
+
+    lo, hi = _sorted_ranges(sorted_keys, keys)
+    return np.where(hi > lo, lo, -1)
+
+
+def _bitmap_matrix(values: Union[pa.Array, pa.ChunkedArray], width: int) -> np.ndarray:
+    """Binary column -> [n, width] uint8, zero padded (null rows are all zeros)."""
+
+    if isinstance(values, pa.ChunkedArray):
+        values = values.combine_chunks() if values.num_chunks else pa.array([], pa.binary())
+    column = pc.fill_null(values, b"").cast(pa.large_binary())
+    offsets = np.frombuffer(column.buffers()[1], dtype=np.int64)[column.offset:column.offset + len(column) + 1]
+    data = np.frombuffer(column.buffers()[2], dtype=np.uint8) if column.buffers()[2] is not None else np.empty(0, np.uint8)
+    sizes = np.diff(offsets)
+    out = np.zeros((len(column), width), dtype=np.uint8)
+    out[np.arange(width)[None, :] < sizes[:, None]] = data[offsets[0]:offsets[-1]]
+    return out
+
+
+def _prepend_zero_bytes(values: Union[pa.Array, pa.ChunkedArray], shift: int) -> pa.Array:
+    """Binary column with ``shift`` zero bytes in front of every non-empty row (nulls stay null)."""
+
+    if isinstance(values, pa.ChunkedArray):
+        values = values.combine_chunks() if values.num_chunks else pa.array([], pa.binary())
+    column = pc.fill_null(values, b"").cast(pa.large_binary())
+    offsets = np.frombuffer(column.buffers()[1], dtype=np.int64)[column.offset:column.offset + len(column) + 1]
+    data = np.frombuffer(column.buffers()[2], dtype=np.uint8) if column.buffers()[2] is not None else np.empty(0, np.uint8)
+    sizes = np.diff(offsets)
+    grown = np.where(sizes > 0, sizes + shift, 0)
+    new_offsets = np.r_[0, np.cumsum(grown)].astype(np.int64)
+    out = np.zeros(int(new_offsets[-1]), dtype=np.uint8)
+    row = np.repeat(np.arange(len(sizes)), sizes)
+    out[np.arange(int(sizes.sum())) - (offsets[:-1] - offsets[0])[row] + new_offsets[:-1][row] + shift] = data[offsets[0]:offsets[-1]]
+    shifted = pa.Array.from_buffers(
+        pa.large_binary(), len(sizes), [None, pa.py_buffer(new_offsets.tobytes()), pa.py_buffer(out.tobytes())]
+    ).cast(pa.binary())
+    return pc.if_else(values.is_null(), pa.scalar(None, pa.binary()), shifted)
+
+
+def _bitmap_array(matrix: np.ndarray) -> pa.Array:
+    """[n, width] uint8 -> binary column of fixed-length rows, built from buffers."""
+
+    n, width = matrix.shape
+    offsets = (np.arange(n + 1) * width).astype(np.int32)
+    data = np.ascontiguousarray(matrix).tobytes()
+    return pa.Array.from_buffers(pa.binary(), n, [None, pa.py_buffer(offsets.tobytes()), pa.py_buffer(data)])
+
+
+def _user_day_keys(table: pa.Table) -> pa.ChunkedArray:
+    return pc.binary_join_element_wise(table["user_id"], pc.cast(table["day"], pa.string()), "\x1f")
+
+
+def _top_categories(categories: pa.Table, touched: pa.Array) -> pa.Array:
+    """Category with the largest amount (then events) per touched user."""
+
+    cats = categories.sort_by([("user_id", "ascending"), ("amount", "descending"), ("events", "descending")])
+    if not cats.num_rows:
+        return pa.nulls(len(touched), pa.string())
+    users = cats["user_id"].combine_chunks()
+    first = np.flatnonzero(np.r_[True, pc.not_equal(users[1:], users[:-1]).to_numpy(zero_copy_only=False)])
+    best = cats.take(pa.array(first))
+    pos = pc.index_in(touched, value_set=best["user_id"])
+    return pc.take(best["category"].combine_chunks(), pos)
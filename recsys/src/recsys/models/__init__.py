@@ -1,26 +1,39 @@
 from .data_pipeline import (
     TECDStreamConfig,
     SequenceConfig,
+    SequenceArrays,
     stream_filtered_rows,
+    stream_filtered_batches,
     build_sequences,
+    build_sequence_arrays,
 )
+from .vocab import Vocabulary
 
 try:
-    from .baseline import NextActionGRU, ModelConfig, Vocabulary, collate_sequences
+    from .baseline import NextActionGRU, ModelConfig, collate_sequences
+    from .dataset import SequenceDataset, LengthBucketSampler, make_loader
 except ImportError:
     # Torch may be absent in minimal setups; data pipeline remains usable.
     NextActionGRU = None
     ModelConfig = None
-    Vocabulary = None
     collate_sequences = None
+    SequenceDataset = None
+    LengthBucketSampler = None
+    make_loader = None
 
 __all__ = [
     "TECDStreamConfig",
     "SequenceConfig",
+    "SequenceArrays",
     "stream_filtered_rows",
+    "stream_filtered_batches",
     "build_sequences",
+    "build_sequence_arrays",
     "NextActionGRU",
     "ModelConfig",
     "Vocabulary",
     "collate_sequences",
+    "SequenceDataset",
+    "LengthBucketSampler",
+    "make_loader",
 ]
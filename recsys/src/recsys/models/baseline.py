@@ -2,44 +2,13 @@
 from __future__ import annotations
 
 from dataclasses import dataclass
-from typing import Iterable, List, Optional
+from typing import List, Optional
 
+import numpy as np
 import torch
 import torch.nn as nn
 
-
-class Vocabulary:
-    """Token-to-id helper that keeps pad/unk stable."""
-
-    def __init__(self, pad_token: str = "<pad>", unk_token: str = "<unk>"):
-        self.pad_token = pad_token
-        self.unk_token = unk_token
-        self.token_to_id = {pad_token: 0, unk_token: 1}
-        self.id_to_token = [pad_token, unk_token]
-        self.pad_id = 0
-        self.unk_id = 1
-
-    def add(self, token: Optional[str]) -> int:
-        if token is None:
-            return self.unk_id
-        if token in self.token_to_id:
-            return self.token_to_id[token]
-        idx = len(self.id_to_token)
-        self.token_to_id[token] = idx
-        self.id_to_token.append(token)
-        return idx
-
-    def encode(self, tokens: Iterable[Optional[str]], grow: bool = True) -> List[int]:
-        ids = []
-        for tok in tokens:
-            if grow:
-                ids.append(self.add(tok))
-            else:
-                ids.append(self.token_to_id.get(tok, self.unk_id))
-        return ids
-
-    def __len__(self) -> int:
-        return len(self.id_to_token)
+from .vocab import Vocabulary
 
 
 @dataclass
@@ -92,11 +61,21 @@ class NextActionGRU(nn.Module):
     ):
         """action_ids/product_ids: [B, T], seasonal_feats: [B, T, 4]."""
 
-        emb = [self.action_emb(action_ids), self.seasonal_proj(seasonal_feats)]
-        if self.product_emb is not None and product_ids is not None:
-            emb.append(self.product_emb(product_ids))
+        h_last = self.encode(action_ids, seasonal_feats, product_ids, lengths)
+        action_logits = self.action_head(h_last)
+        product_logits = self.product_head(h_last) if self.product_head else None
+        return action_logits, product_logits
+
+    def encode(
+        self,
+        action_ids: torch.Tensor,
+        seasonal_feats: torch.Tensor,
+        product_ids: Optional[torch.Tensor] = None,
+        lengths: Optional[torch.Tensor] = None,
+    ) -> torch.Tensor:
+        """Last-layer hidden state [B, H]; the heads (or a retrieval index) score it."""
 
-        x = torch.cat(emb, dim=-1)
+        x = self.embed(action_ids, seasonal_feats, product_ids)
 
         if lengths is not None:
             packed = nn.utils.rnn.pack_padded_sequence(
@@ -105,11 +84,46 @@ class NextActionGRU(nn.Module):
             _, h = self.gru(packed)
         else:
             _, h = self.gru(x)
+        return h[-1]
+
+    def embed(
+        self,
+        action_ids: torch.Tensor,
+        seasonal_feats: torch.Tensor,
+        product_ids: Optional[torch.Tensor] = None,
+    ) -> torch.Tensor:
+        """GRU inputs for ids of any leading shape ([B, T] or [B])."""
+
+        emb = [self.action_emb(action_ids), self.seasonal_proj(seasonal_feats)]
+        if self.product_emb is not None:
+            if product_ids is None:
+                product_ids = torch.zeros_like(action_ids)
+            emb.append(self.product_emb(product_ids))
+        return torch.cat(emb, dim=-1)
+
+    def init_hidden(self, batch_size: int) -> torch.Tensor:
+        return torch.zeros(self.cfg.num_layers, batch_size, self.cfg.d_model)
 
-        h_last = h[-1]
+    def step(
+        self,
+        action_ids: torch.Tensor,
+        seasonal_feats: torch.Tensor,
+        product_ids: Optional[torch.Tensor] = None,
+        hidden: Optional[torch.Tensor] = None,
+    ):
+        """Advance the GRU by one event per row: O(1) instead of re-running history.
+
+        action_ids/product_ids: [B], seasonal_feats: [B, 4], hidden: [L, B, H].
+        Returns (action_logits, product_logits, new_hidden); feeding a history
+        event by event from a zero hidden state matches ``forward``.
+        """
+
+        x = self.embed(action_ids, seasonal_feats, product_ids).unsqueeze(1)
+        _, hidden = self.gru(x, hidden)
+        h_last = hidden[-1]
         action_logits = self.action_head(h_last)
         product_logits = self.product_head(h_last) if self.product_head else None
-        return action_logits, product_logits
+        return action_logits, product_logits, hidden
 
 
 def collate_sequences(
@@ -119,76 +133,68 @@ def collate_sequences(
     device: Optional[torch.device] = None,
     grow_vocabs: bool = True,
 ):
-    """Pad a list of sequence dicts from data_pipeline.build_sequences."""
+    """Pad a list of sequence dicts from data_pipeline.build_sequences.
 
-    max_len = max(len(sample["history_actions"]) for sample in batch)
-    batch_size = len(batch)
+    Tokens of the whole batch are encoded with one encode_batch call per
+    vocabulary (history followed by target, per sample, so growing
+    vocabularies assign ids in the same order as before) and scattered into
+    the padded arrays through a length mask.
+    """
 
-    action_hist = torch.full(
-        (batch_size, max_len),
-        action_vocab.pad_id,
-        dtype=torch.long,
-    )
-    seasonal = torch.zeros((batch_size, max_len, 4), dtype=torch.float)
+    batch_size = len(batch)
+    lengths = np.fromiter((len(sample["history_actions"]) for sample in batch), dtype=np.int64, count=batch_size)
+    max_len = int(lengths.max()) if batch_size else 0
+    mask = np.arange(max_len)[None, :] < lengths[:, None]
+    # index of each sample's target inside the flat [history..., target] token list
+    target_pos = np.cumsum(lengths + 1) - 1
+
+    flat_actions = []
+    for sample in batch:
+        flat_actions.extend(sample["history_actions"])
+        flat_actions.append(sample["target_action"])
+    action_ids = action_vocab.encode_batch(flat_actions, grow=grow_vocabs)
+    is_target = np.zeros(len(action_ids), dtype=bool)
+    is_target[target_pos] = True
+
+    action_hist = np.full((batch_size, max_len), action_vocab.pad_id, dtype=np.int64)
+    action_hist[mask] = action_ids[~is_target]
+    target_actions = action_ids[target_pos]
+
+    seasonal = np.zeros((batch_size, max_len, 4), dtype=np.float32)
+    has_seasonal = np.fromiter((bool(sample.get("history_seasonal")) for sample in batch), dtype=bool, count=batch_size)
+    if has_seasonal.any():
+        flat_seasonal = [feats for sample in batch if sample.get("history_seasonal") for feats in sample["history_seasonal"]]
+        seasonal[mask & has_seasonal[:, None]] = np.asarray(flat_seasonal, dtype=np.float32).reshape(-1, 4)
 
     product_hist = None
-    if product_vocab is not None:
-        product_hist = torch.full(
-            (batch_size, max_len),
-            product_vocab.pad_id,
-            dtype=torch.long,
-        )
-
-    target_actions = torch.empty(batch_size, dtype=torch.long)
     target_products = None
     if product_vocab is not None:
-        target_products = torch.empty(batch_size, dtype=torch.long)
-
-    lengths = []
-
-    for i, sample in enumerate(batch):
-        actions = sample["history_actions"]
-        action_ids = action_vocab.encode(actions, grow=grow_vocabs)
-        target_actions[i] = (
-            action_vocab.add(sample["target_action"])
-            if grow_vocabs
-            else action_vocab.token_to_id.get(sample["target_action"], action_vocab.unk_id)
+        product_hist = np.full((batch_size, max_len), product_vocab.pad_id, dtype=np.int64)
+        target_products = np.full(batch_size, product_vocab.unk_id, dtype=np.int64)
+        has_products = np.fromiter(
+            (sample.get("history_products") is not None for sample in batch), dtype=bool, count=batch_size
         )
-
-        seasonal_feats = sample.get("history_seasonal") or []
-        seq_len = len(action_ids)
-        lengths.append(seq_len)
-
-        action_hist[i, :seq_len] = torch.tensor(action_ids, dtype=torch.long)
-        if seasonal_feats:
-            seasonal[i, :seq_len, :] = torch.tensor(seasonal_feats, dtype=torch.float)
-
-        if product_vocab is not None and sample.get("history_products") is not None:
-            prod_ids = product_vocab.encode(sample["history_products"], grow=grow_vocabs)
-            product_hist[i, :seq_len] = torch.tensor(prod_ids, dtype=torch.long)
-            target_products[i] = (
-                product_vocab.add(sample["target_product"])
-                if grow_vocabs
-                else product_vocab.token_to_id.get(sample["target_product"], product_vocab.unk_id)
-            )
-
-    lengths_t = torch.tensor(lengths, dtype=torch.long)
-
-    if device:
-        action_hist = action_hist.to(device)
-        seasonal = seasonal.to(device)
-        target_actions = target_actions.to(device)
-        lengths_t = lengths_t.to(device)
-        if product_hist is not None:
-            product_hist = product_hist.to(device)
-        if target_products is not None:
-            target_products = target_products.to(device)
-
-    return {
-        "action_hist": action_hist,
-        "product_hist": product_hist,
-        "seasonal": seasonal,
-        "lengths": lengths_t,
-        "target_actions": target_actions,
-        "target_products": target_products,
+        if has_products.any():
+            flat_products = []
+            for sample in batch:
+                if sample.get("history_products") is not None:
+                    flat_products.extend(sample["history_products"])
+                    flat_products.append(sample["target_product"])
+            product_ids = product_vocab.encode_batch(flat_products, grow=grow_vocabs)
+            product_target_pos = np.cumsum(lengths[has_products] + 1) - 1
+            is_target = np.zeros(len(product_ids), dtype=bool)
+            is_target[product_target_pos] = True
+            product_hist[mask & has_products[:, None]] = product_ids[~is_target]
+            target_products[has_products] = product_ids[product_target_pos]
+
+    out = {
+        "action_hist": torch.from_numpy(action_hist),
+        "product_hist": torch.from_numpy(product_hist) if product_hist is not None else None,
+        "seasonal": torch.from_numpy(seasonal),
+        "lengths": torch.from_numpy(lengths),
+        "target_actions": torch.from_numpy(target_actions),
+        "target_products": torch.from_numpy(target_products) if target_products is not None else None,
     }
+    if device:
+        out = {key: value.to(device) if value is not None else None for key, value in out.items()}
+    return out
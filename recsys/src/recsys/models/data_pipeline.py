@@ -9,8 +9,13 @@ from collections import defaultdict, deque
 from dataclasses import dataclass, field
 from datetime import datetime, timedelta
 from typing import Any, Deque, Dict, Iterable, Iterator, List, Optional, Set
+import glob
 import math
 
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as pads
 from datasets import load_dataset
 
 
@@ -24,7 +29,7 @@ class TECDStreamConfig:
     domain_value: Optional[str] = None  # attach domain if not present in rows
     domains: Optional[Set[str]] = None
     exclude_actions: Set[str] = field(default_factory=lambda: {"VIEW", "view"})
-    max_days: int = 100
+    max_days: Optional[int] = 100  # None: no cut-off
     date_key: str = "date"
     timestamp_key: str = "timestamp"
     domain_key: str = "domain"
@@ -33,6 +38,9 @@ class TECDStreamConfig:
     product_key: str = "product_id"
     keep_fields: Optional[Set[str]] = None
     auth_token: Optional[str] = None
+    columnar: bool = False  # read parquet record batches via pyarrow instead of HF rows
+    batch_size: int = 65_536
+    until_day: Optional[str] = None  # columnar: keep rows with day <= this (global cut-off)
 
 
 @dataclass
@@ -44,9 +52,69 @@ class SequenceConfig:
     drop_until_history: bool = True  # skip yielding until we have history
 
 
+@dataclass
+class SequenceArrays:
+    """Next-action examples in flat NumPy form, sorted by user and time.
+
+    Events live once in ``actions``/``products``/``seasonal``; example ``i``
+    predicts event ``target_index[i]`` from the ``lengths[i]`` events right
+    before it. ``batch`` gathers right-padded windows for any set of examples.
+    Ids follow Vocabulary conventions: 0 = pad, 1 = unk, tokens start at 2.
+    """
+
+    actions: np.ndarray  # int32 [E]
+    products: Optional[np.ndarray]  # int32 [E]
+    seasonal: np.ndarray  # float32 [E, 4]
+    timestamps: np.ndarray  # datetime64[us] [E]
+    event_users: np.ndarray  # int32 [E], index into user_tokens
+    target_index: np.ndarray  # int64 [N]
+    lengths: np.ndarray  # int32 [N]
+    max_history: int
+    action_tokens: np.ndarray
+    product_tokens: Optional[np.ndarray]
+    user_tokens: np.ndarray
+
+    def __len__(self) -> int:
+        return len(self.target_index)
+
+    def batch(self, index: Any = slice(None)) -> Dict[str, Optional[np.ndarray]]:
+        """Padded arrays for the selected examples (slice or integer array)."""
+
+        targets = self.target_index[index]
+        lengths = self.lengths[index]
+        steps = np.arange(self.max_history)
+        gather = (targets - lengths)[:, None] + steps[None, :]
+        valid = steps[None, :] < lengths[:, None]
+        gather = np.where(valid, gather, 0)
+
+        history_actions = np.where(valid, self.actions[gather], 0).astype(np.int32)
+        history_seasonal = self.seasonal[gather] * valid[:, :, None]
+        history_products = None
+        target_product = None
+        if self.products is not None:
+            history_products = np.where(valid, self.products[gather], 0).astype(np.int32)
+            target_product = self.products[targets]
+
+        return {
+            "user_index": self.event_users[targets],
+            "history_actions": history_actions,
+            "history_products": history_products,
+            "history_seasonal": history_seasonal.astype(np.float32, copy=False),
+            "lengths": lengths,
+            "target_action": self.actions[targets],
+            "target_product": target_product,
+            "timestamp": self.timestamps[targets],
+        }
+
+
 def stream_filtered_rows(cfg: TECDStreamConfig) -> Iterator[Dict[str, Any]]:
     """Stream rows from HF while filtering by domain/action and stopping after N days."""
 
+    if cfg.columnar:
+        for batch in stream_filtered_batches(cfg):
+            yield from batch.to_pylist()
+        return
+
     if cfg.data_files:
         ds_dict = load_dataset(
             "parquet",
@@ -73,7 +141,7 @@ def stream_filtered_rows(cfg: TECDStreamConfig) -> Iterator[Dict[str, Any]]:
             continue
 
         day = _extract_day(row, cfg)
-        if day:
+        if day and cfg.max_days is not None:
             seen_days.add(day)
             if len(seen_days) > cfg.max_days:
                 break
@@ -84,6 +152,169 @@ def stream_filtered_rows(cfg: TECDStreamConfig) -> Iterator[Dict[str, Any]]:
         yield row
 
 
+def stream_filtered_batches(cfg: TECDStreamConfig) -> Iterator[pa.RecordBatch]:
+    """Columnar counterpart of stream_filtered_rows over parquet record batches.
+
+    Domain/action filters are pushed down into the pyarrow scanner, only the
+    columns needed for filtering and ``keep_fields`` are read, and the max_days
+    cut-off is applied per batch with vectorized kernels. Works with local
+    paths/globs and hf:// patterns in ``cfg.data_files``.
+    """
+
+    dataset = _open_parquet_dataset(cfg)
+    schema = dataset.schema
+    names = set(schema.names)
+
+    if cfg.domain_key not in names and cfg.domains:
+        if cfg.domain_value not in cfg.domains:
+            return
+
+    read_columns = list(schema.names)
+    if cfg.keep_fields:
+        needed = set(cfg.keep_fields) | {cfg.domain_key, cfg.action_key, cfg.date_key, cfg.timestamp_key}
+        read_columns = [name for name in schema.names if name in needed]
+
+    scanner = dataset.scanner(
+        columns=read_columns,
+        filter=_filter_expression(cfg, names),
+        batch_size=cfg.batch_size,
+    )
+
+    seen_days: Set[str] = set()
+    for batch in scanner.to_batches():
+        if batch.num_rows == 0:
+            continue
+        batch = _fill_domain(batch, cfg)
+
+        stop = False
+        days = extract_batch_days(batch, cfg)
+        if days is not None and cfg.until_day is not None:
+            keep = pc.fill_null(pc.less_equal(days, cfg.until_day), True)
+            batch, days = batch.filter(keep), days.filter(keep)
+        if days is not None and cfg.max_days is not None:
+            for day in pc.unique(days).to_pylist():
+                if day is None or day in seen_days:
+                    continue
+                seen_days.add(day)
+                if len(seen_days) > cfg.max_days:
+                    batch = batch.slice(0, pc.index(days, day).as_py())
+                    stop = True
+                    break
+
+        if cfg.keep_fields:
+            batch = _project(batch, cfg.keep_fields)
+        if batch.num_rows:
+            yield batch
+        if stop:
+            return
+
+
+def _open_parquet_dataset(cfg: TECDStreamConfig) -> pads.Dataset:
+    """Resolve local globs or hf:// patterns from cfg.data_files into a parquet dataset."""
+
+    if not cfg.data_files:
+        raise ValueError("columnar mode needs data_files (local paths/globs or hf:// patterns)")
+
+    remote = [path.startswith("hf://") for path in cfg.data_files]
+    if any(remote) and not all(remote):
+        raise ValueError("data_files must be either all local or all hf:// paths")
+
+    if all(remote):
+        import pyarrow.fs as pafs
+        from huggingface_hub import HfFileSystem
+
+        fs = HfFileSystem(token=cfg.auth_token)
+        paths: List[str] = []
+        for pattern in cfg.data_files:
+            paths.extend(sorted(fs.glob(pattern[len("hf://"):])))
+        filesystem = pafs.PyFileSystem(pafs.FSSpecHandler(fs))
+    else:
+        paths = []
+        for pattern in cfg.data_files:
+            matches = sorted(glob.glob(pattern, recursive=True))
+            paths.extend(matches or [pattern])
+        filesystem = None
+
+    return pads.dataset(paths, format="parquet", filesystem=filesystem)
+
+
+def _filter_expression(cfg: TECDStreamConfig, names: Set[str]) -> Optional[pc.Expression]:
+    """Scanner predicate equivalent to the row-path domain/action checks."""
+
+    expr = None
+    if cfg.domains and cfg.domain_key in names:
+        domain = pc.field(cfg.domain_key)
+        cond = domain.isin(list(cfg.domains))
+        if cfg.domain_value in cfg.domains:
+            # rows without domain get domain_value attached before the check
+            cond = cond | domain.is_null()
+        expr = cond
+
+    if cfg.exclude_actions and cfg.action_key in names:
+        action = pc.field(cfg.action_key)
+        cond = ~action.isin(list(cfg.exclude_actions)) | action.is_null()
+        expr = cond if expr is None else expr & cond
+
+    return expr
+
+
+def _fill_domain(batch: pa.RecordBatch, cfg: TECDStreamConfig) -> pa.RecordBatch:
+    if not cfg.domain_value:
+        return batch
+    idx = batch.schema.get_field_index(cfg.domain_key)
+    if idx < 0:
+        column = pa.array([cfg.domain_value] * batch.num_rows, pa.string())
+        return batch.append_column(cfg.domain_key, column)
+    column = batch.column(idx)
+    if column.null_count:
+        column = pc.fill_null(column, pa.scalar(cfg.domain_value, column.type))
+        batch = batch.set_column(idx, cfg.domain_key, column)
+    return batch
+
+
+def extract_batch_days(batch: pa.RecordBatch, cfg: TECDStreamConfig) -> Optional[pa.Array]:
+    """Vectorized _extract_day: YYYY-MM-DD strings from date, falling back to timestamp."""
+
+    days = None
+    if cfg.date_key in batch.schema.names:
+        days = _day_strings(batch.column(cfg.date_key), from_date=True)
+    if cfg.timestamp_key in batch.schema.names:
+        ts_days = _day_strings(batch.column(cfg.timestamp_key), from_date=False)
+        if ts_days is not None:
+            days = ts_days if days is None else pc.coalesce(days, ts_days)
+    return days
+
+
+def _day_strings(column: pa.Array, from_date: bool) -> Optional[pa.Array]:
+    if pa.types.is_duration(column.type):
+        # offsets from 1970-01-01, same convention as _parse_timestamp
+        per_day = {"s": 86_400, "ms": 86_400_000, "us": 86_400_000_000, "ns": 86_400_000_000_000}
+        day_numbers = pc.divide(pc.cast(column, pa.int64()), per_day[column.type.unit])
+        return pc.cast(pc.cast(pc.cast(day_numbers, pa.int32()), pa.date32()), pa.string())
+    if pa.types.is_timestamp(column.type) or pa.types.is_date(column.type):
+        return pc.cast(pc.cast(column, pa.date32()), pa.string())
+    if pa.types.is_string(column.type) or pa.types.is_large_string(column.type):
+        days = pc.utf8_slice_codeunits(column, 0, 10)
+        if from_date:
+            # empty strings are falsy in the row path and fall through to timestamp
+            return pc.if_else(pc.equal(pc.utf8_length(column), 0), pa.scalar(None, days.type), days)
+        return pc.if_else(pc.greater_equal(pc.utf8_length(column), 10), days, pa.scalar(None, days.type))
+    if from_date:
+        return pc.utf8_slice_codeunits(pc.cast(column, pa.string()), 0, 10)
+    return None
+
+
+def _project(batch: pa.RecordBatch, keep_fields: Set[str]) -> pa.RecordBatch:
+    """Keep only keep_fields; missing ones become null columns like row.get() would."""
+
+    arrays, names = [], []
+    for name in sorted(keep_fields):
+        idx = batch.schema.get_field_index(name)
+        arrays.append(batch.column(idx) if idx >= 0 else pa.nulls(batch.num_rows))
+        names.append(name)
+    return pa.RecordBatch.from_arrays(arrays, names=names)
+
+
 def build_sequences(
     rows: Iterable[Dict[str, Any]],
     cfg: TECDStreamConfig,
@@ -126,6 +357,134 @@ def build_sequences(
         user_hist.append((action, product, seasonal))
 
 
+def build_sequence_arrays(
+    source: Any,
+    cfg: TECDStreamConfig,
+    seq_cfg: SequenceConfig,
+) -> SequenceArrays:
+    """Vectorized build_sequences over a pyarrow Table or iterable of RecordBatches.
+
+    Events are sorted by user and time (stable, so ties keep stream order),
+    seasonal features are computed for the whole column at once and examples
+    are described by (target event, history length) instead of copied lists.
+    Numeric timestamps are read as UTC epoch seconds.
+    """
+
+    table = source if isinstance(source, pa.Table) else pa.Table.from_batches(list(source))
+    columns = [cfg.user_key, cfg.action_key, cfg.timestamp_key]
+    if seq_cfg.include_product:
+        columns.append(cfg.product_key)
+    table = table.select([name for name in columns if name in table.schema.names])
+    table = table.filter(pc.and_(pc.is_valid(table[cfg.user_key]), pc.is_valid(table[cfg.action_key])))
+
+    user_tokens, user_codes = _factorize(table[cfg.user_key])
+    action_tokens, actions = _encode_tokens(table[cfg.action_key])
+    product_tokens, products = None, None
+    if seq_cfg.include_product:
+        if cfg.product_key in table.schema.names:
+            product_tokens, products = _encode_tokens(table[cfg.product_key])
+        else:
+            product_tokens = np.array(["<pad>", "<unk>"], dtype=object)
+            products = np.ones(table.num_rows, dtype=np.int32)
+
+    if cfg.timestamp_key in table.schema.names:
+        timestamps = _timestamps_us(table[cfg.timestamp_key])
+    else:
+        timestamps = np.full(table.num_rows, np.datetime64("NaT"), dtype="datetime64[us]")
+
+    order = np.lexsort((timestamps.view(np.int64), user_codes))
+    user_codes = user_codes[order]
+    actions = actions[order]
+    timestamps = timestamps[order]
+    if products is not None:
+        products = products[order]
+
+    n = len(order)
+    positions = np.arange(n, dtype=np.int64)
+    group_start = np.ones(n, dtype=bool)
+    group_start[1:] = user_codes[1:] != user_codes[:-1]
+    first_event = np.maximum.accumulate(np.where(group_start, positions, 0))
+    pos_in_user = positions - first_event
+
+    targets = positions[pos_in_user >= 1] if seq_cfg.drop_until_history else positions
+    lengths = np.minimum(pos_in_user[targets], seq_cfg.max_history).astype(np.int32)
+
+    return SequenceArrays(
+        actions=actions,
+        products=products,
+        seasonal=_seasonal_features_array(timestamps),
+        timestamps=timestamps,
+        event_users=user_codes,
+        target_index=targets,
+        lengths=lengths,
+        max_history=seq_cfg.max_history,
+        action_tokens=action_tokens,
+        product_tokens=product_tokens,
+        user_tokens=user_tokens,
+    )
+
+
+def _factorize(column: Any) -> tuple:
+    """Sorted unique values and int32 codes (arrow kernels, no Python-object sort)."""
+
+    uniques = pc.unique(column)
+    uniques = uniques.take(pc.sort_indices(uniques))
+    codes = pc.index_in(column, value_set=uniques)
+    return uniques.to_numpy(zero_copy_only=False), codes.to_numpy(zero_copy_only=False).astype(np.int32)
+
+
+def _encode_tokens(column: Any) -> tuple:
+    """Vocabulary-style ids: 0 pad, 1 unk (nulls), observed tokens from 2."""
+
+    if not pa.types.is_string(column.type):
+        column = pc.cast(column, pa.string())
+    uniques = pc.drop_null(pc.unique(column))
+    uniques = uniques.take(pc.sort_indices(uniques))
+    codes = pc.fill_null(pc.add(pc.index_in(column, value_set=uniques), 2), 1)
+    tokens = np.concatenate([np.array(["<pad>", "<unk>"], dtype=object), uniques.to_numpy(zero_copy_only=False)])
+    return tokens, codes.to_numpy(zero_copy_only=False).astype(np.int32)
+
+
+def _timestamps_us(column: Any) -> np.ndarray:
+    """datetime64[us] per row with NaT where the row path would get None."""
+
+    if isinstance(column, pa.ChunkedArray):
+        column = column.combine_chunks()
+    kind = column.type
+    if pa.types.is_duration(kind):
+        ticks = pc.cast(pc.cast(column, pa.duration("us")), pa.int64())
+    elif pa.types.is_timestamp(kind) or pa.types.is_date(kind):
+        ticks = pc.cast(pc.cast(column, pa.timestamp("us")), pa.int64())
+    elif pa.types.is_integer(kind) or pa.types.is_floating(kind):
+        ticks = pc.cast(pc.multiply(pc.cast(column, pa.float64()), 1e6), pa.int64())
+    else:
+        parsed = [_parse_timestamp(value) for value in column.to_pylist()]
+        ticks = pa.array(parsed, pa.timestamp("us")).cast(pa.int64())
+    nat = np.iinfo(np.int64).min
+    return pc.fill_null(ticks, nat).to_numpy(zero_copy_only=False).view("datetime64[us]")
+
+
+def _seasonal_features_array(timestamps: np.ndarray) -> np.ndarray:
+    """Column version of _seasonal_features: [E, 4] float32, zeros for NaT."""
+
+    missing = np.isnat(timestamps)
+    days = timestamps.astype("datetime64[D]").view(np.int64)
+    dow = (days + 3) % 7  # 1970-01-01 was a Thursday (weekday 3)
+    month = timestamps.astype("datetime64[M]").view(np.int64) % 12 + 1
+
+    feats = np.stack(
+        [
+            np.sin(2 * np.pi * dow / 7),
+            np.cos(2 * np.pi * dow / 7),
+            np.sin(2 * np.pi * month / 12),
+            np.cos(2 * np.pi * month / 12),
+        ],
+        axis=1,
+    ).astype(np.float32)
+    feats[missing] = 0.0
+    return feats
+
+
 def _extract_day(row: Dict[str, Any], cfg: TECDStreamConfig) -> Optional[str]:
     """Pull a YYYY-MM-DD string from date/timestamp fields."""
 
@@ -0,0 +1,204 @@
+"""Pre-tensorized training data on top of SequenceArrays.
+
+Encoded events are saved once as flat .npy columns (int32 ids, float32
+seasonal features) plus per-example target index and history length, which
+together act as offsets into the event arrays. Loading memory-maps them, so
+DataLoader workers share pages and a batch is one vectorized gather via
+``SequenceArrays.batch``, never a per-sample Python loop.
+"""
+from __future__ import annotations
+
+import json
+from pathlib import Path
+from typing import Dict, Iterator, Optional, Union
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+import torch
+from torch.utils.data import DataLoader, Dataset, Sampler
+
+from .data_pipeline import SequenceArrays
+
+_EVENT_COLUMNS = ("actions", "products", "seasonal", "timestamps", "event_users", "target_index", "lengths")
+_TOKEN_COLUMNS = ("action_tokens", "product_tokens", "user_tokens")
+
+
+def save_sequence_arrays(arrays: SequenceArrays, path: Union[str, Path]) -> None:
+    """Write SequenceArrays as a directory of .npy columns and token tables."""
+
+    path = Path(path)
+    path.mkdir(parents=True, exist_ok=True)
+    for name in _EVENT_COLUMNS:
+        values = getattr(arrays, name)
+        if values is not None:
+            np.save(path / f"{name}.npy", np.ascontiguousarray(values))
+    for name in _TOKEN_COLUMNS:
+        tokens = getattr(arrays, name)
+        if tokens is not None:
+            pq.write_table(pa.table({"token": pa.array(list(tokens), pa.string())}), path / f"{name}.parquet")
+    meta = {"max_history": arrays.max_history, "examples": len(arrays), "events": len(arrays.actions)}
+    (path / "meta.json").write_text(json.dumps(meta), encoding="utf-8")
+
+
+def load_sequence_arrays(path: Union[str, Path], mmap: bool = True) -> SequenceArrays:
+    """Inverse of save_sequence_arrays; numeric columns are memory-mapped by default."""
+
+    path = Path(path)
+    meta = json.loads((path / "meta.json").read_text(encoding="utf-8"))
+    mode = "r" if mmap else None
+
+    def column(name: str) -> Optional[np.ndarray]:
+        file = path / f"{name}.npy"
+        return np.load(file, mmap_mode=mode) if file.exists() else None
+
+    def tokens(name: str) -> Optional[np.ndarray]:
+        file = path / f"{name}.parquet"
+        if not file.exists():
+            return None
+        return pq.read_table(file).column("token").to_numpy()
+
+    return SequenceArrays(
+        **{name: column(name) for name in _EVENT_COLUMNS},
+        max_history=meta["max_history"],
+        **{name: tokens(name) for name in _TOKEN_COLUMNS},
+    )
+
+
+def tensorize_batch(batch: Dict[str, Optional[np.ndarray]]) -> Dict[str, Optional[torch.Tensor]]:
+    """SequenceArrays.batch output -> tensors keyed like collate_sequences.
+
+    Padding is trimmed to the longest history in the batch.
+    """
+
+    lengths = np.asarray(batch["lengths"], dtype=np.int64)
+    width = max(int(lengths.max()) if len(lengths) else 0, 1)
+
+    def ids(values: Optional[np.ndarray]) -> Optional[torch.Tensor]:
+        if values is None:
+            return None
+        return torch.from_numpy(np.ascontiguousarray(values, dtype=np.int64))
+
+    return {
+        "action_hist": ids(batch["history_actions"][:, :width]),
+        "product_hist": ids(batch["history_products"][:, :width] if batch["history_products"] is not None else None),
+        "seasonal": torch.from_numpy(np.ascontiguousarray(batch["history_seasonal"][:, :width], dtype=np.float32)),
+        "lengths": torch.from_numpy(lengths),
+        "target_actions": ids(batch["target_action"]),
+        "target_products": ids(batch["target_product"]),
+    }
+
+
+class SequenceDataset(Dataset):
+    """Batch-level dataset: ``dataset[index_array]`` returns a collated batch.
+
+    Use with a batch sampler and ``batch_size=None`` (see ``make_loader``).
+    Built from a saved directory, the arrays are reopened lazily in every
+    worker instead of being pickled into it.
+    """
+
+    def __init__(self, source: Union[SequenceArrays, str, Path]):
+        if isinstance(source, SequenceArrays):
+            self.path = None
+            self._arrays: Optional[SequenceArrays] = source
+        else:
+            self.path = Path(source)
+            self._arrays = None
+
+    @property
+    def arrays(self) -> SequenceArrays:
+        if self._arrays is None:
+            self._arrays = load_sequence_arrays(self.path)
+        return self._arrays
+
+    def __len__(self) -> int:
+        return len(self.arrays)
+
+    def __getitem__(self, index) -> Dict[str, Optional[torch.Tensor]]:
+        index = np.atleast_1d(np.asarray(index, dtype=np.int64))
+        return tensorize_batch(self.arrays.batch(index))
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        if self.path is not None:
+            state["_arrays"] = None
+        return state
+
+
+class LengthBucketSampler(Sampler):
+    """Yields index arrays of similar-length examples to minimise padding.
+
+    Examples are shuffled, cut into pools of ``batch_size * pool_batches``,
+    sorted by length inside each pool and split into batches; batch order is
+    shuffled again so lengths do not trend over the epoch.
+    """
+
+    def __init__(
+        self,
+        lengths: np.ndarray,
+        batch_size: int,
+        shuffle: bool = True,
+        bucket: bool = True,
+        pool_batches: int = 50,
+        drop_last: bool = False,
+        seed: int = 0,
+    ):
+        self.lengths = np.asarray(lengths)
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.bucket = bucket
+        self.pool_batches = pool_batches
+        self.drop_last = drop_last
+        self.seed = seed
+        self.epoch = 0
+
+    def set_epoch(self, epoch: int) -> None:
+        self.epoch = epoch
+
+    def __len__(self) -> int:
+        n = len(self.lengths)
+        return n // self.batch_size if self.drop_last else -(-n // self.batch_size)
+
+    def __iter__(self) -> Iterator[np.ndarray]:
+        rng = np.random.default_rng(self.seed + self.epoch)
+        n = len(self.lengths)
+        order = rng.permutation(n) if self.shuffle else np.arange(n)
+
+        if self.bucket:
+            pool = self.batch_size * self.pool_batches
+            for start in range(0, n, pool):
+                chunk = order[start:start + pool]
+                order[start:start + pool] = chunk[np.argsort(self.lengths[chunk], kind="stable")]
+
+        batches = [order[i:i + self.batch_size] for i in range(0, n, self.batch_size)]
+        if self.drop_last and batches and len(batches[-1]) < self.batch_size:
+            batches.pop()
+        if self.shuffle and self.bucket:
+            batches = [batches[i] for i in rng.permutation(len(batches))]
+        return iter(batches)
+
+
+def make_loader(
+    dataset: SequenceDataset,
+    batch_size: int = 256,
+    shuffle: bool = True,
+    bucket: bool = True,
+    num_workers: int = 0,
+    pin_memory: bool = False,
+    prefetch_factor: int = 4,
+    seed: int = 0,
+) -> DataLoader:
+    """DataLoader that collates whole batches inside workers."""
+
+    sampler = LengthBucketSampler(dataset.arrays.lengths, batch_size, shuffle=shuffle, bucket=bucket, seed=seed)
+    kwargs = {}
+    if num_workers > 0:
+        kwargs.update(persistent_workers=True, prefetch_factor=prefetch_factor)
+    return DataLoader(
+        dataset,
+        sampler=sampler,
+        batch_size=None,
+        num_workers=num_workers,
+        pin_memory=pin_memory,
+        **kwargs,
+    )
@@ -0,0 +1,211 @@
+"""Online next-action inference with per-user GRU hidden states.
+
+Instead of re-running a user's history through ``NextActionGRU.forward`` on
+every event, ``IncrementalPredictor`` keeps each user's hidden state in a
+preallocated float32 slot array and advances it one event at a time with
+``NextActionGRU.step``. ``GRUStepper`` is the same single-step graph as a
+standalone module for TorchScript/ONNX export, with the action/product
+heads dynamically quantized to int8.
+"""
+from __future__ import annotations
+
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+import torch
+import torch.nn as nn
+
+from .baseline import NextActionGRU
+
+_HEADS = {"action_head", "product_head"}
+
+
+class GRUStepper(nn.Module):
+    """Exportable single-step wrapper: (ids, seasonal, hidden) -> (logits, hidden)."""
+
+    def __init__(self, model: NextActionGRU):
+        super().__init__()
+        self.action_emb = model.action_emb
+        self.seasonal_proj = model.seasonal_proj
+        self.product_emb = model.product_emb if model.product_emb is not None else nn.Identity()
+        self.use_product = model.product_emb is not None
+        self.gru = model.gru
+        self.action_head = model.action_head
+        self.product_head = model.product_head if model.product_head is not None else nn.Identity()
+        self.has_product_head = model.product_head is not None
+
+    def forward(
+        self,
+        action_ids: torch.Tensor,
+        seasonal_feats: torch.Tensor,
+        product_ids: torch.Tensor,
+        hidden: torch.Tensor,
+    ) -> Tuple[torch.Tensor, torch.Tensor, torch.Tensor]:
+        emb = [self.action_emb(action_ids), self.seasonal_proj(seasonal_feats)]
+        if self.use_product:
+            emb.append(self.product_emb(product_ids))
+        x = torch.cat(emb, dim=-1).unsqueeze(1)
+        _, hidden = self.gru(x, hidden)
+        h_last = hidden[-1]
+        action_logits = self.action_head(h_last)
+        product_logits = self.product_head(h_last) if self.has_product_head else torch.empty(0)
+        return action_logits, product_logits, hidden
+
+
+def quantize_heads(module: nn.Module) -> nn.Module:
+    """Dynamic int8 quantization of the action/product heads only.
+
+    Embeddings, the seasonal projection and the GRU stay float: the heads
+    are where the weights (and per-event FLOPs) scale with the catalogue.
+    """
+
+    names = {name for name, child in module.named_modules() if name in _HEADS and isinstance(child, nn.Linear)}
+    return torch.ao.quantization.quantize_dynamic(module, names, dtype=torch.qint8)
+
+
+def build_stepper(model: NextActionGRU, quantize: bool = True) -> GRUStepper:
+    stepper = GRUStepper(model).eval()
+    return quantize_heads(stepper) if quantize else stepper
+
+
+def _example_inputs(model: NextActionGRU, batch_size: int = 2):
+    return (
+        torch.ones(batch_size, dtype=torch.long),
+        torch.zeros(batch_size, 4),
+        torch.ones(batch_size, dtype=torch.long),
+        model.init_hidden(batch_size),
+    )
+
+
+def export_torchscript(model: NextActionGRU, path: Union[str, Path], quantize: bool = True) -> Path:
+    """Trace the single-step graph (optionally int8 heads) and save it."""
+
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    stepper = build_stepper(model, quantize=quantize)
+    with torch.no_grad():
+        traced = torch.jit.freeze(torch.jit.trace(stepper, _example_inputs(model), check_trace=False))
+    traced.save(str(path))
+    return path
+
+
+def export_onnx(model: NextActionGRU, path: Union[str, Path], quantize: bool = True) -> Path:
+    """Export the float single-step graph to ONNX; int8 heads via onnxruntime.
+
+    PyTorch dynamic-quantized modules do not export to ONNX, so the graph is
+    exported in float and, when onnxruntime is installed, its MatMul weights
+    (the heads) are quantized with ``onnxruntime.quantization.quantize_dynamic``.
+    """
+
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    stepper = build_stepper(model, quantize=False)
+    float_path = path.with_suffix(".float.onnx") if quantize else path
+    torch.onnx.export(
+        stepper,
+        _example_inputs(model),
+        str(float_path),
+        input_names=["action_ids", "seasonal", "product_ids", "hidden"],
+        output_names=["action_logits", "product_logits", "next_hidden"],
+        dynamic_axes={
+            "action_ids": {0: "batch"},
+            "seasonal": {0: "batch"},
+            "product_ids": {0: "batch"},
+            "hidden": {1: "batch"},
+            "action_logits": {0: "batch"},
+            "product_logits": {0: "batch"},
+            "next_hidden": {1: "batch"},
+        },
+        dynamo=False,
+    )
+    if not quantize:
+        return path
+    try:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+    except ImportError:
+        print("onnxruntime не установлен: сохранена float-модель без int8-квантизации")
+        float_path.replace(path)
+        return path
+    quantize_dynamic(str(float_path), str(path), op_types_to_quantize=["MatMul", "Gemm"], weight_type=QuantType.QInt8)
+    float_path.unlink()
+    return path
+
+
+class IncrementalPredictor:
+    """Per-user hidden states in a bounded slot array, advanced one event at a time.
+
+    ``observe`` takes a batch of (user, event) pairs, gathers the users'
+    hidden states, runs one GRU step for the whole batch and scatters the
+    new states back. Memory is ``capacity * num_layers * d_model`` floats;
+    the least recently seen user is evicted when the array is full (its next
+    event starts from a zero state).
+    """
+
+    def __init__(self, stepper: nn.Module, num_layers: int, hidden_size: int, capacity: int = 100_000):
+        self.stepper = stepper
+        self.capacity = capacity
+        self.states = torch.zeros(capacity, num_layers, hidden_size)
+        self._slots: "OrderedDict[str, int]" = OrderedDict()
+        self._free: List[int] = list(range(capacity - 1, -1, -1))
+        self.evictions = 0
+
+    @classmethod
+    def from_model(cls, model: NextActionGRU, capacity: int = 100_000, quantize: bool = True) -> "IncrementalPredictor":
+        return cls(build_stepper(model, quantize=quantize), model.cfg.num_layers, model.cfg.d_model, capacity)
+
+    def _slot(self, user: str) -> int:
+        slot = self._slots.get(user)
+        if slot is not None:
+            self._slots.move_to_end(user)
+            return slot
+        if self._free:
+            slot = self._free.pop()
+        else:
+            _, slot = self._slots.popitem(last=False)
+            self.evictions += 1
+        self.states[slot].zero_()
+        self._slots[user] = slot
+        return slot
+
+    def reset(self, user: str) -> None:
+        slot = self._slots.pop(user, None)
+        if slot is not None:
+            self._free.append(slot)
+
+    @torch.no_grad()
+    def observe(
+        self,
+        user_ids: Sequence[str],
+        action_ids: Union[Sequence[int], np.ndarray],
+        seasonal: Union[Sequence[Sequence[float]], np.ndarray],
+        product_ids: Optional[Union[Sequence[int], np.ndarray]] = None,
+    ) -> Dict[str, torch.Tensor]:
+        """Feed one new event per row; returns next-event logits per row.
+
+        A user may appear only once per call (events of one user must be
+        applied in order, one call per step).
+        """
+
+        slots = torch.tensor([self._slot(user) for user in user_ids], dtype=torch.long)
+        if len(set(slots.tolist())) != len(slots):
+            raise ValueError("each user may appear at most once per observe() call")
+        actions = torch.as_tensor(np.asarray(action_ids), dtype=torch.long)
+        feats = torch.as_tensor(np.asarray(seasonal, dtype=np.float32)).reshape(-1, 4)
+        products = (
+            torch.as_tensor(np.asarray(product_ids), dtype=torch.long)
+            if product_ids is not None
+            else torch.zeros_like(actions)
+        )
+
+        hidden = self.states[slots].transpose(0, 1).contiguous()
+        action_logits, product_logits, hidden = self.stepper(actions, feats, products, hidden)
+        self.states[slots] = hidden.transpose(0, 1)
+        return {
+            "action_logits": action_logits,
+            "product_logits": product_logits if product_logits.numel() else None,
+        }
+
+    def __len__(self) -> int:
+        return len(self._slots)
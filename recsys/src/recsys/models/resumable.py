@@ -0,0 +1,173 @@
+"""Checkpointed, resumable variant of build_sequences.
+
+Per-user histories live in a bounded in-memory LRU; users that fall out of
+it are spilled to a SQLite file. Spills and checkpoints share one
+transaction, so after a crash the file holds exactly the histories as of
+the last committed stream offset and the stream can be resumed from there.
+"""
+from __future__ import annotations
+
+import json
+import sqlite3
+from collections import OrderedDict, deque
+from itertools import islice
+from pathlib import Path
+from typing import Any, Callable, Deque, Dict, Iterable, Iterator, Optional
+
+from .data_pipeline import SequenceConfig, TECDStreamConfig, _parse_timestamp, _seasonal_features
+
+
+class HistoryStore:
+    """User histories with at most `max_resident` users kept in RAM.
+
+    Evicted users are written to SQLite only if they changed since they were
+    loaded. Nothing becomes durable until `commit`, which also records the
+    stream offset (and optional caller metadata) atomically.
+    """
+
+    def __init__(self, path: Path, max_history: int, max_resident: int = 100_000):
+        self.path = Path(path)
+        self.max_history = max_history
+        self.max_resident = max_resident
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._db = sqlite3.connect(self.path)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute("CREATE TABLE IF NOT EXISTS history (user_id TEXT PRIMARY KEY, events TEXT NOT NULL)")
+        self._db.execute("CREATE TABLE IF NOT EXISTS checkpoint (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        self._db.commit()
+
+        self._resident: "OrderedDict[str, Deque]" = OrderedDict()
+        self._dirty: set = set()
+        self.spilled = 0
+        self.loaded = 0
+
+        row = self._db.execute("SELECT value FROM checkpoint WHERE key = 'state'").fetchone()
+        state = json.loads(row[0]) if row else {}
+        self.offset: int = state.get("offset", 0)
+        self.meta: Dict[str, Any] = state.get("meta", {})
+
+    def get(self, user: str) -> Deque:
+        hist = self._resident.get(user)
+        if hist is not None:
+            self._resident.move_to_end(user)
+            return hist
+
+        row = self._db.execute("SELECT events FROM history WHERE user_id = ?", (user,)).fetchone()
+        events = [tuple(event) for event in json.loads(row[0])] if row else ()
+        if row:
+            self.loaded += 1
+        hist = deque(events, maxlen=self.max_history)
+        self._resident[user] = hist
+        if len(self._resident) > self.max_resident:
+            self._spill(len(self._resident) - self.max_resident)
+        return hist
+
+    def touch(self, user: str) -> None:
+        """Mark a resident history as modified."""
+
+        self._dirty.add(user)
+
+    def _spill(self, count: int) -> None:
+        rows = []
+        for _ in range(count):
+            user, hist = self._resident.popitem(last=False)
+            if user in self._dirty:
+                self._dirty.discard(user)
+                rows.append((user, json.dumps(list(hist))))
+        if rows:
+            self._write(rows)
+            self.spilled += len(rows)
+
+    def _write(self, rows) -> None:
+        self._db.executemany(
+            "INSERT INTO history (user_id, events) VALUES (?, ?) "
+            "ON CONFLICT(user_id) DO UPDATE SET events = excluded.events",
+            rows,
+        )
+
+    def commit(self, offset: int, meta: Optional[Dict[str, Any]] = None) -> None:
+        """Persist every modified history together with the stream offset."""
+
+        self._write([(user, json.dumps(list(self._resident[user]))) for user in self._dirty])
+        self._dirty.clear()
+        self.offset = offset
+        if meta is not None:
+            self.meta = meta
+        state = json.dumps({"offset": offset, "meta": self.meta})
+        self._db.execute(
+            "INSERT INTO checkpoint (key, value) VALUES ('state', ?) "
+            "ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+            (state,),
+        )
+        self._db.commit()
+
+    def __len__(self) -> int:
+        return len(self._resident)
+
+    def close(self) -> None:
+        # uncommitted spills are rolled back: the file always matches the last checkpoint
+        self._db.rollback()
+        self._db.close()
+
+
+def build_sequences_resumable(
+    rows: Iterable[Dict[str, Any]],
+    cfg: TECDStreamConfig,
+    seq_cfg: SequenceConfig,
+    store: HistoryStore,
+    checkpoint_every: int = 100_000,
+    on_checkpoint: Optional[Callable[[int], Optional[Dict[str, Any]]]] = None,
+) -> Iterator[Dict[str, Any]]:
+    """build_sequences with periodic checkpoints into `store`.
+
+    The first `store.offset` rows are skipped, so `rows` must replay the same
+    stream in the same order. Every `checkpoint_every` input rows
+    `on_checkpoint(offset)` is called first (flush downstream output there;
+    a returned dict is saved as checkpoint metadata), then the store commits.
+    Examples yielded after the last checkpoint are produced again on resume.
+    """
+
+    offset = store.offset
+    for row in islice(rows, offset, None):
+        offset += 1
+        example = _process_row(row, cfg, seq_cfg, store)
+        if example is not None:
+            yield example
+
+        if offset % checkpoint_every == 0:
+            meta = on_checkpoint(offset) if on_checkpoint else None
+            store.commit(offset, meta)
+
+    if offset != store.offset:
+        meta = on_checkpoint(offset) if on_checkpoint else None
+        store.commit(offset, meta)
+
+
+def _process_row(row, cfg: TECDStreamConfig, seq_cfg: SequenceConfig, store: HistoryStore) -> Optional[Dict[str, Any]]:
+    user = row.get(cfg.user_key)
+    action = row.get(cfg.action_key)
+    if user is None or action is None:
+        return None
+
+    product = row.get(cfg.product_key) if seq_cfg.include_product else None
+    ts = _parse_timestamp(row.get(cfg.timestamp_key))
+    seasonal = _seasonal_features(ts)
+
+    user_hist = store.get(user)
+    store.touch(user)
+
+    example = None
+    if not (seq_cfg.drop_until_history and not user_hist):
+        example = {
+            "user_id": user,
+            "history_actions": [item[0] for item in user_hist],
+            "history_products": [item[1] for item in user_hist] if seq_cfg.include_product else None,
+            "history_seasonal": [item[2] for item in user_hist],
+            "target_action": action,
+            "target_product": product,
+            "timestamp": ts,
+        }
+
+    user_hist.append((action, product, seasonal))
+    return example
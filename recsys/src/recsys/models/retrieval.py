@@ -0,0 +1,192 @@
+"""Top-k product retrieval over the product head without scoring the catalogue.
+
+The product score is ``h @ W.T + b``, a maximum inner product search (MIPS).
+Items are mapped to ``[w, b, sqrt(M^2 - |[w, b]|^2)]`` and queries to
+``[h, 1, 0]``, which turns MIPS into plain L2 nearest neighbour search
+(Bachrach et al. reduction). An IVF index in NumPy clusters the augmented
+items with k-means and only scores the ``nprobe`` closest lists per query.
+
+Backends are pluggable: anything with ``search(queries, k) -> (ids, scores)``
+can be registered with ``register_index`` and built by name.
+"""
+from __future__ import annotations
+
+import time
+from typing import Callable, Dict, Optional, Tuple
+
+import numpy as np
+
+INDEX_BACKENDS: Dict[str, Callable[..., "ExactIndex"]] = {}
+
+
+def register_index(name: str):
+    """Decorator: make an index class constructible via ``build_index(name, ...)``."""
+
+    def wrap(cls):
+        INDEX_BACKENDS[name] = cls
+        return cls
+
+    return wrap
+
+
+def build_index(name: str, weights: np.ndarray, bias: Optional[np.ndarray] = None, **kwargs):
+    try:
+        backend = INDEX_BACKENDS[name]
+    except KeyError:
+        raise ValueError(f"unknown index backend {name!r}; available: {sorted(INDEX_BACKENDS)}") from None
+    return backend(weights, bias, **kwargs)
+
+
+def _topk(scores: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Row-wise top-k (descending) via argpartition."""
+
+    k = min(k, scores.shape[1])
+    part = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    part_scores = np.take_along_axis(scores, part, axis=1)
+    order = np.argsort(-part_scores, axis=1, kind="stable")
+    return np.take_along_axis(part, order, axis=1), np.take_along_axis(part_scores, order, axis=1)
+
+
+@register_index("exact")
+class ExactIndex:
+    """Brute-force scores in query chunks; the reference for recall."""
+
+    def __init__(self, weights: np.ndarray, bias: Optional[np.ndarray] = None, chunk_size: int = 1024, exclude: int = 2):
+        self.weights = np.ascontiguousarray(weights, dtype=np.float32)
+        self.bias = np.zeros(len(weights), np.float32) if bias is None else np.asarray(bias, dtype=np.float32)
+        self.chunk_size = chunk_size
+        self.exclude = exclude  # pad/unk ids are never returned
+
+    def search(self, queries: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+        ids, scores = [], []
+        for start in range(0, len(queries), self.chunk_size):
+            block = queries[start:start + self.chunk_size] @ self.weights.T + self.bias
+            block[:, :self.exclude] = -np.inf
+            top_ids, top_scores = _topk(block, k)
+            ids.append(top_ids)
+            scores.append(top_scores)
+        return np.concatenate(ids), np.concatenate(scores)
+
+
+@register_index("ivf")
+class IVFIndex:
+    """Inverted-file index over MIPS-augmented item vectors.
+
+    ``nlist`` k-means cells (default ~sqrt(N)); a query scores the items of
+    its ``nprobe`` nearest cells only. Lists are stored CSR-style: one
+    ``order`` array of item ids grouped by cell plus ``offsets``.
+    """
+
+    def __init__(
+        self,
+        weights: np.ndarray,
+        bias: Optional[np.ndarray] = None,
+        nlist: Optional[int] = None,
+        nprobe: int = 8,
+        train_size: int = 65_536,
+        iters: int = 10,
+        exclude: int = 2,
+        seed: int = 0,
+    ):
+        weights = np.asarray(weights, dtype=np.float32)
+        bias = np.zeros(len(weights), np.float32) if bias is None else np.asarray(bias, dtype=np.float32)
+        self.exclude = exclude
+        self.nprobe = nprobe
+
+        items = np.hstack([weights, bias[:, None]])
+        norms = np.einsum("ij,ij->i", items, items)
+        extra = np.sqrt(np.maximum(norms.max() - norms, 0.0))[:, None]
+        self.items = np.ascontiguousarray(np.hstack([items, extra]), dtype=np.float32)
+        self.ids = np.arange(exclude, len(weights), dtype=np.int64)
+
+        data = self.items[self.ids]
+        nlist = nlist or max(1, int(np.sqrt(len(data))))
+        self.centroids = _kmeans(data, nlist, train_size=train_size, iters=iters, seed=seed)
+        assign = _nearest(data, self.centroids)
+        order = np.argsort(assign, kind="stable")
+        self.order = self.ids[order]
+        self.offsets = np.concatenate([[0], np.cumsum(np.bincount(assign, minlength=len(self.centroids)))])
+
+    def search(self, queries: np.ndarray, k: int, nprobe: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+        queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+        nprobe = min(nprobe or self.nprobe, len(self.centroids))
+        augmented = np.hstack([queries, np.ones((len(queries), 1), np.float32), np.zeros((len(queries), 1), np.float32)])
+        # nearest cells in L2 over augmented vectors == highest inner product with the centroids' items
+        cell_dist = -2 * augmented @ self.centroids.T + np.einsum("ij,ij->i", self.centroids, self.centroids)
+        cells = np.argpartition(cell_dist, nprobe - 1, axis=1)[:, :nprobe]
+
+        out_ids = np.full((len(queries), k), -1, dtype=np.int64)
+        out_scores = np.full((len(queries), k), -np.inf, dtype=np.float32)
+        for row, query in enumerate(augmented):
+            candidates = np.concatenate([self.order[self.offsets[c]:self.offsets[c + 1]] for c in cells[row]])
+            if not len(candidates):
+                continue
+            scores = self.items[candidates] @ query
+            top_ids, top_scores = _topk(scores[None, :], k)
+            out_ids[row, : top_ids.shape[1]] = candidates[top_ids[0]]
+            out_scores[row, : top_scores.shape[1]] = top_scores[0]
+        return out_ids, out_scores
+
+
+def _nearest(data: np.ndarray, centroids: np.ndarray, chunk_size: int = 16_384) -> np.ndarray:
+    sq = np.einsum("ij,ij->i", centroids, centroids)
+    out = np.empty(len(data), dtype=np.int64)
+    for start in range(0, len(data), chunk_size):
+        block = data[start:start + chunk_size]
+        out[start:start + len(block)] = np.argmin(sq - 2 * block @ centroids.T, axis=1)
+    return out
+
+
+def _kmeans(data: np.ndarray, k: int, train_size: int, iters: int, seed: int) -> np.ndarray:
+    """Lloyd's k-means on a sample; empty cells are re-seeded from random points."""
+
+    rng = np.random.default_rng(seed)
+    sample = data[rng.choice(len(data), min(train_size, len(data)), replace=False)]
+    k = min(k, len(sample))
+    centroids = sample[rng.choice(len(sample), k, replace=False)].copy()
+    for _ in range(iters):
+        assign = _nearest(sample, centroids)
+        counts = np.bincount(assign, minlength=k)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assign, sample)
+        empty = counts == 0
+        centroids[~empty] = sums[~empty] / counts[~empty, None]
+        if empty.any():
+            centroids[empty] = sample[rng.choice(len(sample), int(empty.sum()), replace=False)]
+    return centroids
+
+
+def recall_at_k(approx_ids: np.ndarray, exact_ids: np.ndarray) -> float:
+    """Mean share of the exact top-k found by the approximate search."""
+
+    k = exact_ids.shape[1]
+    hits = [len(np.intersect1d(a[:k], e)) for a, e in zip(approx_ids, exact_ids)]
+    return float(np.mean(hits) / k) if hits else 0.0
+
+
+def product_head_arrays(model) -> Tuple[np.ndarray, np.ndarray]:
+    """(weights [P, H], bias [P]) of NextActionGRU.product_head as float32 NumPy."""
+
+    if model.product_head is None:
+        raise ValueError("model has no product head")
+    weight = model.product_head.weight.detach().float().cpu().numpy()
+    bias = model.product_head.bias
+    bias = bias.detach().float().cpu().numpy() if bias is not None else np.zeros(len(weight), np.float32)
+    return weight, bias
+
+
+def evaluate_index(index, exact: ExactIndex, queries: np.ndarray, k: int, **search_kwargs) -> Dict[str, float]:
+    """recall@k against exact search plus per-query latency of both."""
+
+    start = time.perf_counter()
+    exact_ids, _ = exact.search(queries, k)
+    exact_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    approx_ids, _ = index.search(queries, k, **search_kwargs)
+    approx_seconds = time.perf_counter() - start
+    return {
+        "recall": recall_at_k(approx_ids, exact_ids),
+        "exact_ms_per_query": exact_seconds / len(queries) * 1e3,
+        "approx_ms_per_query": approx_seconds / len(queries) * 1e3,
+    }
@@ -0,0 +1,184 @@
+"""Parallel extraction over local T-ECD parquet shards.
+
+Each shard is filtered by its own worker process with the columnar path
+(`stream_filtered_batches`); the global max_days cut-off is resolved up
+front (from the filtered day columns, or row-group statistics when they
+pin a single day) so workers never need to talk to each other. Outputs are written per shard and optionally merged in shard
+order, so results are deterministic regardless of scheduling.
+"""
+from __future__ import annotations
+
+import glob
+import os
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, replace
+from pathlib import Path
+from typing import List, Optional, Sequence, Set, Tuple
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from .data_pipeline import TECDStreamConfig, extract_batch_days, stream_filtered_batches
+
+
+@dataclass
+class ShardResult:
+    shard: str
+    output: Optional[Path]
+    rows: int
+
+
+def resolve_shards(patterns: Sequence[str]) -> List[str]:
+    """Expand local paths/globs into a sorted, de-duplicated shard list."""
+
+    shards: List[str] = []
+    for pattern in patterns:
+        if pattern.startswith("hf://"):
+            raise ValueError("parallel extraction works on local shards; download them first")
+        shards.extend(sorted(glob.glob(pattern, recursive=True)) or [pattern])
+    return list(dict.fromkeys(shards))
+
+
+def shard_days(path: str, cfg: TECDStreamConfig) -> Set[str]:
+    """Days present in a shard, counted over the rows the extraction keeps.
+
+    With a domain or action filter the days come from the filtered day
+    columns (the same scanner filter as ``stream_filtered_batches``), so a
+    day with only filtered-out events does not count. Without filters,
+    row-group min/max statistics are used when they pin a single day; a
+    row group spanning several days, or without usable statistics, has its
+    day columns read, so gaps inside it are not counted as days.
+    """
+
+    parquet = pq.ParquetFile(path)
+    schema = parquet.schema_arrow
+    day_columns = [name for name in (cfg.date_key, cfg.timestamp_key) if name in schema.names]
+    if not day_columns:
+        return set()
+
+    days: Set[str] = set()
+    if cfg.domains or cfg.exclude_actions:
+        filtered = replace(
+            cfg, data_files=[path], columnar=True, max_days=None, until_day=None, keep_fields=set(day_columns)
+        )
+        for batch in stream_filtered_batches(filtered):
+            _add_days(days, batch, cfg)
+        return days
+
+    meta = parquet.metadata
+    for rg in range(meta.num_row_groups):
+        bounds = _row_group_bounds(meta.row_group(rg), schema, day_columns)
+        if bounds is not None:
+            low, high = extract_batch_days(pa.RecordBatch.from_pydict(bounds), cfg).to_pylist()
+            if low and low == high:
+                days.add(low)
+                continue
+        for batch in parquet.read_row_group(rg, columns=day_columns).to_batches():
+            _add_days(days, batch, cfg)
+    return days
+
+
+def _add_days(days: Set[str], batch: pa.RecordBatch, cfg: TECDStreamConfig) -> None:
+    values = extract_batch_days(batch, cfg)
+    if values is not None:
+        days.update(day for day in values.unique().to_pylist() if day)
+
+
+def _row_group_bounds(row_group, schema: pa.Schema, columns: List[str]) -> Optional[dict]:
+    """{column: [min, max]} as typed arrow arrays, or None if stats are missing."""
+
+    bounds = {}
+    for name in columns:
+        idx = schema.get_field_index(name)
+        stats = row_group.column(idx).statistics
+        if stats is None or not stats.has_min_max or stats.null_count:
+            return None
+        field = schema.field(name)
+        if pa.types.is_duration(field.type):
+            values = pa.array([stats.min, stats.max], pa.int64()).cast(field.type)
+        else:
+            values = pa.array([stats.min, stats.max], field.type)
+        bounds[name] = values
+    return bounds
+
+
+def global_cutoff_day(shards: Sequence[str], cfg: TECDStreamConfig, workers: int) -> Optional[str]:
+    """The max_days-th earliest day across all shards (None = keep everything)."""
+
+    if cfg.max_days is None:
+        return None
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        per_shard = list(pool.map(shard_days, shards, [cfg] * len(shards)))
+    days = sorted(set().union(*per_shard))
+    if len(days) <= cfg.max_days:
+        return None
+    return days[cfg.max_days - 1]
+
+
+def _extract_one(args: Tuple[int, str, TECDStreamConfig, Path, int]) -> ShardResult:
+    index, shard, cfg, out_dir, row_group_size = args
+    shard_cfg = replace(cfg, data_files=[shard], columnar=True, max_days=None)
+    output = out_dir / f"part-{index:05d}.parquet"
+
+    writer = None
+    rows = 0
+    try:
+        for batch in stream_filtered_batches(shard_cfg):
+            if writer is None:
+                writer = pq.ParquetWriter(output, batch.schema)
+            writer.write_batch(batch, row_group_size=row_group_size)
+            rows += batch.num_rows
+    finally:
+        if writer is not None:
+            writer.close()
+    return ShardResult(shard=shard, output=output if writer is not None else None, rows=rows)
+
+
+def extract_shards(
+    cfg: TECDStreamConfig,
+    out_dir: Path,
+    workers: Optional[int] = None,
+    row_group_size: int = 100_000,
+) -> List[ShardResult]:
+    """Filter every shard in cfg.data_files in parallel; one output file per shard.
+
+    Results come back in shard order. The max_days cut-off is global: the
+    pre-pass picks the cut-off day and workers keep rows up to that day.
+    """
+
+    shards = resolve_shards(cfg.data_files or [])
+    if not shards:
+        raise ValueError("no shards matched data_files")
+    workers = workers or os.cpu_count() or 1
+
+    cfg = replace(cfg, until_day=global_cutoff_day(shards, cfg, workers))
+    out_dir.mkdir(parents=True, exist_ok=True)
+
+    tasks = [(i, shard, cfg, out_dir, row_group_size) for i, shard in enumerate(shards)]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(_extract_one, tasks))
+
+
+def merge_outputs(results: Sequence[ShardResult], output: Path, row_group_size: int = 100_000) -> int:
+    """Concatenate per-shard outputs into one parquet file in shard order."""
+
+    writer = None
+    rows = 0
+    try:
+        for result in results:
+            if result.output is None:
+                continue
+            parquet = pq.ParquetFile(result.output)
+            for batch in parquet.iter_batches(batch_size=row_group_size):
+                if writer is None:
+                    schema = parquet.schema_arrow
+                    output.parent.mkdir(parents=True, exist_ok=True)
+                    writer = pq.ParquetWriter(output, schema)
+                elif batch.schema != writer.schema:
+                    batch = pa.Table.from_batches([batch]).cast(writer.schema).to_batches()[0]
+                writer.write_batch(batch, row_group_size=row_group_size)
+                rows += batch.num_rows
+    finally:
+        if writer is not None:
+            writer.close()
+    return rows
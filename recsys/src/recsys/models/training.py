@@ -0,0 +1,228 @@
+"""CPU training loop for NextActionGRU with throughput instrumentation.
+
+Batches come from any iterable of collate_sequences-style dicts (the
+pre-tensorized DataLoader or streamed build_sequences output). Per epoch
+the loop reports samples/sec, time spent waiting for data versus compute,
+and peak RSS, which is what we need to size hardware for the full dataset.
+"""
+from __future__ import annotations
+
+import json
+import resource
+import time
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, Optional
+
+import torch
+import torch.nn.functional as F
+
+from .baseline import NextActionGRU
+
+
+@dataclass
+class TrainConfig:
+    epochs: int = 1
+    lr: float = 1e-3
+    weight_decay: float = 0.0
+    grad_accum_steps: int = 1
+    max_grad_norm: Optional[float] = 1.0
+    bf16: bool = False  # torch.autocast on CPU
+    num_threads: Optional[int] = None
+    num_interop_threads: Optional[int] = None
+    product_loss_weight: float = 1.0
+    product_loss: str = "full"  # full | in_batch | sampled (in-batch + uniform negatives)
+    num_sampled: int = 1024  # uniform negatives per batch for product_loss="sampled"
+    checkpoint_dir: Optional[Path] = None
+    checkpoint_every: int = 0  # optimizer steps; 0 = only at epoch end
+    log_every: int = 100  # optimizer steps
+
+
+@dataclass
+class EpochStats:
+    epoch: int
+    samples: int
+    steps: int
+    loss: float
+    seconds: float
+    data_seconds: float
+    compute_seconds: float
+    samples_per_sec: float
+    peak_rss_mb: float
+    peak_rss_children_mb: float
+
+
+def configure_threads(cfg: TrainConfig) -> None:
+    if cfg.num_threads:
+        torch.set_num_threads(cfg.num_threads)
+    if cfg.num_interop_threads:
+        try:
+            torch.set_num_interop_threads(cfg.num_interop_threads)
+        except RuntimeError:
+            # only settable before the first parallel op in the process
+            print("num_interop_threads ignored: inter-op pool already started")
+
+
+def peak_rss_mb(who: int = resource.RUSAGE_SELF) -> float:
+    """Peak resident set size in MiB (ru_maxrss is KiB on Linux)."""
+
+    return resource.getrusage(who).ru_maxrss / 1024
+
+
+def compute_loss(model: NextActionGRU, batch: Dict[str, Any], cfg: TrainConfig) -> torch.Tensor:
+    h_last = model.encode(
+        batch["action_hist"],
+        batch["seasonal"],
+        batch.get("product_hist"),
+        batch["lengths"],
+    )
+    loss = F.cross_entropy(model.action_head(h_last).float(), batch["target_actions"])
+    targets = batch.get("target_products")
+    if model.product_head is None or targets is None:
+        return loss
+
+    if cfg.product_loss == "full":
+        product_loss = F.cross_entropy(model.product_head(h_last).float(), targets)
+    else:
+        product_loss = sampled_softmax_loss(
+            h_last,
+            model.product_head,
+            targets,
+            num_sampled=cfg.num_sampled if cfg.product_loss == "sampled" else 0,
+        )
+    return loss + cfg.product_loss_weight * product_loss
+
+
+def sampled_softmax_loss(
+    hidden: torch.Tensor,
+    head: torch.nn.Linear,
+    targets: torch.Tensor,
+    num_sampled: int = 0,
+    first_id: int = 2,
+) -> torch.Tensor:
+    """Softmax over the batch's distinct targets plus shared uniform negatives.
+
+    Only the selected rows of the head are multiplied, so the cost is
+    O(B * (B + num_sampled)) instead of O(B * num_products). Uniform
+    negatives that hit a row's own target are masked out; in-batch
+    negatives are not logQ-corrected (popular items are penalised more,
+    which is usually acceptable for retrieval).
+    """
+
+    candidates, labels = torch.unique(targets, return_inverse=True)
+    if num_sampled:
+        sampled = torch.randint(first_id, head.out_features, (num_sampled,), device=targets.device)
+        candidates = torch.cat([candidates, sampled])
+
+    logits = F.linear(hidden, head.weight[candidates], head.bias[candidates] if head.bias is not None else None).float()
+    if num_sampled:
+        offset = len(candidates) - num_sampled
+        hit = sampled[None, :] == targets[:, None]
+        logits[:, offset:] = logits[:, offset:].masked_fill(hit, float("-inf"))
+    return F.cross_entropy(logits, labels)
+
+
+def save_checkpoint(path: Path, model: NextActionGRU, optimizer: torch.optim.Optimizer, state: Dict[str, Any]) -> None:
+    """Atomic write: a crash mid-save never leaves a truncated checkpoint."""
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(".tmp")
+    torch.save(
+        {"model": model.state_dict(), "optimizer": optimizer.state_dict(), "model_config": asdict(model.cfg), **state},
+        tmp,
+    )
+    tmp.replace(path)
+
+
+def load_checkpoint(path: Path, model: NextActionGRU, optimizer: Optional[torch.optim.Optimizer] = None) -> Dict[str, Any]:
+    state = torch.load(path, map_location="cpu", weights_only=False)
+    model.load_state_dict(state["model"])
+    if optimizer is not None and "optimizer" in state:
+        optimizer.load_state_dict(state["optimizer"])
+    return state
+
+
+def train(
+    model: NextActionGRU,
+    make_batches: Callable[[int], Iterable[Dict[str, Any]]],
+    cfg: TrainConfig,
+    optimizer: Optional[torch.optim.Optimizer] = None,
+    start_epoch: int = 0,
+    on_epoch: Optional[Callable[[EpochStats], None]] = None,
+) -> list:
+    """Train for cfg.epochs; ``make_batches(epoch)`` returns that epoch's batches."""
+
+    configure_threads(cfg)
+    optimizer = optimizer or torch.optim.AdamW(model.parameters(), lr=cfg.lr, weight_decay=cfg.weight_decay)
+    checkpoint = cfg.checkpoint_dir / "checkpoint.pt" if cfg.checkpoint_dir else None
+    history = []
+    global_step = 0
+
+    for epoch in range(start_epoch, cfg.epochs):
+        model.train()
+        optimizer.zero_grad(set_to_none=True)
+        samples = steps = micro = 0
+        loss_sum = 0.0
+        data_time = compute_time = 0.0
+        epoch_start = time.perf_counter()
+
+        batches = iter(make_batches(epoch))
+        while True:
+            tick = time.perf_counter()
+            batch = next(batches, None)
+            data_time += time.perf_counter() - tick
+            if batch is None:
+                break
+
+            tick = time.perf_counter()
+            with torch.autocast("cpu", dtype=torch.bfloat16, enabled=cfg.bf16):
+                loss = compute_loss(model, batch, cfg)
+            (loss / cfg.grad_accum_steps).backward()
+            micro += 1
+            samples += len(batch["lengths"])
+            loss_sum += loss.item() * len(batch["lengths"])
+
+            if micro % cfg.grad_accum_steps == 0:
+                _step(model, optimizer, cfg)
+                steps += 1
+                global_step += 1
+                if cfg.log_every and steps % cfg.log_every == 0:
+                    elapsed = time.perf_counter() - epoch_start
+                    print(f"epoch {epoch} step {steps}: loss={loss_sum / samples:.4f} {samples / elapsed:.0f} samples/s")
+                if checkpoint and cfg.checkpoint_every and global_step % cfg.checkpoint_every == 0:
+                    save_checkpoint(checkpoint, model, optimizer, {"epoch": epoch, "step": steps, "finished_epoch": False})
+            compute_time += time.perf_counter() - tick
+
+        if micro % cfg.grad_accum_steps:
+            # flush a partial accumulation window at the end of the epoch
+            _step(model, optimizer, cfg)
+            steps += 1
+
+        seconds = time.perf_counter() - epoch_start
+        stats = EpochStats(
+            epoch=epoch,
+            samples=samples,
+            steps=steps,
+            loss=loss_sum / max(samples, 1),
+            seconds=seconds,
+            data_seconds=data_time,
+            compute_seconds=compute_time,
+            samples_per_sec=samples / seconds if seconds else 0.0,
+            peak_rss_mb=peak_rss_mb(),
+            peak_rss_children_mb=peak_rss_mb(resource.RUSAGE_CHILDREN),
+        )
+        history.append(stats)
+        if checkpoint:
+            save_checkpoint(checkpoint, model, optimizer, {"epoch": epoch, "step": steps, "finished_epoch": True})
+            with (cfg.checkpoint_dir / "metrics.jsonl").open("a", encoding="utf-8") as f:
+                f.write(json.dumps(asdict(stats)) + "\n")
+        if on_epoch:
+            on_epoch(stats)
+    return history
+
+
+def _step(model: NextActionGRU, optimizer: torch.optim.Optimizer, cfg: TrainConfig) -> None:
+    if cfg.max_grad_norm:
+        torch.nn.utils.clip_grad_norm_(model.parameters(), cfg.max_grad_norm)
+    optimizer.step()
+    optimizer.zero_grad(set_to_none=True)
@@ -0,0 +1,256 @@
+"""Token vocabularies with a frozen, array-backed fast path.
+
+A growing Vocabulary is a dict plus a list, as before. ``freeze`` turns it
+into three flat arrays (UTF-8 tokens sorted bytewise, their ids, and the
+position of every id in the sorted order); lookups become a vectorized
+binary search and the arrays can be saved as .npy and memory-mapped, so
+every training/inference worker shares the same pages instead of
+unpickling its own dict.
+"""
+from __future__ import annotations
+
+import json
+from pathlib import Path
+from typing import Any, Iterable, List, Optional, Sequence, Union
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+
+
+class Vocabulary:
+    """Token-to-id helper that keeps pad/unk stable.
+
+    Frozen vocabularies never grow: unknown tokens (and None) map to unk.
+    Frozen tokens are compared as UTF-8 strings, so non-string tokens are
+    keyed by ``str(token)``.
+    """
+
+    def __init__(self, pad_token: str = "<pad>", unk_token: str = "<unk>"):
+        self.pad_token = pad_token
+        self.unk_token = unk_token
+        self.token_to_id = {pad_token: 0, unk_token: 1}
+        self._id_to_token: Optional[List[Any]] = [pad_token, unk_token]
+        self.counts: Optional[List[int]] = [0, 0]
+        self.pad_id = 0
+        self.unk_id = 1
+
+        # frozen representation
+        self._keys: Optional[np.ndarray] = None  # S[V], sorted
+        self._key_ids: Optional[np.ndarray] = None  # int64[V], id of keys[i]
+        self._id_pos: Optional[np.ndarray] = None  # int64[V], position of id in keys
+
+    @property
+    def frozen(self) -> bool:
+        return self._keys is not None
+
+    @property
+    def id_to_token(self) -> List[Any]:
+        if self._id_to_token is None:
+            self._id_to_token = [token.decode("utf-8") for token in self._keys[self._id_pos]]
+        return self._id_to_token
+
+    def add(self, token: Optional[Any]) -> int:
+        if token is None:
+            return self.unk_id
+        if self.frozen:
+            return int(self.encode_batch([token])[0])
+        idx = self.token_to_id.get(token)
+        if idx is None:
+            idx = len(self._id_to_token)
+            self.token_to_id[token] = idx
+            self._id_to_token.append(token)
+            self.counts.append(0)
+        self.counts[idx] += 1
+        return idx
+
+    def encode(self, tokens: Iterable[Optional[Any]], grow: bool = True) -> List[int]:
+        if self.frozen:
+            return self.encode_batch(list(tokens)).tolist()
+        ids = []
+        for tok in tokens:
+            if grow:
+                ids.append(self.add(tok))
+            else:
+                ids.append(self.token_to_id.get(tok, self.unk_id))
+        return ids
+
+    def encode_batch(self, tokens: Union[Sequence[Optional[Any]], np.ndarray, pa.Array, pa.ChunkedArray], grow: bool = False) -> np.ndarray:
+        """Ids for a whole array of tokens as int64.
+
+        Frozen: one binary search over the sorted token array. Not frozen:
+        dict lookups (growing if ``grow``), kept for incremental building.
+        """
+
+        if not self.frozen:
+            if isinstance(tokens, (pa.Array, pa.ChunkedArray)):
+                tokens = tokens.to_pylist()
+            return np.asarray(self.encode(tokens, grow=grow), dtype=np.int64).reshape(-1)
+
+        values, valid = _utf8_array(tokens)
+        if not len(values):
+            return np.empty(0, dtype=np.int64)
+        pos = np.searchsorted(self._keys, values)
+        pos = np.minimum(pos, len(self._keys) - 1)
+        hit = valid & (self._keys[pos] == values)
+        return np.where(hit, self._key_ids[pos], self.unk_id)
+
+    def decode(self, ids: Union[Sequence[int], np.ndarray]) -> List[str]:
+        ids = np.asarray(ids, dtype=np.int64)
+        if self.frozen:
+            return [token.decode("utf-8") for token in self._keys[self._id_pos[ids]]]
+        return [self._id_to_token[i] for i in ids]
+
+    def prune(self, min_freq: int) -> "Vocabulary":
+        """New frozen vocabulary without tokens seen fewer than min_freq times.
+
+        Surviving tokens keep their relative order; ids are renumbered
+        densely after pad/unk.
+        """
+
+        if self.counts is None:
+            raise ValueError("token counts are unavailable for a loaded vocabulary")
+        counts = np.asarray(self.counts, dtype=np.int64)
+        keep = np.flatnonzero(counts >= min_freq)
+        keep = keep[keep > self.unk_id]
+        tokens = [self.id_to_token[i] for i in keep]
+        return Vocabulary.from_tokens(tokens, counts[keep], self.pad_token, self.unk_token)
+
+    def freeze(self) -> "Vocabulary":
+        """Switch to the array-backed representation (in place)."""
+
+        if self.frozen:
+            return self
+        tokens, _ = _utf8_array(self._id_to_token)
+        self._set_arrays(tokens)
+        self.token_to_id = None
+        return self
+
+    def _set_arrays(self, tokens: np.ndarray) -> None:
+        order = np.argsort(tokens, kind="stable")
+        keys = tokens[order]
+        if len(keys) > 1 and np.any(keys[1:] == keys[:-1]):
+            raise ValueError("tokens collide after conversion to UTF-8 strings")
+        id_pos = np.empty(len(order), dtype=np.int64)
+        id_pos[order] = np.arange(len(order))
+        self._keys = keys
+        self._key_ids = order.astype(np.int64)
+        self._id_pos = id_pos
+
+    @classmethod
+    def from_tokens(
+        cls,
+        tokens: Union[Sequence[Any], np.ndarray],
+        counts: Optional[Union[Sequence[int], np.ndarray]] = None,
+        pad_token: str = "<pad>",
+        unk_token: str = "<unk>",
+    ) -> "Vocabulary":
+        """Frozen vocabulary with ids 2.. assigned to ``tokens`` in order.
+
+        A leading pad/unk pair (as in SequenceArrays.*_tokens) is skipped.
+        """
+
+        tokens = list(tokens)
+        if len(tokens) >= 2 and tokens[0] == pad_token and tokens[1] == unk_token:
+            tokens = tokens[2:]
+            counts = None if counts is None else list(counts)[2:]
+        vocab = cls(pad_token, unk_token)
+        vocab._id_to_token = [pad_token, unk_token] + tokens
+        vocab.counts = [0, 0] + (list(map(int, counts)) if counts is not None else [0] * len(tokens))
+        return vocab.freeze()
+
+    @classmethod
+    def build(
+        cls,
+        tokens: Union[Sequence[Optional[Any]], pa.Array, pa.ChunkedArray],
+        min_freq: int = 1,
+        pad_token: str = "<pad>",
+        unk_token: str = "<unk>",
+    ) -> "Vocabulary":
+        """Count a whole column at once and return a frozen, pruned vocabulary.
+
+        Ids follow first appearance, like repeated ``add`` calls.
+        """
+
+        column = tokens if isinstance(tokens, (pa.Array, pa.ChunkedArray)) else pa.array(tokens)
+        if not pa.types.is_string(column.type):
+            column = pc.cast(column, pa.string())
+        stats = pc.value_counts(pc.drop_null(column))
+        if isinstance(stats, pa.ChunkedArray):
+            stats = stats.combine_chunks()
+        values = stats.field("values")
+        counts = stats.field("counts").to_numpy()
+        keep = (counts >= min_freq) & ~pc.is_in(values, value_set=pa.array([pad_token, unk_token])).to_numpy(zero_copy_only=False)
+        tokens = values.filter(pa.array(keep)).to_pylist()
+        return cls.from_tokens(tokens, counts[keep], pad_token, unk_token)
+
+    def save(self, path: Union[str, Path]) -> None:
+        """Write the frozen arrays as .npy files in directory ``path``."""
+
+        if not self.frozen:
+            raise ValueError("freeze() the vocabulary before saving")
+        path = Path(path)
+        path.mkdir(parents=True, exist_ok=True)
+        np.save(path / "keys.npy", self._keys)
+        np.save(path / "key_ids.npy", self._key_ids)
+        np.save(path / "id_pos.npy", self._id_pos)
+        if self.counts is not None:
+            np.save(path / "counts.npy", np.asarray(self.counts, dtype=np.int64))
+        meta = {"pad_token": self.pad_token, "unk_token": self.unk_token, "size": len(self)}
+        (path / "vocab.json").write_text(json.dumps(meta, ensure_ascii=False), encoding="utf-8")
+
+    @classmethod
+    def load(cls, path: Union[str, Path], mmap: bool = True) -> "Vocabulary":
+        """Load a saved vocabulary; with ``mmap`` arrays are shared read-only pages."""
+
+        path = Path(path)
+        meta = json.loads((path / "vocab.json").read_text(encoding="utf-8"))
+        mode = "r" if mmap else None
+        vocab = cls(meta["pad_token"], meta["unk_token"])
+        vocab.token_to_id = None
+        vocab._id_to_token = None
+        vocab._keys = np.load(path / "keys.npy", mmap_mode=mode)
+        vocab._key_ids = np.load(path / "key_ids.npy", mmap_mode=mode)
+        vocab._id_pos = np.load(path / "id_pos.npy", mmap_mode=mode)
+        counts = path / "counts.npy"
+        vocab.counts = np.load(counts, mmap_mode=mode) if counts.exists() else None
+        return vocab
+
+    def __len__(self) -> int:
+        if self.frozen:
+            return len(self._keys)
+        return len(self._id_to_token)
+
+
+def _utf8_array(tokens: Any) -> tuple:
+    """(S-array of UTF-8 tokens, validity mask) for list/ndarray/arrow input.
+
+    Strings go through arrow and are copied from its value buffer straight
+    into a fixed-width bytes array, avoiding per-element Python encoding.
+    """
+
+    if isinstance(tokens, np.ndarray) and tokens.dtype.kind == "S":
+        return tokens.reshape(-1), np.ones(tokens.size, dtype=bool)
+
+    if isinstance(tokens, pa.ChunkedArray):
+        column = tokens.combine_chunks()
+    elif isinstance(tokens, pa.Array):
+        column = tokens
+    else:
+        values = np.asarray(tokens, dtype=object).reshape(-1) if not isinstance(tokens, np.ndarray) else tokens.reshape(-1)
+        try:
+            column = pa.array(values, from_pandas=False)
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            column = pa.array([None if value is None else str(value) for value in values], pa.string())
+    if not (pa.types.is_string(column.type) or pa.types.is_large_string(column.type)):
+        column = pc.cast(column, pa.string())
+
+    valid = column.is_valid().to_numpy(zero_copy_only=False)
+    column = pc.fill_null(column, "").cast(pa.large_binary())
+    offsets = np.frombuffer(column.buffers()[1], dtype=np.int64)[column.offset:column.offset + len(column) + 1]
+    data = np.frombuffer(column.buffers()[2], dtype=np.uint8) if column.buffers()[2] is not None else np.empty(0, np.uint8)
+    sizes = np.diff(offsets)
+    width = max(int(sizes.max()) if len(sizes) else 0, 1)
+    out = np.zeros((len(column), width), dtype=np.uint8)
+    out[np.arange(width)[None, :] < sizes[:, None]] = data[offsets[0]:offsets[-1]]
+    return out.view(f"S{width}").reshape(-1), valid
@@ -0,0 +1,236 @@
+"""Per-user profile table for the web service.
+
+Joins the dataset's ``users.pq`` (socdem_cluster, region) with the feature
+store (spend statistics, category totals) into one row per user, sorted by
+user_id. The table is written as an uncompressed Arrow IPC file next to
+sorted fixed-width keys (``profile_keys.npy`` / ``profile_key_ids.npy``), so
+the service memory-maps both and resolves a user with a binary search
+instead of loading the table.
+
+Sources are aligned by searchsorted over the union of their sorted keys
+rather than a hash join, which also keeps list columns (top categories,
+interests) out of the join.
+"""
+from __future__ import annotations
+
+import json
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Optional, Tuple, Union
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+from .models.vocab import _utf8_array
+
+# feature store columns copied into the profile
+PROFILE_FEATURES = (
+    "days",
+    "first_day",
+    "last_day",
+    "total_amount",
+    "mean_amount",
+    "median_amount",
+    "max_amount",
+    "high_spend_share",
+    "auto_day_share",
+    "home_day_share",
+)
+# flag shares that turn into interests (the enrichment rules)
+INTEREST_FLAGS = {"auto": "auto_day_share", "home": "home_day_share"}
+INCOME_LEVELS = 6
+
+
+@dataclass
+class ProfileConfig:
+    user_key: str = "user_id"
+    features: Tuple[str, ...] = PROFILE_FEATURES
+    top_categories: int = 3
+    interest_share: float = 0.25  # minimal day share of a flag to count it as an interest
+    income_column: str = "mean_amount"  # income level: population sextile of the mean daily spend
+    batch_rows: int = 1 << 20  # rows per Arrow record batch
+
+
+def _keys(column: Union[pa.Array, pa.ChunkedArray]) -> np.ndarray:
+    keys, _ = _utf8_array(column)
+    return keys
+
+
+def _sorted(table: pa.Table, key: str) -> Tuple[np.ndarray, pa.Table]:
+    keys = _keys(table[key])
+    if len(keys) < 2 or (keys[1:] > keys[:-1]).all():  # the feature store is already sorted
+        return keys, table
+    order = np.argsort(keys, kind="stable")
+    keys = keys[order]
+    if (keys[1:] == keys[:-1]).any():
+        raise ValueError(f"duplicate {key} values")
+    return keys, table.take(pa.array(order))
+
+
+def read_users(path: Union[str, Path], user_key: str = "user_id") -> pa.Table:
+    """users.pq: user_id as string, socdem_cluster and region as int16 (-1 when missing)."""
+
+    table = pq.read_table(path, columns=[user_key, "socdem_cluster", "region"])
+    columns = {"user_id": pc.cast(table[user_key], pa.string())}
+    for name in ("socdem_cluster", "region"):
+        # the notebooks read these as float with NaN for missing codes
+        values = pc.cast(table[name], pa.float64()).to_numpy(zero_copy_only=False)
+        columns[name] = pa.array(np.nan_to_num(values, nan=-1).astype(np.int16))
+    return pa.table(columns)
+
+
+def top_categories(categories: pa.Table, n: int) -> pa.Table:
+    """user_id + list of the user's ``n`` categories with the largest amount."""
+
+    cats = categories.sort_by([("user_id", "ascending"), ("amount", "descending"), ("events", "descending")])
+    users = _keys(cats["user_id"])
+    if not len(users):
+        return pa.table({"user_id": pa.array([], pa.string()), "top_categories": pa.array([], pa.list_(pa.string()))})
+    starts = np.flatnonzero(np.r_[True, users[1:] != users[:-1]])
+    rank = np.arange(len(users)) - np.repeat(starts, np.diff(np.r_[starts, len(users)]))
+    keep = np.flatnonzero(rank < n)
+    counts = np.minimum(np.diff(np.r_[starts, len(users)]), n)
+    offsets = np.r_[0, np.cumsum(counts)].astype(np.int32)
+    values = cats["category"].combine_chunks().take(pa.array(keep))
+    return pa.table({
+        "user_id": cats["user_id"].combine_chunks().take(pa.array(starts)),
+        "top_categories": pa.ListArray.from_arrays(pa.array(offsets), values),
+    })
+
+
+def income_thresholds(values: np.ndarray, levels: int = INCOME_LEVELS) -> list:
+    """Population quantiles splitting ``values`` into ``levels`` equal groups."""
+
+    if not len(values):
+        return []
+    return np.quantile(values, np.arange(1, levels) / levels).tolist()
+
+
+def interests(top: pa.Array, shares: Dict[str, np.ndarray], threshold: float) -> pa.Array:
+    """Top categories followed by the flag interests whose day share reaches ``threshold``.
+
+    Built from list offsets: every value gets its destination slot, then one take.
+    """
+
+    top_len = pc.fill_null(pc.list_value_length(top), 0).to_numpy(zero_copy_only=False).astype(np.int64)
+    flags = [share >= threshold for share in shares.values()]
+    new_len = top_len + sum((hit.astype(np.int64) for hit in flags), np.zeros(len(top), dtype=np.int64))
+    offsets = np.r_[0, np.cumsum(new_len)]
+    flat = pc.list_flatten(top)
+    source = pa.concat_arrays([flat.cast(pa.string()), pa.array(list(shares), pa.string())])
+
+    index = np.empty(offsets[-1], dtype=np.int64)
+    top_start = np.r_[0, np.cumsum(top_len)][:-1]
+    index[np.repeat(offsets[:-1] - top_start, top_len) + np.arange(len(flat))] = np.arange(len(flat))
+    slot = offsets[:-1] + top_len
+    for k, hit in enumerate(flags):
+        index[slot[hit]] = len(flat) + k
+        slot = slot + hit
+    return pa.ListArray.from_arrays(pa.array(offsets.astype(np.int32)), source.take(pa.array(index)))
+
+
+def profile_sources(
+    store: Optional[Union[str, Path]] = None,
+    users_path: Optional[Union[str, Path]] = None,
+    cfg: Optional[ProfileConfig] = None,
+) -> list:
+    """[(sorted keys, table in key order)] for users.pq, store features and top categories."""
+
+    cfg = cfg or ProfileConfig()
+    sources = []
+    if users_path is not None:
+        sources.append(_sorted(read_users(users_path, cfg.user_key), "user_id"))
+    if store is not None:
+        store = Path(store)
+        names = set(pq.read_schema(store / "users.parquet").names)
+        features = pq.read_table(store / "users.parquet", columns=["user_id", *(f for f in cfg.features if f in names)])
+        sources.append(_sorted(features, "user_id"))
+        categories = pq.read_table(store / "categories.parquet", columns=["user_id", "category", "amount", "events"])
+        sources.append(_sorted(top_categories(categories, cfg.top_categories), "user_id"))
+    if not sources:
+        raise ValueError("nothing to build: pass the feature store and/or users.pq")
+    return sources
+
+
+def build_profiles(
+    path: Union[str, Path],
+    store: Optional[Union[str, Path]] = None,
+    users_path: Optional[Union[str, Path]] = None,
+    cfg: Optional[ProfileConfig] = None,
+) -> Dict[str, Path]:
+    """Writes profiles.arrow (uncompressed, mmap-able) + profile_keys.npy / profile_key_ids.npy.
+
+    Rows cover the union of users in the sources and follow the sorted keys;
+    the output is assembled and written one record batch at a time. With
+    users.pq, socdem_cluster is also written as profile_clusters.npy (int16,
+    -1: unknown), so the recommendation engine picks candidates by the same
+    segment the profile shows without reading the table.
+    """
+
+    cfg = cfg or ProfileConfig()
+    sources = profile_sources(store, users_path, cfg)
+    all_keys = np.unique(np.concatenate([keys for keys, _ in sources]))
+    positions = []
+    for keys, _ in sources:
+        pos = np.full(len(all_keys), -1, dtype=np.int64)
+        pos[np.searchsorted(all_keys, keys)] = np.arange(len(keys))
+        positions.append(pos)
+
+    meta = {}
+    thresholds = None
+    for _, table in sources:
+        if cfg.income_column in table.column_names:
+            thresholds = income_thresholds(pc.drop_null(table[cfg.income_column]).to_numpy())
+            meta["income_thresholds"] = thresholds
+
+    socdem = np.full(len(all_keys), -1, dtype=np.int16)
+
+    def batch(start: int, stop: int) -> pa.RecordBatch:
+        columns = {}
+        for (_, table), pos in zip(sources, positions):
+            rows = pos[start:stop]
+            rows = pa.array(rows, mask=rows < 0)
+            for name in table.column_names[1:]:
+                columns[name] = table[name].take(rows).combine_chunks()
+        for name in ("socdem_cluster", "region"):
+            if name in columns:
+                columns[name] = pc.fill_null(columns[name], -1)
+        if "socdem_cluster" in columns:
+            socdem[start:stop] = columns["socdem_cluster"].to_numpy(zero_copy_only=False)
+        if thresholds is not None:
+            spend = columns[cfg.income_column]
+            levels = np.searchsorted(thresholds, pc.fill_null(spend, 0.0).to_numpy(zero_copy_only=False), side="right")
+            valid = spend.is_valid().to_numpy(zero_copy_only=False)
+            columns["income_level"] = pa.array(np.where(valid, levels, -1).astype(np.int8))
+        if "top_categories" in columns:
+            shares = {
+                flag: pc.fill_null(columns[column], 0.0).to_numpy(zero_copy_only=False)
+                for flag, column in INTEREST_FLAGS.items()
+                if column in columns
+            }
+            columns["interests"] = interests(columns["top_categories"], shares, cfg.interest_share)
+        return pa.RecordBatch.from_pydict(columns)
+
+    path = Path(path)
+    path.mkdir(parents=True, exist_ok=True)
+    files = {
+        "profiles": path / "profiles.arrow",
+        "profile_keys": path / "profile_keys.npy",
+        "profile_key_ids": path / "profile_key_ids.npy",
+    }
+    tmp = files["profiles"].with_suffix(".arrow.tmp")
+    first = batch(0, min(cfg.batch_rows, len(all_keys)))
+    schema = first.schema.with_metadata({"profiles": json.dumps(meta)})
+    with pa.OSFile(str(tmp), "wb") as sink, pa.ipc.new_file(sink, schema) as writer:
+        writer.write_batch(first.replace_schema_metadata(schema.metadata))
+        for start in range(cfg.batch_rows, len(all_keys), cfg.batch_rows):
+            writer.write_batch(batch(start, start + cfg.batch_rows).replace_schema_metadata(schema.metadata))
+    tmp.replace(files["profiles"])
+    np.save(files["profile_keys"], all_keys)
+    np.save(files["profile_key_ids"], np.arange(len(all_keys), dtype=np.int64))
+    if "socdem_cluster" in first.schema.names:
+        files["profile_clusters"] = path / "profile_clusters.npy"
+        np.save(files["profile_clusters"], socdem)
+    return files
@@ -0,0 +1,60 @@
+"""Бенчмарк загрузки: построчный путь HF datasets против колоночного pyarrow.
+
+Пример:
+python3 -m recsys.scripts.bench_ingest --data-files "data/marketplace/events/*.pq" --max-days 30
+"""
+from __future__ import annotations
+
+import argparse
+import time
+from dataclasses import replace
+from typing import Callable, Iterable, Optional
+
+from recsys.models import TECDStreamConfig, stream_filtered_batches, stream_filtered_rows
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Compare row vs columnar T-ECD ingestion on local parquet.")
+    parser.add_argument("--data-files", nargs="+", required=True, help="Локальные parquet-файлы/паттерны.")
+    parser.add_argument("--domains", nargs="+", default=None, help="Домены для фильтрации.")
+    parser.add_argument("--exclude-actions", nargs="+", default=["VIEW", "view"], help="Действия для исключения.")
+    parser.add_argument("--max-days", type=int, default=100, help="Остановиться после N уникальных дней.")
+    parser.add_argument("--batch-size", type=int, default=65_536, help="Размер record batch.")
+    parser.add_argument(
+        "--skip-rows",
+        action="store_true",
+        help="Не гонять построчный путь (он медленный на полных дампах).",
+    )
+    return parser.parse_args()
+
+
+def _timed(name: str, run: Callable[[], Iterable[int]]) -> Optional[int]:
+    started = time.perf_counter()
+    total = sum(run())
+    elapsed = time.perf_counter() - started
+    print(f"{name:<18} {total:>12,} строк  {elapsed:8.2f} с  {total / max(elapsed, 1e-9):>14,.0f} строк/с")
+    return total
+
+
+def main(args: Optional[argparse.Namespace] = None) -> None:
+    args = args or parse_args()
+    cfg = TECDStreamConfig(
+        data_files=args.data_files,
+        domains=set(args.domains) if args.domains else None,
+        exclude_actions=set(args.exclude_actions),
+        max_days=args.max_days,
+        batch_size=args.batch_size,
+    )
+
+    totals = []
+    if not args.skip_rows:
+        totals.append(_timed("rows (datasets)", lambda: (1 for _ in stream_filtered_rows(cfg))))
+    totals.append(_timed("columnar → rows", lambda: (1 for _ in stream_filtered_rows(replace(cfg, columnar=True)))))
+    totals.append(_timed("columnar batches", lambda: (b.num_rows for b in stream_filtered_batches(cfg))))
+
+    if len(set(totals)) > 1:
+        raise SystemExit(f"Число строк различается между путями: {totals}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""Бенчмарк top-k поиска по весам product_head: точный перебор vs IVF.
+
+Пример:
+python3 -m recsys.scripts.bench_retrieval --checkpoint artifacts/gru/checkpoint.pt --nprobe 4 8 16
+python3 -m recsys.scripts.bench_retrieval --products 1000000 --dim 64   # синтетические веса
+
+Печатает recall@k относительно точного поиска и задержку на запрос.
+"""
+from __future__ import annotations
+
+import argparse
+import time
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+
+from recsys.models.retrieval import ExactIndex, build_index, evaluate_index, product_head_arrays
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Benchmark ANN retrieval over product-head weights.")
+    parser.add_argument("--checkpoint", type=Path, default=None, help="checkpoint.pt из train_gru (иначе синтетика).")
+    parser.add_argument("--products", type=int, default=200_000, help="Число продуктов для синтетических весов.")
+    parser.add_argument("--dim", type=int, default=64, help="Размерность для синтетических весов.")
+    parser.add_argument("--backend", type=str, default="ivf", help="Бэкенд индекса (ivf, exact или зарегистрированный).")
+    parser.add_argument("--nlist", type=int, default=None, help="Число ячеек IVF (по умолчанию ~sqrt(N)).")
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[4, 8, 16, 32], help="Сколько ячеек просматривать.")
+    parser.add_argument("--k", type=int, default=10, help="Сколько продуктов возвращать.")
+    parser.add_argument("--queries", type=int, default=500, help="Число запросов.")
+    parser.add_argument("--seed", type=int, default=0, help="Seed.")
+    return parser.parse_args()
+
+
+def _synthetic(products: int, dim: int, queries: int, rng: np.random.Generator):
+    # кластеризованные веса ближе к обученным, чем равномерный шум
+    centers = rng.normal(size=(256, dim)).astype(np.float32)
+    weights = centers[rng.integers(0, 256, products)] + 0.5 * rng.normal(size=(products, dim)).astype(np.float32)
+    bias = 0.1 * rng.normal(size=products).astype(np.float32)
+    hidden = centers[rng.integers(0, 256, queries)] + 0.5 * rng.normal(size=(queries, dim)).astype(np.float32)
+    return weights, bias, hidden
+
+
+def main(args: Optional[argparse.Namespace] = None) -> None:
+    args = args or parse_args()
+    rng = np.random.default_rng(args.seed)
+
+    if args.checkpoint is not None:
+        import torch
+
+        from recsys.models import ModelConfig, NextActionGRU
+
+        state = torch.load(args.checkpoint, map_location="cpu", weights_only=False)
+        model = NextActionGRU(ModelConfig(**state["model_config"]))
+        model.load_state_dict(state["model"])
+        weights, bias = product_head_arrays(model)
+        # запросы — случайные скрытые состояния GRU (tanh-диапазон)
+        queries = np.tanh(rng.normal(size=(args.queries, weights.shape[1]))).astype(np.float32)
+    else:
+        weights, bias, queries = _synthetic(args.products, args.dim, args.queries, rng)
+
+    exact = ExactIndex(weights, bias)
+    start = time.perf_counter()
+    kwargs = {"nlist": args.nlist} if args.backend == "ivf" else {}
+    index = build_index(args.backend, weights, bias, **kwargs)
+    print(f"{args.backend}: {len(weights)} продуктов, индекс построен за {time.perf_counter() - start:.1f} с")
+
+    for nprobe in args.nprobe if args.backend == "ivf" else [None]:
+        search_kwargs = {"nprobe": nprobe} if nprobe else {}
+        stats = evaluate_index(index, exact, queries, args.k, **search_kwargs)
+        print(
+            f"nprobe={nprobe}: recall@{args.k}={stats['recall']:.3f} "
+            f"exact {stats['exact_ms_per_query']:.2f} ms/q, approx {stats['approx_ms_per_query']:.2f} ms/q"
+        )
+
+
+if __name__ == "__main__":
+    main()
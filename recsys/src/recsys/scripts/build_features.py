@@ -0,0 +1,75 @@
+"""CLI: инкрементальное обновление пользовательских фичей (recsys.features).
+
+Пример:
+python3 -m recsys.scripts.build_features --data-files "data/raw/marketplace/events/*.pq" --store artifacts/features
+
+Новые шарды обрабатываются по порядку первого дня (по статистикам parquet), уже загруженные
+в хранилище пропускаются, поэтому ежедневный запуск на том же шаблоне читает только новые файлы. Последний день остаётся
+открытым до следующего запуска (или --flush в конце данных).
+"""
+from __future__ import annotations
+
+import argparse
+import time
+from pathlib import Path
+from typing import Optional
+
+from recsys.features import FeatureConfig, FeatureStore
+from recsys.models import TECDStreamConfig, stream_filtered_batches
+from recsys.models.sharded import resolve_shards, shard_days
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Incrementally update the per-user feature store from event shards.")
+    parser.add_argument("--data-files", nargs="+", required=True, help="Локальные parquet-шарды или glob-шаблоны.")
+    parser.add_argument("--store", type=Path, default=Path("artifacts/features"), help="Каталог хранилища фичей.")
+    parser.add_argument("--domains", nargs="+", default=None, help="Домены для фильтрации. Если не указаны — все.")
+    parser.add_argument("--user-key", type=str, default="user_id", help="Колонка пользователя.")
+    parser.add_argument("--timestamp-key", type=str, default="timestamp", help="Колонка времени.")
+    parser.add_argument("--anchor-date", type=str, default="2023-01-01", help="Дата отсчёта для timestamp-смещений.")
+    parser.add_argument("--batch-size", type=int, default=262_144, help="Размер record batch при чтении.")
+    parser.add_argument("--flush", action="store_true", help="Закрыть и последний (открытый) день.")
+    return parser.parse_args()
+
+
+def main(args: Optional[argparse.Namespace] = None) -> None:
+    args = args or parse_args()
+    cfg = None  # у существующего хранилища конфиг берётся из state.json
+    if not (args.store / FeatureStore.STATE_FILE).exists():
+        cfg = FeatureConfig(user_key=args.user_key, timestamp_key=args.timestamp_key, anchor_date=args.anchor_date)
+    store = FeatureStore(args.store, cfg)
+
+    def stream_cfg(shard: str) -> TECDStreamConfig:
+        return TECDStreamConfig(
+            data_files=[shard],
+            domains=set(args.domains) if args.domains else None,
+            exclude_actions=set(),  # исключение view делает FeatureConfig
+            max_days=None,
+            user_key=args.user_key,
+            timestamp_key=args.timestamp_key,
+            columnar=True,
+            batch_size=args.batch_size,
+        )
+
+    start = time.perf_counter()
+    shards = [shard for shard in resolve_shards(args.data_files) if shard not in store.sources]
+    # Шарды разных доменов (*/events/*.pq) чередуются по первому дню: уже закрытый день
+    # пользователя хранилище отклоняет, поэтому порядок по времени важен
+    first_day = {shard: min(shard_days(shard, stream_cfg(shard)), default="9999-12-31") for shard in shards}
+    for shard in sorted(shards, key=first_day.get):
+        tick = time.perf_counter()
+        stats = store.ingest(stream_filtered_batches(stream_cfg(shard)), source=shard)
+        late = f", отклонено {stats['late_events']} событий уже закрытых дней" if stats["late_events"] else ""
+        print(
+            f"{shard}: {stats['events']} событий, закрыто {stats['folded_days']} user-дней "
+            f"у {stats['users']} пользователей за {time.perf_counter() - tick:.1f} с{late}"
+        )
+    if args.flush:
+        store.flush()
+    store.save()
+    users = store.users.num_rows if store.users is not None else 0
+    print(f"Хранилище {args.store}: {users} пользователей, обновление заняло {time.perf_counter() - start:.1f} с")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+"""CLI: таблица профилей пользователей для веб-сервиса (recsys.profiles).
+
+Пример:
+python3 -m recsys.scripts.build_profiles --users data/users.pq --store artifacts/features --output artifacts/profiles
+
+users.pq (socdem_cluster, region) и хранилище фичей (траты, топ-категории) сводятся в одну
+строку на пользователя, отсортированную по user_id. Результат — profiles.arrow,
+profile_keys/profile_key_ids.npy и (с --users) profile_clusters.npy — socdem_cluster, по которому
+движок отбирает кандидатов; публикация: python -m app.artifacts publish --profiles DIR.
+"""
+from __future__ import annotations
+
+import argparse
+import time
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+import pyarrow as pa
+
+from recsys.profiles import ProfileConfig, build_profiles
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Build the sorted, memory-mappable per-user profile table.")
+    parser.add_argument("--users", type=Path, default=None, help="users.pq датасета (socdem_cluster, region).")
+    parser.add_argument("--store", type=Path, default=None, help="Каталог хранилища фичей (build_features).")
+    parser.add_argument("--output", type=Path, default=Path("artifacts/profiles"), help="Куда сохранить профили.")
+    parser.add_argument("--user-key", type=str, default="user_id", help="Колонка пользователя в users.pq.")
+    parser.add_argument("--top-categories", type=int, default=3, help="Сколько категорий трат держать в профиле.")
+    parser.add_argument("--interest-share", type=float, default=0.25, help="Доля дней с флагом (auto/home), чтобы считать его интересом.")
+    parser.add_argument("--batch-rows", type=int, default=1 << 20, help="Строк в record batch Arrow-файла.")
+    return parser.parse_args()
+
+
+def main(args: Optional[argparse.Namespace] = None) -> None:
+    args = args or parse_args()
+    if args.users is None and args.store is None:
+        raise SystemExit("Укажите --users и/или --store")
+    cfg = ProfileConfig(
+        user_key=args.user_key,
+        top_categories=args.top_categories,
+        interest_share=args.interest_share,
+        batch_rows=args.batch_rows,
+    )
+    start = time.perf_counter()
+    files = build_profiles(args.output, store=args.store, users_path=args.users, cfg=cfg)
+    rows = len(np.load(files["profile_keys"], mmap_mode="r"))
+    with pa.memory_map(str(files["profiles"])) as source:
+        names = pa.ipc.open_file(source).schema.names
+    size = files["profiles"].stat().st_size / 2**20
+    print(f"Профили {rows} пользователей ({size:.1f} МБ, колонки: {', '.join(names)}) за {time.perf_counter() - start:.1f} с")
+
+
+if __name__ == "__main__":
+    main()
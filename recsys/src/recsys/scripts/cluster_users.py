@@ -0,0 +1,118 @@
+"""CLI: кластеризация всех пользователей хранилища фичей (recsys.clustering).
+
+Пример:
+python3 -m recsys.scripts.cluster_users --store artifacts/features --users data/users.pq --als artifacts/als --output artifacts/clusters
+
+Scaler и PCA считаются за один проход по users.parquet, mini-batch KMeans — за --epochs
+проходов; затем все пользователи переназначаются ближайшему центроиду. В --output
+пишутся модель (centroids.npy и др.) и cluster_keys/cluster_key_ids/clusters.npy,
+которые публикуются в веб-сервис: python -m app.artifacts publish --clusters DIR.
+С --model уже обученная модель только переназначает кластеры.
+
+Номера центроидов k-means произвольны, поэтому они сопоставляются socdem_cluster из users.pq
+(--users, венгерский алгоритм по таблице сопряжённости). В clusters.npy пишутся уже id
+групп socdem_cluster.json, а сопоставление сохраняется в clustering.json.
+
+С --als дополнительно пишется cluster_factors.npy — средний ALS-фактор пользователей каждого
+кластера: из него веб-сервис строит факторы продуктов и векторы пользователей без факторов.
+"""
+from __future__ import annotations
+
+import argparse
+import time
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+
+from recsys.clustering import (
+    DEFAULT_FEATURES,
+    ClusterModel,
+    ClusteringConfig,
+    align_clusters,
+    assign_clusters,
+    cluster_factor_means,
+    fit_clusters,
+    save_assignments,
+    socdem_labels,
+    store_batches,
+    store_features,
+)
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Fit user clusters over the feature store and assign every user.")
+    parser.add_argument("--store", type=Path, default=Path("artifacts/features"), help="Каталог хранилища фичей.")
+    parser.add_argument("--output", type=Path, default=Path("artifacts/clusters"), help="Куда сохранить модель и назначения.")
+    parser.add_argument("--model", type=Path, default=None, help="Готовая модель: только переназначить кластеры.")
+    parser.add_argument("--features", nargs="+", default=list(DEFAULT_FEATURES), help="Фичи пользователя для кластеризации.")
+    parser.add_argument("--clusters", type=int, default=5, help="Число кластеров (socdem_cluster.json).")
+    parser.add_argument("--components", type=int, default=10, help="Число главных компонент.")
+    parser.add_argument("--epochs", type=int, default=3, help="Проходов mini-batch KMeans.")
+    parser.add_argument("--batch-size", type=int, default=65_536, help="Пользователей в чанке.")
+    parser.add_argument("--seed", type=int, default=0, help="Seed инициализации k-means++.")
+    parser.add_argument("--user-key", type=str, default="user_id", help="Колонка пользователя.")
+    parser.add_argument(
+        "--users",
+        type=Path,
+        default=None,
+        help="users.pq датасета: центроиды сопоставляются его socdem_cluster (обязательно при обучении).",
+    )
+    parser.add_argument(
+        "--als",
+        type=Path,
+        default=None,
+        help="Выгрузка train_als: средние факторы пользователей по кластерам -> cluster_factors.npy.",
+    )
+    return parser.parse_args()
+
+
+def main(args: Optional[argparse.Namespace] = None) -> None:
+    args = args or parse_args()
+    start = time.perf_counter()
+    if args.model:
+        model = ClusterModel.load(args.model)
+    else:
+        cfg = ClusteringConfig(
+            features=store_features(args.store, args.features),
+            n_components=args.components,
+            n_clusters=args.clusters,
+            epochs=args.epochs,
+            batch_size=args.batch_size,
+            seed=args.seed,
+        )
+        if args.users is None:
+            raise SystemExit("Укажите --users: без сопоставления с socdem_cluster номера кластеров k-means произвольны")
+        model = fit_clusters(lambda: store_batches(args.store, cfg.features, cfg.batch_size), cfg)
+        explained = sum(model.meta["explained_variance_ratio"])
+        print(f"Модель: {len(model.features)} фичей, PCA объясняет {explained:.1%}, обучение {time.perf_counter() - start:.1f} с")
+    if args.users is not None:
+        batches = store_batches(args.store, [args.user_key, *model.features], args.batch_size)
+        label_map = align_clusters(model, batches, socdem_labels(args.users, args.user_key), user_key=args.user_key)
+        print(f"Центроиды -> socdem_cluster: {label_map.tolist()}, совпадение {model.meta['label_agreement']:.1%}")
+        model.save(args.output)
+    if model.label_map is None:
+        raise SystemExit("У модели нет сопоставления с socdem_cluster: запустите с --users")
+
+    tick = time.perf_counter()
+    users, clusters = assign_clusters(
+        model, store_batches(args.store, [args.user_key, *model.features], args.batch_size), user_key=args.user_key
+    )
+    files = save_assignments(args.output, users, clusters, model.label_map)
+    sizes = np.bincount(clusters, minlength=len(model.centroids))
+    print(f"Назначено {len(clusters)} пользователей за {time.perf_counter() - tick:.1f} с; размеры кластеров: {sizes.tolist()}")
+
+    if args.als is not None:
+        means, counts = cluster_factor_means(
+            np.load(args.als / "user_factors.npy", mmap_mode="r"),
+            np.load(args.als / "users" / "keys.npy", mmap_mode="r"),
+            np.load(args.als / "users" / "key_ids.npy", mmap_mode="r"),
+            np.load(files["cluster_keys"], mmap_mode="r"),
+            np.load(files["clusters"], mmap_mode="r"),
+        )
+        np.save(args.output / "cluster_factors.npy", means)
+        print(f"Факторы кластеров {means.shape}: пользователей с ALS-факторами по кластерам {counts.tolist()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""CLI: офлайн-оценка рекомендателя на временном сплите выгрузки T-ECD.
+
+Пример:
+python3 -m recsys.scripts.evaluate_tecd --input data/tecd_subset.parquet --item-key item_id --test-days 7 --k 10
+
+Последние --test-days дней выгрузки (stream_tecd / extract_shards) — тест, остальное — обучение.
+Считаются recall@k, NDCG@k, MAP@k, coverage и novelty (recsys.eval).
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import time
+from pathlib import Path
+from typing import Optional
+
+from recsys.eval import PopularModel, SplitConfig, build_ground_truth, evaluate, read_extract, time_split
+from recsys.models.als import ALSConfig, ALSModel, InteractionConfig
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Offline top-k evaluation on a time split of a T-ECD extract.")
+    parser.add_argument("--input", type=Path, nargs="+", required=True, help="Parquet-файлы или каталог выгрузки.")
+    parser.add_argument("--model", choices=["popular", "als"], default="popular", help="Какую модель оценивать.")
+    parser.add_argument("--user-key", type=str, default="user_id", help="Колонка пользователя.")
+    parser.add_argument("--item-key", type=str, default="product_id", help="Колонка товара.")
+    parser.add_argument("--timestamp-key", type=str, default="timestamp", help="Колонка времени.")
+    parser.add_argument("--test-days", type=int, default=7, help="Сколько последних дней отдать в тест.")
+    parser.add_argument("--cutoff", type=str, default=None, help="Явная граница сплита (ISO), вместо --test-days.")
+    parser.add_argument("--k", type=int, default=10, help="Длина списка рекомендаций.")
+    parser.add_argument("--chunk-size", type=int, default=50_000, help="Пользователей в одном чанке оценки.")
+    parser.add_argument("--factors", type=int, default=64, help="ALS: размерность факторов.")
+    parser.add_argument("--iterations", type=int, default=15, help="ALS: число итераций.")
+    parser.add_argument("--output", type=Path, default=None, help="Сохранить метрики в JSON.")
+    return parser.parse_args()
+
+
+def main(args: Optional[argparse.Namespace] = None) -> None:
+    args = args or parse_args()
+    cfg = SplitConfig(
+        user_key=args.user_key,
+        item_key=args.item_key,
+        timestamp_key=args.timestamp_key,
+        test_days=args.test_days,
+        cutoff=args.cutoff,
+    )
+
+    start = time.perf_counter()
+    table = read_extract(args.input if len(args.input) > 1 else args.input[0])
+    train, test, cutoff = time_split(table, cfg)
+    truth = build_ground_truth(train, test, cfg)
+    print(f"Сплит по {cutoff}: train {train.num_rows}, test {test.num_rows} событий, {len(truth)} пользователей в тесте")
+
+    if args.model == "als":
+        interaction_cfg = InteractionConfig(user_key=args.user_key, item_key=args.item_key)
+        als_cfg = ALSConfig(factors=args.factors, iterations=args.iterations)
+        model, _ = ALSModel.train(train.to_batches(), interaction_cfg, als_cfg)
+    else:
+        model = PopularModel.fit(train, cfg, k_max=args.k)
+    metrics = evaluate(model, truth, k=args.k, chunk_size=args.chunk_size)
+    metrics["total_seconds"] = time.perf_counter() - start
+    print(json.dumps(metrics, ensure_ascii=False, indent=2))
+
+    if args.output is not None:
+        args.output.parent.mkdir(parents=True, exist_ok=True)
+        args.output.write_text(json.dumps(metrics, ensure_ascii=False, indent=2), encoding="utf-8")
+
+
+if __name__ == "__main__":
+    main()
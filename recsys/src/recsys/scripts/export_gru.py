@@ -0,0 +1,49 @@
+"""CLI: экспорт NextActionGRU в пошаговый граф для онлайн-инференса.
+
+Пример:
+python3 -m recsys.scripts.export_gru --checkpoint artifacts/gru/checkpoint.pt --torchscript artifacts/gru/step.pt
+
+Экспортируется один шаг GRU: (action_id, seasonal, product_id, hidden) -> (логиты, новый hidden),
+так что на каждое новое событие пользователя тратится O(1), а не прогон всей истории.
+Головы action/product динамически квантуются в int8 (--no-quantize, чтобы отключить).
+"""
+from __future__ import annotations
+
+import argparse
+from pathlib import Path
+from typing import Optional
+
+from recsys.models import ModelConfig, NextActionGRU
+from recsys.models.inference import export_onnx, export_torchscript
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Export a single-step NextActionGRU graph for serving.")
+    parser.add_argument("--checkpoint", type=Path, required=True, help="checkpoint.pt из train_gru.")
+    parser.add_argument("--torchscript", type=Path, default=None, help="Куда сохранить TorchScript.")
+    parser.add_argument("--onnx", type=Path, default=None, help="Куда сохранить ONNX (нужен пакет onnx).")
+    parser.add_argument("--no-quantize", action="store_true", help="Не квантовать головы в int8.")
+    return parser.parse_args()
+
+
+def main(args: Optional[argparse.Namespace] = None) -> None:
+    args = args or parse_args()
+    if args.torchscript is None and args.onnx is None:
+        raise SystemExit("Укажи --torchscript и/или --onnx.")
+
+    import torch
+
+    state = torch.load(args.checkpoint, map_location="cpu", weights_only=False)
+    model = NextActionGRU(ModelConfig(**state["model_config"]))
+    model.load_state_dict(state["model"])
+    model.eval()
+
+    quantize = not args.no_quantize
+    if args.torchscript is not None:
+        print(f"TorchScript: {export_torchscript(model, args.torchscript, quantize=quantize)}")
+    if args.onnx is not None:
+        print(f"ONNX: {export_onnx(model, args.onnx, quantize=quantize)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""CLI для параллельной выборки T-ECD по локальным parquet-шардам.
+
+Пример:
+python3 -m recsys.scripts.extract_shards --data-files "data/raw/events/*.pq" --max-days 30 --workers 8 --output data/tecd_shards
+
+Каждый шард фильтруется в отдельном процессе колоночным путём. Граница --max-days
+глобальная: её заранее считаем по дням, которые остаются после фильтров --domains/--exclude-actions
+(при фильтрах читаются только колонки дня и фильтров, без них — статистики row group, если они
+указывают на один день), поэтому воркерам не нужно синхронизироваться. На выходе part-NNNNN.parquet по шарду
+(в порядке шардов); с --merge — ещё и один общий файл.
+"""
+from __future__ import annotations
+
+import argparse
+import time
+from pathlib import Path
+from typing import Optional
+
+from recsys.models import TECDStreamConfig
+from recsys.models.sharded import extract_shards, merge_outputs
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Parallel T-ECD extraction over local parquet shards.")
+    parser.add_argument(
+        "--data-files",
+        nargs="+",
+        required=True,
+        help="Локальные parquet-шарды или glob-паттерны (в кавычках).",
+    )
+    parser.add_argument(
+        "--domains",
+        nargs="+",
+        default=None,
+        help="Домены для фильтрации (через пробел). Если не указаны — все.",
+    )
+    parser.add_argument(
+        "--exclude-actions",
+        nargs="+",
+        default=["VIEW", "view"],
+        help="Действия для исключения (по умолчанию VIEW/view).",
+    )
+    parser.add_argument(
+        "--max-days",
+        type=int,
+        default=100,
+        help="Оставить N самых ранних дней по всем шардам, считая только дни с событиями после фильтров (0 — без ограничения).",
+    )
+    parser.add_argument(
+        "--domain-value",
+        type=str,
+        default=None,
+        help="Проставить это значение в поле domain, если его нет в строках.",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="Число процессов (по умолчанию — число CPU).",
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=65_536,
+        help="Размер record batch при чтении шарда.",
+    )
+    parser.add_argument(
+        "--row-group-size",
+        type=int,
+        default=100_000,
+        help="Строк в одном row group выходного parquet.",
+    )
+    parser.add_argument(
+        "--output",
+        type=Path,
+        default=Path("data/tecd_shards"),
+        help="Каталог для part-NNNNN.parquet.",
+    )
+    parser.add_argument(
+        "--merge",
+        type=Path,
+        default=None,
+        help="Дополнительно склеить части в один parquet (детерминированно, в порядке шардов).",
+    )
+    return parser.parse_args()
+
+
+def main(args: Optional[argparse.Namespace] = None) -> None:
+    args = args or parse_args()
+
+    cfg = TECDStreamConfig(
+        data_files=args.data_files,
+        domain_value=args.domain_value,
+        domains=set(args.domains) if args.domains else None,
+        exclude_actions=set(args.exclude_actions),
+        max_days=args.max_days or None,
+        columnar=True,
+        batch_size=args.batch_size,
+    )
+
+    start = time.perf_counter()
+    results = extract_shards(cfg, args.output, workers=args.workers, row_group_size=args.row_group_size)
+    total = sum(result.rows for result in results)
+    if not total:
+        raise SystemExit("Не собрали ни одной строки — проверь фильтры и пути к шардам.")
+
+    for result in results:
+        print(f"{result.shard}: {result.rows} строк -> {result.output}")
+    print(f"Итого {total} строк из {len(results)} шардов за {time.perf_counter() - start:.1f} с")
+
+    if args.merge is not None:
+        merged = merge_outputs(results, args.merge, args.row_group_size)
+        print(f"Склеили {merged} строк в {args.merge}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+"""CLI для возобновляемой сборки обучающих последовательностей из T-ECD.
+
+Пример:
+python3 -m recsys.scripts.sequences_tecd --data-files "data/raw/events/*.pq" --columnar --output data/sequences
+
+Каждые --checkpoint-every входных строк текущая часть part-NNNNN.parquet закрывается,
+а смещение в потоке и истории пользователей фиксируются в <output>/state.sqlite.
+После падения тот же запуск продолжает с последнего чекпойнта: недописанная часть
+перезаписывается. В памяти держится не более --max-resident-users историй,
+остальные вытесняются в SQLite.
+"""
+from __future__ import annotations
+
+import argparse
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from recsys.models import SequenceConfig, TECDStreamConfig, stream_filtered_rows
+from recsys.models.resumable import HistoryStore, build_sequences_resumable
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Resumable T-ECD sequence building with checkpoints.")
+    parser.add_argument(
+        "--data-files",
+        nargs="+",
+        default=None,
+        help="HF-пути/локальные parquet (паттерны). Порядок файлов должен совпадать между запусками.",
+    )
+    parser.add_argument(
+        "--domains",
+        nargs="+",
+        default=None,
+        help="Домены для фильтрации (через пробел). Если не указаны — все.",
+    )
+    parser.add_argument(
+        "--exclude-actions",
+        nargs="+",
+        default=["VIEW", "view"],
+        help="Действия для исключения (по умолчанию VIEW/view).",
+    )
+    parser.add_argument(
+        "--max-days",
+        type=int,
+        default=100,
+        help="Остановиться после N уникальных дней (0 — без ограничения).",
+    )
+    parser.add_argument(
+        "--columnar",
+        action="store_true",
+        help="Читать parquet батчами через pyarrow. Нужен --data-files.",
+    )
+    parser.add_argument(
+        "--max-history",
+        type=int,
+        default=20,
+        help="Длина истории пользователя.",
+    )
+    parser.add_argument(
+        "--checkpoint-every",
+        type=int,
+        default=100_000,
+        help="Как часто (во входных строках) фиксировать чекпойнт.",
+    )
+    parser.add_argument(
+        "--max-resident-users",
+        type=int,
+        default=100_000,
+        help="Сколько историй держать в памяти; остальные вытесняются на диск.",
+    )
+    parser.add_argument(
+        "--output",
+        type=Path,
+        default=Path("data/sequences"),
+        help="Каталог для part-NNNNN.parquet и state.sqlite.",
+    )
+    parser.add_argument(
+        "--repo-id",
+        type=str,
+        default="t-tech/T-ECD",
+        help="ID датасета (по умолчанию t-tech/T-ECD).",
+    )
+    return parser.parse_args()
+
+
+class PartWriter:
+    """Buffers examples for the current part; a part file appears only when it is complete."""
+
+    def __init__(self, output: Path, part: int):
+        self.output = output
+        self.part = part
+        self.buffer: List[Dict[str, Any]] = []
+        self.rows = 0
+
+    def add(self, example: Dict[str, Any]) -> None:
+        self.buffer.append(example)
+
+    def flush(self, offset: int) -> Dict[str, Any]:
+        if self.buffer:
+            path = self.output / f"part-{self.part:05d}.parquet"
+            tmp = path.with_suffix(".tmp")
+            pq.write_table(pa.Table.from_pylist(self.buffer), tmp)
+            tmp.replace(path)
+            self.rows += len(self.buffer)
+            self.buffer = []
+            self.part += 1
+        return {"next_part": self.part}
+
+
+def main(args: Optional[argparse.Namespace] = None) -> None:
+    args = args or parse_args()
+
+    cfg = TECDStreamConfig(
+        repo_id=args.repo_id,
+        data_files=args.data_files,
+        domains=set(args.domains) if args.domains else None,
+        exclude_actions=set(args.exclude_actions),
+        max_days=args.max_days or None,
+        columnar=args.columnar,
+    )
+    seq_cfg = SequenceConfig(max_history=args.max_history)
+
+    args.output.mkdir(parents=True, exist_ok=True)
+    store = HistoryStore(args.output / "state.sqlite", args.max_history, args.max_resident_users)
+    if store.offset:
+        print(f"Продолжаем с чекпойнта: строка {store.offset}, часть {store.meta.get('next_part', 0)}")
+
+    writer = PartWriter(args.output, store.meta.get("next_part", 0))
+    try:
+        examples = build_sequences_resumable(
+            stream_filtered_rows(cfg),
+            cfg,
+            seq_cfg,
+            store,
+            checkpoint_every=args.checkpoint_every,
+            on_checkpoint=writer.flush,
+        )
+        for example in examples:
+            writer.add(example)
+    finally:
+        store.close()
+
+    print(
+        f"Готово: {store.offset} входных строк, {writer.rows} примеров в этом запуске, "
+        f"частей: {writer.part}, вытеснено историй: {store.spilled}"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -2,17 +2,26 @@
 
 Пример:
 python3 -m recsys.scripts.stream_tecd --domains retail_marketplace payments --max-days 1 --limit 20 --output data/tecd_demo.parquet
+
+Запись идёт инкрементально (ParquetWriter, по row group), память не зависит от объёма выборки.
+С --partition-by domain day --output становится каталогом в hive-раскладке:
+data/tecd/domain=payments/day=2023-01-05/part-00000.parquet
+Строки копятся по партициям до --row-group-size, открыто не больше --max-open-files файлов.
 """
 from __future__ import annotations
 
 import argparse
+from collections import OrderedDict
+from itertools import islice
 from pathlib import Path
-from typing import List, Optional
+from typing import Dict, Iterator, List, Optional, Tuple
 
 import pyarrow as pa
+import pyarrow.compute as pc
 import pyarrow.parquet as pq
 
-from recsys.models import TECDStreamConfig, stream_filtered_rows
+from recsys.models import TECDStreamConfig, stream_filtered_batches, stream_filtered_rows
+from recsys.models.data_pipeline import extract_batch_days
 
 
 def parse_args() -> argparse.Namespace:
@@ -38,8 +47,28 @@ def parse_args() -> argparse.Namespace:
     parser.add_argument(
         "--limit",
         type=int,
-        default=5000,
-        help="Макс. строк для выборки (защита от огромных файлов).",
+        default=None,
+        help="Макс. строк для выборки (по умолчанию без ограничения, запись потоковая).",
+    )
+    parser.add_argument(
+        "--row-group-size",
+        type=int,
+        default=100_000,
+        help="Строк в одном row group parquet (и в буфере записи).",
+    )
+    parser.add_argument(
+        "--partition-by",
+        nargs="+",
+        choices=["domain", "day"],
+        default=None,
+        help="Партиционировать вывод по домену и/или дню (hive-раскладка, --output — каталог).",
+    )
+    parser.add_argument(
+        "--max-open-files",
+        type=int,
+        default=64,
+        help="Сколько parquet-файлов партиций держать открытыми одновременно (остальные закрываются, "
+        "партиция продолжается в следующем part-файле).",
     )
     parser.add_argument(
         "--output",
@@ -66,6 +95,17 @@ def parse_args() -> argparse.Namespace:
         default=None,
         help="HF токен, если понадобится (публичный датасет обычно не требует).",
     )
+    parser.add_argument(
+        "--columnar",
+        action="store_true",
+        help="Читать parquet батчами через pyarrow (фильтры и проекция в сканере). Нужен --data-files.",
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=65_536,
+        help="Размер record batch в колоночном режиме.",
+    )
     parser.add_argument(
         "--repo-id",
         type=str,
@@ -75,9 +115,152 @@ def parse_args() -> argparse.Namespace:
     return parser.parse_args()
 
 
+def iter_batches(cfg: TECDStreamConfig, batch_size: int, limit: Optional[int]) -> Iterator[pa.RecordBatch]:
+    """Record batches from the columnar path or buffered rows; schema comes from the first batch."""
+
+    if cfg.columnar:
+        batches = stream_filtered_batches(cfg)
+    else:
+        batches = _rows_to_batches(stream_filtered_rows(cfg), batch_size)
+
+    remaining = limit
+    for batch in batches:
+        if remaining is not None:
+            if remaining <= 0:
+                return
+            batch = batch.slice(0, remaining)
+            remaining -= batch.num_rows
+        yield batch
+
+
+def _rows_to_batches(rows: Iterator[dict], batch_size: int) -> Iterator[pa.RecordBatch]:
+    schema: Optional[pa.Schema] = None
+    while True:
+        chunk = list(islice(rows, batch_size))
+        if not chunk:
+            return
+        if schema is None:
+            schema = pa.Table.from_pylist(chunk).schema
+            # all-null columns in the first chunk would pin the type to null for the whole file
+            schema = pa.schema([f.with_type(pa.string()) if pa.types.is_null(f.type) else f for f in schema])
+        yield pa.RecordBatch.from_pylist(chunk, schema=schema)
+
+
+class ParquetSink:
+    """Incremental parquet output, optionally hive-partitioned by domain/day.
+
+    Rows are buffered per partition and written in ``row_group_size`` row
+    groups. Memory is bounded twice over. When all buffers together exceed
+    ``max_buffered_rows``, the largest one is flushed early. At most
+    ``max_open_files`` writers stay open; the least recently used one is
+    closed, and a partition that comes back continues in a new part file.
+    """
+
+    def __init__(
+        self,
+        output: Path,
+        cfg: TECDStreamConfig,
+        row_group_size: int,
+        partition_by: Optional[List[str]],
+        max_open_files: int = 64,
+        max_buffered_rows: Optional[int] = None,
+    ):
+        self.output = output
+        self.cfg = cfg
+        self.row_group_size = row_group_size
+        self.partition_by = partition_by or []
+        self.max_open_files = max(1, max_open_files)
+        self.max_buffered_rows = max_buffered_rows or 4 * row_group_size
+        self.writers: "OrderedDict[Tuple[str, ...], pq.ParquetWriter]" = OrderedDict()
+        self.buffers: Dict[Tuple[str, ...], List[pa.RecordBatch]] = {}
+        self.buffered: Dict[Tuple[str, ...], int] = {}
+        self.parts: Dict[Tuple[str, ...], int] = {}  # part files opened so far per partition
+        self.schema: Optional[pa.Schema] = None
+        self.rows = 0
+        self.files = 0
+
+    def write(self, batch: pa.RecordBatch) -> None:
+        if self.schema is None:
+            self.schema = batch.schema
+        elif batch.schema != self.schema:
+            batch = pa.Table.from_batches([batch]).cast(self.schema).to_batches()[0]
+
+        self.rows += batch.num_rows
+        if not self.partition_by:
+            self._buffer((), batch)
+        else:
+            keys = self._partition_keys(batch)
+            combined = pc.binary_join_element_wise(*keys, "\x1f") if len(keys) > 1 else keys[0]
+            for value in pc.unique(combined).to_pylist():
+                self._buffer(tuple(value.split("\x1f")), batch.filter(pc.equal(combined, value)))
+
+        while sum(self.buffered.values()) > self.max_buffered_rows:
+            self._flush(max(self.buffered, key=self.buffered.get), full_only=False)
+
+    def _buffer(self, part: Tuple[str, ...], batch: pa.RecordBatch) -> None:
+        if not batch.num_rows:
+            return
+        self.buffers.setdefault(part, []).append(batch)
+        self.buffered[part] = self.buffered.get(part, 0) + batch.num_rows
+        if self.buffered[part] >= self.row_group_size:
+            self._flush(part, full_only=True)
+
+    def _flush(self, part: Tuple[str, ...], full_only: bool) -> None:
+        """Writes whole row groups of the partition's buffer; the tail too unless ``full_only``."""
+
+        table = pa.Table.from_batches(self.buffers.pop(part), schema=self.schema)
+        self.buffered.pop(part)
+        size = len(table) - len(table) % self.row_group_size if full_only else len(table)
+        if size:
+            self._writer(part).write_table(table.slice(0, size), row_group_size=self.row_group_size)
+        if size < len(table):
+            self.buffers[part] = table.slice(size).combine_chunks().to_batches()
+            self.buffered[part] = len(table) - size
+
+    def _partition_keys(self, batch: pa.RecordBatch) -> List[pa.Array]:
+        keys = []
+        for name in self.partition_by:
+            if name == "day":
+                values = extract_batch_days(batch, self.cfg)
+            else:
+                idx = batch.schema.get_field_index(self.cfg.domain_key)
+                values = batch.column(idx) if idx >= 0 else None
+            if values is None:
+                values = pa.nulls(batch.num_rows, pa.string())
+            keys.append(pc.fill_null(pc.cast(values, pa.string()), "__null__"))
+        return keys
+
+    def _writer(self, part: Tuple[str, ...]) -> pq.ParquetWriter:
+        writer = self.writers.get(part)
+        if writer is not None:
+            self.writers.move_to_end(part)
+            return writer
+        while len(self.writers) >= self.max_open_files:
+            _, oldest = self.writers.popitem(last=False)
+            oldest.close()
+        if self.partition_by:
+            index = self.parts.get(part, 0)
+            self.parts[part] = index + 1
+            path = self.output.joinpath(*(f"{name}={value}" for name, value in zip(self.partition_by, part)))
+            path = path / f"part-{index:05d}.parquet"
+        else:
+            path = self.output
+        path.parent.mkdir(parents=True, exist_ok=True)
+        writer = pq.ParquetWriter(path, self.schema)
+        self.writers[part] = writer
+        self.files += 1
+        return writer
+
+    def close(self) -> None:
+        for part in list(self.buffers):
+            self._flush(part, full_only=False)
+        for writer in self.writers.values():
+            writer.close()
+        self.writers.clear()
+
+
 def main(args: Optional[argparse.Namespace] = None) -> None:
     args = args or parse_args()
-    rows: List[dict] = []
 
     cfg = TECDStreamConfig(
         repo_id=args.repo_id,
@@ -87,20 +270,21 @@ def main(args: Optional[argparse.Namespace] = None) -> None:
         exclude_actions=set(args.exclude_actions),
         max_days=args.max_days,
         auth_token=args.auth_token,
+        columnar=args.columnar,
+        batch_size=args.batch_size,
     )
 
-    for i, row in enumerate(stream_filtered_rows(cfg)):
-        rows.append(row)
-        if args.limit and i + 1 >= args.limit:
-            break
+    sink = ParquetSink(args.output, cfg, args.row_group_size, args.partition_by, max_open_files=args.max_open_files)
+    try:
+        for batch in iter_batches(cfg, args.row_group_size, args.limit):
+            sink.write(batch)
+    finally:
+        sink.close()
 
-    if not rows:
+    if not sink.rows:
         raise SystemExit("Не собрали ни одной строки — проверь фильтры/сеть.")
 
-    table = pa.Table.from_pylist(rows)
-    args.output.parent.mkdir(parents=True, exist_ok=True)
-    pq.write_table(table, args.output)
-    print(f"Сохранили {len(rows)} строк в {args.output}")
+    print(f"Сохранили {sink.rows} строк в {args.output} (файлов: {sink.files})")
 
 
 if __name__ == "__main__":
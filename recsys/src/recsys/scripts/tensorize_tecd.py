@@ -0,0 +1,74 @@
+"""CLI: один раз закодировать выборку T-ECD в предтензоризованный датасет.
+
+Пример:
+python3 -m recsys.scripts.tensorize_tecd --input data/tecd_subset.parquet --output data/tecd_tensors
+
+На выходе каталог с плоскими .npy (int32 id событий, float32 сезонные признаки,
+индексы таргетов и длины историй) и таблицами токенов. Обучение открывает их
+через np.load(mmap_mode='r') — см. recsys.models.dataset.SequenceDataset.
+"""
+from __future__ import annotations
+
+import argparse
+import time
+from pathlib import Path
+from typing import Optional
+
+import pyarrow.dataset as pads
+
+from recsys.models import SequenceConfig, TECDStreamConfig, build_sequence_arrays
+from recsys.models.dataset import save_sequence_arrays
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Encode a T-ECD parquet subset into flat memory-mappable arrays.")
+    parser.add_argument(
+        "--input",
+        type=Path,
+        required=True,
+        help="Parquet-файл или каталог (вывод stream_tecd / extract_shards).",
+    )
+    parser.add_argument(
+        "--output",
+        type=Path,
+        default=Path("data/tecd_tensors"),
+        help="Каталог для .npy и таблиц токенов.",
+    )
+    parser.add_argument(
+        "--max-history",
+        type=int,
+        default=20,
+        help="Длина истории пользователя.",
+    )
+    parser.add_argument(
+        "--product-key",
+        type=str,
+        default="product_id",
+        help="Колонка с id товара/продукта.",
+    )
+    parser.add_argument(
+        "--no-product",
+        action="store_true",
+        help="Не кодировать продукты.",
+    )
+    return parser.parse_args()
+
+
+def main(args: Optional[argparse.Namespace] = None) -> None:
+    args = args or parse_args()
+
+    start = time.perf_counter()
+    table = pads.dataset(str(args.input), format="parquet").to_table()
+    cfg = TECDStreamConfig(product_key=args.product_key)
+    seq_cfg = SequenceConfig(max_history=args.max_history, include_product=not args.no_product)
+    arrays = build_sequence_arrays(table, cfg, seq_cfg)
+    save_sequence_arrays(arrays, args.output)
+
+    print(
+        f"Сохранили {len(arrays)} примеров ({len(arrays.actions)} событий) в {args.output} "
+        f"за {time.perf_counter() - start:.1f} с"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""CLI: обучение implicit ALS прямо из parquet-шардов T-ECD.
+
+Пример:
+python3 -m recsys.scripts.train_als --data-files "data/raw/marketplace/events/*.pq" --item-key item_id \
+    --action-weights view=1 added-to-cart=4 order=8 --factors 64 --iterations 15 --output artifacts/als/marketplace
+
+Матрица user x item собирается потоково из record batch (scipy CSR), вес события
+зависит от action_type. Факторы сохраняются как .npy (np.load(mmap_mode='r')) вместе
+со словарями пользователей/товаров — без pickle.
+"""
+from __future__ import annotations
+
+import argparse
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from recsys.models import TECDStreamConfig, stream_filtered_batches
+from recsys.models.als import ALSConfig, ALSModel, InteractionConfig, config_dict
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Train implicit ALS from T-ECD parquet shards.")
+    parser.add_argument("--data-files", nargs="+", required=True, help="Parquet-шарды (локальные или hf://).")
+    parser.add_argument("--domains", nargs="+", default=None, help="Домены для фильтрации. Если не указаны — все.")
+    parser.add_argument("--max-days", type=int, default=0, help="Ограничение по дням (0 — без него).")
+    parser.add_argument("--user-key", type=str, default="user_id", help="Колонка пользователя.")
+    parser.add_argument("--item-key", type=str, default="product_id", help="Колонка товара.")
+    parser.add_argument(
+        "--action-weights",
+        nargs="+",
+        default=None,
+        help="Веса событий вида action=weight (по умолчанию view=1 click=2 added-to-cart=4 order=8).",
+    )
+    parser.add_argument("--factors", type=int, default=64, help="Размерность факторов.")
+    parser.add_argument("--iterations", type=int, default=15, help="Число итераций ALS.")
+    parser.add_argument("--regularization", type=float, default=0.01, help="L2-регуляризация.")
+    parser.add_argument("--alpha", type=float, default=1.0, help="Масштаб уверенности: c = 1 + alpha * вес.")
+    parser.add_argument("--threads", type=int, default=0, help="Потоков для блоков решателя (0 — все CPU).")
+    parser.add_argument("--batch-size", type=int, default=262_144, help="Размер record batch при чтении.")
+    parser.add_argument("--output", type=Path, default=Path("artifacts/als"), help="Каталог для факторов и словарей.")
+    return parser.parse_args()
+
+
+def parse_weights(pairs: Optional[List[str]]) -> Optional[Dict[str, float]]:
+    if not pairs:
+        return None
+    weights = {}
+    for pair in pairs:
+        action, _, weight = pair.rpartition("=")
+        if not action:
+            raise SystemExit(f"Неверный вес '{pair}', нужен формат action=weight")
+        weights[action] = float(weight)
+    return weights
+
+
+def main(args: Optional[argparse.Namespace] = None) -> None:
+    args = args or parse_args()
+
+    stream_cfg = TECDStreamConfig(
+        data_files=args.data_files,
+        domains=set(args.domains) if args.domains else None,
+        exclude_actions=set(),
+        max_days=args.max_days or None,
+        user_key=args.user_key,
+        product_key=args.item_key,
+        columnar=True,
+        batch_size=args.batch_size,
+    )
+    interaction_cfg = InteractionConfig(user_key=args.user_key, item_key=args.item_key)
+    weights = parse_weights(args.action_weights)
+    if weights is not None:
+        interaction_cfg.action_weights = weights
+    als_cfg = ALSConfig(
+        factors=args.factors,
+        iterations=args.iterations,
+        regularization=args.regularization,
+        alpha=args.alpha,
+        num_threads=args.threads,
+    )
+
+    start = time.perf_counter()
+    model, data = ALSModel.train(stream_filtered_batches(stream_cfg), interaction_cfg, als_cfg)
+    print(
+        f"Матрица {data.matrix.shape[0]} x {data.matrix.shape[1]}, {data.matrix.nnz} ненулевых; "
+        f"обучение заняло {time.perf_counter() - start:.1f} с"
+    )
+    model.save(args.output, meta={"config": config_dict(interaction_cfg, als_cfg), "data_files": args.data_files})
+    print(f"Факторы и словари сохранены в {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,196 @@
+"""CLI для обучения NextActionGRU на CPU с замером пропускной способности.
+
+Примеры:
+python3 -m recsys.scripts.train_gru --tensors data/tecd_tensors --epochs 3 --threads 8 --workers 2 --bf16
+python3 -m recsys.scripts.train_gru --data-files "data/raw/events/*.pq" --product-key item_id --grad-accum 4
+
+С --tensors данные берутся из предтензоризованного датасета (tensorize_tecd),
+иначе последовательности стримятся через build_sequences, а словари строятся
+отдельным проходом. По каждой эпохе печатаются samples/sec, время ожидания данных
+и вычислений, пиковый RSS; метрики и чекпойнт пишутся в --output.
+"""
+from __future__ import annotations
+
+import argparse
+from itertools import islice
+from pathlib import Path
+from typing import Iterator, Optional
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import torch
+
+from recsys.models import (
+    ModelConfig,
+    NextActionGRU,
+    SequenceConfig,
+    SequenceDataset,
+    TECDStreamConfig,
+    Vocabulary,
+    build_sequences,
+    collate_sequences,
+    make_loader,
+    stream_filtered_batches,
+    stream_filtered_rows,
+)
+from recsys.models.training import EpochStats, TrainConfig, load_checkpoint, train
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Train NextActionGRU on CPU with throughput stats.")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--tensors", type=Path, help="Каталог предтензоризованного датасета (tensorize_tecd).")
+    source.add_argument("--data-files", nargs="+", help="Parquet-шарды (локальные или hf://) для потокового режима.")
+    parser.add_argument("--product-key", type=str, default="product_id", help="Колонка с id товара (потоковый режим).")
+    parser.add_argument("--domains", nargs="+", default=None, help="Домены для фильтрации (потоковый режим).")
+    parser.add_argument("--max-days", type=int, default=100, help="Ограничение по дням (потоковый режим, 0 — без него).")
+    parser.add_argument("--min-freq", type=int, default=1, help="Минимальная частота токена в словаре (потоковый режим).")
+    parser.add_argument("--max-history", type=int, default=20, help="Длина истории (потоковый режим).")
+    parser.add_argument("--no-product", action="store_true", help="Обучать только голову действий.")
+
+    parser.add_argument("--epochs", type=int, default=1, help="Число эпох.")
+    parser.add_argument("--batch-size", type=int, default=256, help="Размер микробатча.")
+    parser.add_argument("--grad-accum", type=int, default=1, help="Шагов накопления градиента на один шаг оптимизатора.")
+    parser.add_argument("--lr", type=float, default=1e-3, help="Learning rate (AdamW).")
+    parser.add_argument("--d-model", type=int, default=64, help="Размерность модели.")
+    parser.add_argument(
+        "--product-loss",
+        choices=["full", "in_batch", "sampled"],
+        default="full",
+        help="Softmax по всему каталогу, по таргетам батча или по таргетам батча + случайным негативам.",
+    )
+    parser.add_argument("--num-sampled", type=int, default=1024, help="Случайных негативов на батч (--product-loss sampled).")
+    parser.add_argument("--bf16", action="store_true", help="Смешанная точность bf16 (torch.autocast на CPU).")
+    parser.add_argument("--threads", type=int, default=None, help="torch.set_num_threads (intra-op).")
+    parser.add_argument("--interop-threads", type=int, default=None, help="torch.set_num_interop_threads.")
+    parser.add_argument("--workers", type=int, default=0, help="Процессов DataLoader (режим --tensors).")
+    parser.add_argument("--pin-memory", action="store_true", help="Pinned memory в DataLoader.")
+    parser.add_argument("--no-bucket", action="store_true", help="Не группировать батчи по длине.")
+    parser.add_argument("--limit-batches", type=int, default=None, help="Ограничить число батчей в эпохе (для замеров).")
+    parser.add_argument("--checkpoint-every", type=int, default=0, help="Чекпойнт каждые N шагов (0 — только в конце эпохи).")
+    parser.add_argument("--log-every", type=int, default=100, help="Печатать прогресс каждые N шагов.")
+    parser.add_argument("--resume", action="store_true", help="Продолжить с чекпойнта в --output.")
+    parser.add_argument("--output", type=Path, default=Path("artifacts/gru"), help="Каталог для чекпойнта, словарей и метрик.")
+    parser.add_argument("--seed", type=int, default=0, help="Seed.")
+    return parser.parse_args()
+
+
+def _stream_config(args: argparse.Namespace) -> TECDStreamConfig:
+    return TECDStreamConfig(
+        data_files=args.data_files,
+        domains=set(args.domains) if args.domains else None,
+        max_days=args.max_days or None,
+        product_key=args.product_key,
+        columnar=True,
+    )
+
+
+def build_vocabularies(cfg: TECDStreamConfig, min_freq: int, with_product: bool):
+    """One columnar pass over the stream to size the embedding tables."""
+
+    actions, products = [], []
+    for batch in stream_filtered_batches(cfg):
+        # T-ECD ids are usually ints; the vocabulary is keyed by their string form
+        actions.append(pc.cast(batch.column(cfg.action_key), pa.string()))
+        if with_product and cfg.product_key in batch.schema.names:
+            products.append(pc.cast(batch.column(cfg.product_key), pa.string()))
+    action_vocab = Vocabulary.build(pa.chunked_array(actions, pa.string()), min_freq=1)
+    product_vocab = Vocabulary.build(pa.chunked_array(products, pa.string()), min_freq=min_freq) if with_product else None
+    return action_vocab, product_vocab
+
+
+def stream_batches(cfg, seq_cfg, action_vocab, product_vocab, batch_size: int) -> Iterator[dict]:
+    sequences = build_sequences(stream_filtered_rows(cfg), cfg, seq_cfg)
+    while True:
+        chunk = list(islice(sequences, batch_size))
+        if not chunk:
+            return
+        yield collate_sequences(chunk, action_vocab, product_vocab, grow_vocabs=False)
+
+
+def main(args: Optional[argparse.Namespace] = None) -> None:
+    args = args or parse_args()
+    torch.manual_seed(args.seed)
+    args.output.mkdir(parents=True, exist_ok=True)
+
+    if args.tensors:
+        dataset = SequenceDataset(args.tensors)
+        arrays = dataset.arrays
+        num_actions = len(arrays.action_tokens)
+        num_products = len(arrays.product_tokens) if arrays.product_tokens is not None and not args.no_product else None
+        loader = make_loader(
+            dataset,
+            batch_size=args.batch_size,
+            bucket=not args.no_bucket,
+            num_workers=args.workers,
+            pin_memory=args.pin_memory,
+            seed=args.seed,
+        )
+
+        def make_batches(epoch: int):
+            loader.sampler.set_epoch(epoch)
+            return islice(loader, args.limit_batches)
+
+    else:
+        cfg = _stream_config(args)
+        seq_cfg = SequenceConfig(max_history=args.max_history, include_product=not args.no_product)
+        vocab_dir = args.output / "vocab"
+        if args.resume and (vocab_dir / "actions" / "vocab.json").exists():
+            action_vocab = Vocabulary.load(vocab_dir / "actions")
+            product_vocab = Vocabulary.load(vocab_dir / "products") if not args.no_product else None
+        else:
+            action_vocab, product_vocab = build_vocabularies(cfg, args.min_freq, not args.no_product)
+            action_vocab.save(vocab_dir / "actions")
+            if product_vocab is not None:
+                product_vocab.save(vocab_dir / "products")
+        num_actions = len(action_vocab)
+        num_products = len(product_vocab) if product_vocab is not None else None
+        print(f"Словари: {num_actions} действий, {num_products or 0} продуктов")
+
+        def make_batches(epoch: int):
+            return islice(stream_batches(cfg, seq_cfg, action_vocab, product_vocab, args.batch_size), args.limit_batches)
+
+    model = NextActionGRU(
+        ModelConfig(
+            num_actions=num_actions,
+            num_products=num_products,
+            d_model=args.d_model,
+            use_product_context=num_products is not None,
+        )
+    )
+    train_cfg = TrainConfig(
+        epochs=args.epochs,
+        lr=args.lr,
+        grad_accum_steps=args.grad_accum,
+        bf16=args.bf16,
+        product_loss=args.product_loss,
+        num_sampled=args.num_sampled,
+        num_threads=args.threads,
+        num_interop_threads=args.interop_threads,
+        checkpoint_dir=args.output,
+        checkpoint_every=args.checkpoint_every,
+        log_every=args.log_every,
+    )
+    optimizer = torch.optim.AdamW(model.parameters(), lr=args.lr)
+
+    start_epoch = 0
+    checkpoint = args.output / "checkpoint.pt"
+    if args.resume and checkpoint.exists():
+        state = load_checkpoint(checkpoint, model, optimizer)
+        start_epoch = state["epoch"] + 1 if state.get("finished_epoch") else state["epoch"]
+        print(f"Продолжаем с эпохи {start_epoch}")
+
+    def report(stats: EpochStats) -> None:
+        wait_share = stats.data_seconds / stats.seconds if stats.seconds else 0.0
+        print(
+            f"epoch {stats.epoch}: loss={stats.loss:.4f} samples={stats.samples} "
+            f"{stats.samples_per_sec:.0f} samples/s | data {stats.data_seconds:.1f}s ({wait_share:.0%}) "
+            f"compute {stats.compute_seconds:.1f}s | peak RSS {stats.peak_rss_mb:.0f} MiB "
+            f"(workers {stats.peak_rss_children_mb:.0f} MiB)"
+        )
+
+    train(model, make_batches, train_cfg, optimizer=optimizer, start_epoch=start_epoch, on_epoch=report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""Top-k metrics on a split small enough to score by hand."""
+import math
+
+import numpy as np
+import pyarrow as pa
+import pytest
+
+from recsys.eval import PopularModel, SplitConfig, build_ground_truth, evaluate
+
+
+class FixedModel:
+    def __init__(self, recs):
+        self.recs = recs
+
+    def recommend(self, user_ids, k):
+        return [self.recs.get(user, []) for user in user_ids]
+
+
+def _pairs(pairs):
+    users, items = zip(*pairs)
+    return pa.table({"user_id": pa.array(users, pa.string()), "product_id": pa.array(items, pa.string())})
+
+
+@pytest.fixture
+def truth():
+    train = _pairs([("u1", "a"), ("u1", "b"), ("u2", "a"), ("u2", "a"), ("u3", "c")])
+    test = _pairs([("u1", "c"), ("u1", "d"), ("u1", "c"), ("u2", "b")])
+    return build_ground_truth(train, test, SplitConfig())
+
+
+def test_ground_truth_dedupes_test_pairs(truth):
+    assert truth.user_ids.tolist() == ["u1", "u2"]
+    assert np.diff(truth.indptr).tolist() == [2, 1]
+    assert truth.train_users == 3
+    assert truth.item_counts[truth.items.encode_batch(["a", "b", "c", "d"])].tolist() == [2, 1, 1, 0]
+
+
+@pytest.mark.parametrize("chunk_size", [1, 50_000])
+def test_metrics_match_hand_computed_values(truth, chunk_size):
+    # u1: hit at rank 1 of two relevant; u2: a miss and an item unknown to the vocabulary
+    model = FixedModel({"u1": ["c", "a"], "u2": ["a", "zz"]})
+    metrics = evaluate(model, truth, k=2, chunk_size=chunk_size)
+
+    ideal = 1 + 1 / math.log2(3)
+    assert metrics["users"] == 2
+    assert metrics["recall@2"] == pytest.approx((1 / 2 + 0) / 2)
+    assert metrics["ndcg@2"] == pytest.approx((1 / ideal + 0) / 2)
+    assert metrics["map@2"] == pytest.approx((1 / 2 + 0) / 2)
+    assert metrics["coverage"] == pytest.approx(2 / 3)  # a and c of the train items a, b, c
+    novelty = (math.log2(3) + 2 * math.log2(3 / 2)) / 3  # c once, a twice
+    assert metrics["novelty"] == pytest.approx(novelty)
+
+
+def test_perfect_and_short_lists(truth):
+    perfect = evaluate(FixedModel({"u1": ["d", "c"], "u2": ["b"]}), truth, k=2)
+    assert perfect["recall@2"] == pytest.approx(1.0)
+    assert perfect["ndcg@2"] == pytest.approx(1.0)
+    assert perfect["map@2"] == pytest.approx(1.0)
+
+    empty = evaluate(FixedModel({}), truth, k=2)
+    assert empty["recall@2"] == empty["ndcg@2"] == empty["map@2"] == 0.0
+    assert empty["coverage"] == 0.0
+
+
+def test_popular_model_ranks_by_distinct_users():
+    train = _pairs([("u1", "a"), ("u1", "a"), ("u1", "b"), ("u2", "a"), ("u3", "c"), ("u3", "b")])
+    model = PopularModel.fit(train, SplitConfig())
+    assert model.top_items.tolist() == ["a", "b", "c"]
+    assert model.recommend(["x", "y"], 2).tolist() == [["a", "b"], ["a", "b"]]
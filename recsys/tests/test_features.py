@@ -0,0 +1,200 @@
+"""FeatureStore folds against a pandas groupby over the same events."""
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pytest
+
+from recsys.features import FeatureConfig, FeatureStore, _digest_compress, _digest_quantiles
+
+COLUMNS = ["user_id", "timestamp", "action_type", "price", "category"]
+
+# day 3 spans both shards; views are excluded
+SHARDS = [
+    [
+        ("a", "2024-03-01 09:00", "purchase", 10.0, "x"),
+        ("a", "2024-03-01 10:00", "view", 99.0, "x"),
+        ("b", "2024-03-01 11:00", "purchase", 5.0, "y"),
+        ("a", "2024-03-02 09:00", "purchase", 20.0, "y"),
+        ("a", "2024-03-02 12:00", "purchase", 1.0, "x"),
+        ("b", "2024-03-02 13:00", "purchase", 7.0, None),
+        ("a", "2024-03-03 08:00", "purchase", 3.0, "x"),
+    ],
+    [
+        ("b", "2024-03-03 18:00", "purchase", 4.0, "y"),
+        ("a", "2024-03-04 09:00", "purchase", 8.0, "z"),
+        ("c", "2024-03-04 10:00", "purchase", 2.0, "x"),
+        ("b", "2024-03-05 11:00", "purchase", 6.0, "x"),
+    ],
+]
+
+
+def _batch(rows):
+    users, stamps, actions, prices, categories = zip(*rows)
+    return pa.RecordBatch.from_pydict({
+        "user_id": pa.array(users, pa.string()),
+        "timestamp": pa.array([datetime.fromisoformat(s) for s in stamps], pa.timestamp("us")),
+        "action_type": pa.array(actions, pa.string()),
+        "price": pa.array(prices, pa.float64()),
+        "category": pa.array(categories, pa.string()),
+    })
+
+
+def _reference(rows) -> pd.DataFrame:
+    df = pd.DataFrame(rows, columns=COLUMNS)
+    df = df[df["action_type"] != "view"].copy()
+    df["day"] = pd.to_datetime(df["timestamp"]).dt.normalize()
+    daily = df.groupby(["user_id", "day"]).agg(
+        amount=("price", "sum"), events=("price", "size"), categories=("category", "nunique")
+    ).reset_index()
+    users = daily.groupby("user_id").agg(
+        days=("amount", "size"),
+        total_amount=("amount", "sum"),
+        mean_amount=("amount", "mean"),
+        max_amount=("amount", "max"),
+        median_amount=("amount", "median"),
+        mean_events=("events", "mean"),
+        unique_categories_mean=("categories", "mean"),
+        first_day=("day", "min"),
+        last_day=("day", "max"),
+    )
+    users["first_day"] = users["first_day"].dt.date
+    users["last_day"] = users["last_day"].dt.date
+    categories = df.dropna(subset=["category"]).groupby(["user_id", "category"]).agg(
+        amount=("price", "sum"), events=("price", "size")
+    ).reset_index()
+    categories = categories.sort_values(["user_id", "amount", "events"], ascending=[True, False, False])
+    users["top_category"] = categories.groupby("user_id")["category"].first()
+    return users.sort_index()
+
+
+def _assert_matches(store: FeatureStore, rows) -> None:
+    expected = _reference(rows)
+    got = store.features().to_pandas().set_index("user_id").sort_index()
+    assert got.index.tolist() == expected.index.tolist()
+    for name in ["days", "total_amount", "mean_amount", "max_amount", "median_amount", "mean_events", "unique_categories_mean"]:
+        np.testing.assert_allclose(got[name].to_numpy(np.float64), expected[name].to_numpy(np.float64), err_msg=name)
+    for name in ["first_day", "last_day", "top_category"]:
+        assert got[name].tolist() == expected[name].tolist(), name
+
+
+@pytest.fixture
+def cfg() -> FeatureConfig:
+    return FeatureConfig(flag_rules={})
+
+
+def test_ingest_matches_pandas_reference(tmp_path, cfg):
+    store = FeatureStore(tmp_path, cfg)
+    stats = store.ingest([_batch(SHARDS[0])], source="s0")
+    # the last day stays pending until the next shard or flush
+    assert stats["folded_days"] == 4 and stats["late_events"] == 0
+    assert store.pending.num_rows == 1
+    store.ingest([_batch(SHARDS[1])], source="s1")
+    store.flush()
+    _assert_matches(store, SHARDS[0] + SHARDS[1])
+
+
+def test_save_and_reload_continue_the_fold(tmp_path, cfg):
+    store = FeatureStore(tmp_path, cfg)
+    store.ingest([_batch(SHARDS[0])], source="s0")
+    store.save()
+
+    reloaded = FeatureStore(tmp_path)
+    assert reloaded.cfg.flag_rules == {}
+    assert reloaded.pending.num_rows == 1
+    assert reloaded.ingest([_batch(SHARDS[0])], source="s0")["skipped"] == 1
+    reloaded.ingest([_batch(SHARDS[1])], source="s1")
+    reloaded.flush()
+    _assert_matches(reloaded, SHARDS[0] + SHARDS[1])
+
+    reloaded.save()
+    _assert_matches(FeatureStore(tmp_path), SHARDS[0] + SHARDS[1])
+
+
+def test_folded_user_day_is_rejected_as_late(tmp_path, cfg):
+    store = FeatureStore(tmp_path, cfg)
+    for shard in SHARDS:
+        store.ingest([_batch(shard)])
+    store.flush()
+
+    late = [
+        ("a", "2024-03-02 20:00", "purchase", 100.0, "x"),  # a's day 2 is closed
+        ("c", "2024-03-02 20:00", "purchase", 9.0, "y"),  # c has no day 2 yet
+    ]
+    store.ingest([_batch(late)])
+    stats = store.flush()
+    assert stats["late_events"] == 1
+    assert stats["folded_days"] == 1
+    _assert_matches(store, SHARDS[0] + SHARDS[1] + late[1:])
+
+
+def test_days_before_the_epoch_are_folded(tmp_path, cfg):
+    store = FeatureStore(tmp_path, cfg)
+    for shard in SHARDS:
+        store.ingest([_batch(shard)])
+    store.flush()
+    store.save()
+    epoch = store.day_epoch
+
+    backfill = [
+        ("a", "2024-02-20 09:00", "purchase", 11.0, "x"),
+        ("d", "2024-02-25 09:00", "purchase", 12.0, "y"),
+    ]
+    late_events = store.ingest([_batch(backfill)])["late_events"] + store.flush()["late_events"]
+    assert late_events == 0
+    assert store.day_epoch < epoch and (epoch - store.day_epoch) % 8 == 0
+
+    # bitmaps moved with the epoch: a's first day is still closed, day 5 is not
+    again = [
+        ("a", "2024-03-01 20:00", "purchase", 50.0, "x"),
+        ("a", "2024-03-05 20:00", "purchase", 13.0, "z"),
+    ]
+    late_events = store.ingest([_batch(again)])["late_events"] + store.flush()["late_events"]
+    assert late_events == 1
+    _assert_matches(store, SHARDS[0] + SHARDS[1] + backfill + again[1:])
+
+
+def test_new_user_before_the_epoch_is_not_late(tmp_path, cfg):
+    store = FeatureStore(tmp_path, cfg)
+    store.ingest([_batch(SHARDS[1])])
+    store.flush()
+
+    early = [("e", "2024-03-02 09:00", "purchase", 3.0, "x")]
+    store.ingest([_batch(early)])
+    assert store.flush()["late_events"] == 0
+    _assert_matches(store, SHARDS[1] + early)
+
+
+def _digest_input(groups):
+    owner = np.concatenate([np.full(len(values), i) for i, values in enumerate(groups)]).astype(np.int64)
+    means = np.concatenate([np.sort(values) for values in groups]).astype(np.float64)
+    return owner, means, np.ones(len(means))
+
+
+def test_digest_quantiles_of_unit_centroids_match_hazen():
+    rng = np.random.default_rng(0)
+    groups = [rng.normal(size=5), np.empty(0), rng.exponential(size=8), np.array([4.0])]
+    qs = [0.05, 0.25, 0.5, 0.75, 0.9, 0.99]
+    owner, means, weights = _digest_input(groups)
+
+    out = _digest_quantiles(owner, means, weights, len(groups), qs)
+    assert out.shape == (len(groups), len(qs))
+    assert np.isnan(out[1]).all()
+    for i in (0, 2, 3):
+        np.testing.assert_allclose(out[i], np.quantile(groups[i], qs, method="hazen"))
+
+
+def test_compressed_digest_keeps_quantile_ranks():
+    rng = np.random.default_rng(1)
+    groups = [rng.normal(size=20_000), rng.lognormal(size=5_000)]
+    qs = [0.1, 0.5, 0.9]
+    owner, means, weights = _digest_input(groups)
+
+    owner, means, weights = _digest_compress(owner, means, weights, len(groups), compression=100.0)
+    np.testing.assert_allclose(np.bincount(owner, weights), [len(values) for values in groups])
+    assert np.bincount(owner).max() <= 100
+    out = _digest_quantiles(owner, means, weights, len(groups), qs)
+    for i, values in enumerate(groups):
+        ranks = [np.mean(values <= estimate) for estimate in out[i]]
+        np.testing.assert_allclose(ranks, qs, atol=0.02)
@@ -0,0 +1,404 @@
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+
+import numpy as np
+
+ARTIFACTS_DIR = os.environ.get("ARTIFACTS_DIR", "artifacts")
+# Как часто фоновый поток проверяет указатель CURRENT на смену версии (сек)
+ARTIFACTS_POLL_INTERVAL = float(os.environ.get("ARTIFACTS_POLL_INTERVAL", 10.0))
+# Проверка sha256 при первом обращении к файлу (0 — только размер)
+ARTIFACTS_VERIFY = os.environ.get("ARTIFACTS_VERIFY", "1") != "0"
+
+MANIFEST_FILE = "manifest.json"
+# Уже проверенные файлы версии: sha256 не пересчитывается при каждом старте воркера
+VERIFIED_FILE = ".verified.json"
+CURRENT_FILE = "CURRENT"
+VERSIONS_DIR = "versions"
+
+FORMAT_NPY = "npy"
+FORMAT_ARROW = "arrow"
+_FORMATS = {".npy": FORMAT_NPY, ".arrow": FORMAT_ARROW, ".feather": FORMAT_ARROW}
+
+# Раскладка выгрузки recsys.models.als.ALSModel.save -> имена артефактов. Товары ALS — товары
+# маркетплейса, а не продукты банка, поэтому item_factors не публикуются: продукты строятся
+# из cluster_factors (cluster_users --als) в том же пространстве, что и user_factors
+ALS_FILES = {
+    "user_factors": "user_factors.npy",
+    "user_keys": "users/keys.npy",
+    "user_key_ids": "users/key_ids.npy",
+}
+
+# Раскладка выгрузки recsys.scripts.build_profiles -> имена артефактов
+PROFILE_FILES = {
+    "profiles": "profiles.arrow",
+    "profile_keys": "profile_keys.npy",
+    "profile_key_ids": "profile_key_ids.npy",
+    "profile_clusters": "profile_clusters.npy",
+}
+
+# Раскладка выгрузки recsys.scripts.cluster_users -> имена артефактов
+CLUSTER_FILES = {
+    "clusters": "clusters.npy",
+    "cluster_keys": "cluster_keys.npy",
+    "cluster_key_ids": "cluster_key_ids.npy",
+    "cluster_factors": "cluster_factors.npy",
+}
+# Файлы выгрузок, которые публикуются, только если они есть (cluster_users без --als, build_profiles без --users)
+OPTIONAL_FILES = {"cluster_factors", "profile_clusters"}
+
+
+class ArtifactError(Exception):
+    """Версия артефактов битая: нет файла, не совпал размер, контрольная сумма или формат."""
+
+
+def file_sha256(path: str, chunk_size: int = 1 << 20) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(chunk_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class SortedKeyIndex:
+    """
+    Поиск строки по user_id в отсортированном массиве ключей (fixed-width bytes)
+    бинарным поиском. Ключи и номера строк лежат в mmap, поэтому индекс на
+    миллионы пользователей не копируется в каждый воркер, в отличие от dict.
+    """
+
+    def __init__(self, keys: np.ndarray, rows: np.ndarray):
+        self.keys = keys
+        self.rows = rows
+
+    def get(self, key, default=None):
+        raw = str(key).encode("utf-8")
+        if not len(self.keys) or len(raw) > self.keys.dtype.itemsize:
+            return default
+        pos = int(np.searchsorted(self.keys, raw))
+        if pos == len(self.keys) or self.keys[pos] != raw:
+            return default
+        return int(self.rows[pos])
+
+    def __contains__(self, key) -> bool:
+        return self.get(key) is not None
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+
+class ArtifactSnapshot:
+    """
+    Одна неизменяемая версия артефактов: манифест + плоские .npy/Arrow файлы.
+    Файлы открываются лениво при первом обращении: проверяется размер и sha256,
+    затем .npy отображается через np.load(mmap_mode='r'), Arrow — через pa.memory_map.
+    Страницы берутся из общего page cache ОС, так что все воркеры uvicorn
+    делят одну физическую копию.
+    """
+
+    def __init__(self, path: str, verify: bool = ARTIFACTS_VERIFY):
+        self.path = path
+        self.verify_checksums = verify
+        with open(os.path.join(path, MANIFEST_FILE), "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+        if not isinstance(manifest.get("files"), dict):
+            raise ArtifactError(f"{path}: в манифесте нет раздела files")
+        self.version = manifest.get("version") or os.path.basename(path)
+        self.created_at = manifest.get("created_at")
+        self.files = manifest["files"]
+        self.loaded_at = time.time()
+        self._cache = {}
+        self._lock = threading.Lock()
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.files
+
+    def get(self, name: str, default=None):
+        """Массив (или pyarrow.Table) артефакта; None, если его нет в этой версии."""
+        if name not in self.files:
+            return default
+        value = self._cache.get(name)
+        if value is None:
+            with self._lock:
+                value = self._cache.get(name)
+                if value is None:
+                    value = self._open(name, self.files[name])
+                    self._cache[name] = value
+        return value
+
+    def _open(self, name: str, entry: dict):
+        path = os.path.join(self.path, entry["path"])
+        try:
+            size = os.path.getsize(path)
+        except OSError as e:
+            raise ArtifactError(f"{self.version}/{name}: файл недоступен ({e})") from None
+        if size != entry.get("size", size):
+            raise ArtifactError(f"{self.version}/{name}: размер {size}, в манифесте {entry['size']}")
+        if self.verify_checksums and entry.get("sha256") and not self._is_verified(name, path, entry):
+            if file_sha256(path) != entry["sha256"]:
+                raise ArtifactError(f"{self.version}/{name}: контрольная сумма не совпадает")
+            self._mark_verified(name, path, entry)
+
+        if entry.get("format", FORMAT_NPY) == FORMAT_ARROW:
+            import pyarrow as pa
+
+            return pa.ipc.open_file(pa.memory_map(path, "r")).read_all()
+
+        array = np.load(path, mmap_mode="r", allow_pickle=False)
+        if "dtype" in entry and str(array.dtype) != entry["dtype"]:
+            raise ArtifactError(f"{self.version}/{name}: dtype {array.dtype}, в манифесте {entry['dtype']}")
+        if "shape" in entry and list(array.shape) != list(entry["shape"]):
+            raise ArtifactError(f"{self.version}/{name}: shape {array.shape}, в манифесте {entry['shape']}")
+        return array
+
+    @staticmethod
+    def _stamp(path: str, entry: dict) -> list:
+        stat = os.stat(path)
+        return [entry["sha256"], stat.st_size, stat.st_mtime_ns]
+
+    def _is_verified(self, name: str, path: str, entry: dict) -> bool:
+        """Файл уже сверялся с этим sha256 и с тех пор не менялся (размер и mtime те же)."""
+        try:
+            with open(os.path.join(self.path, VERIFIED_FILE), "r", encoding="utf-8") as f:
+                return json.load(f).get(name) == self._stamp(path, entry)
+        except (OSError, ValueError):
+            return False
+
+    def _mark_verified(self, name: str, path: str, entry: dict):
+        """Запоминает проверку (best effort: каталог версии может быть только для чтения)."""
+        marker = os.path.join(self.path, VERIFIED_FILE)
+        tmp = f"{marker}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            try:
+                with open(marker, "r", encoding="utf-8") as f:
+                    verified = json.load(f)
+            except (OSError, ValueError):
+                verified = {}
+            verified[name] = self._stamp(path, entry)
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(verified, f)
+            os.replace(tmp, marker)
+        except OSError:
+            pass
+
+    def verify(self):
+        """Открывает и проверяет все файлы версии (используется перед переключением)."""
+        for name in self.files:
+            self.get(name)
+
+    def key_index(self, prefix: str):
+        """SortedKeyIndex по артефактам <prefix>_keys / <prefix>_key_ids или None."""
+        keys, rows = self.get(f"{prefix}_keys"), self.get(f"{prefix}_key_ids")
+        if keys is None or rows is None:
+            return None
+        return SortedKeyIndex(keys, rows)
+
+    def info(self) -> dict:
+        return {
+            "version": self.version,
+            "created_at": self.created_at,
+            "loaded_at": self.loaded_at,
+            "files": sorted(self.files),
+            "opened": sorted(self._cache),
+        }
+
+
+class ArtifactRegistry:
+    """
+    Реестр версий артефактов в каталоге ARTIFACTS_DIR:
+
+        versions/<version>/manifest.json + файлы
+        CURRENT  — имя активной версии
+
+    Публикация пишет новую версию целиком и только потом атомарно подменяет
+    CURRENT (os.replace). Воркеры опрашивают CURRENT, проверяют новую версию
+    в фоне и переключают ссылку на снимок одним присваиванием, как CatalogManager.
+    Битая версия отклоняется, сервис остаётся на текущей.
+    """
+
+    def __init__(self, root: str = ARTIFACTS_DIR, on_switch=None, poll_interval: float = ARTIFACTS_POLL_INTERVAL):
+        self.root = root
+        self.on_switch = on_switch
+        self.poll_interval = poll_interval
+        self._stop = threading.Event()
+        self._thread = None
+        self._reload_lock = threading.Lock()
+
+        self.current = None
+        try:
+            version = self._current_version()
+            if version is not None:
+                self.current = ArtifactSnapshot(self._version_path(version))
+                print(f"Артефакты: активна версия {self.current.version} ({len(self.current.files)} файлов).")
+        except Exception as e:
+            print(f"Ошибка при загрузке артефактов: {e}")
+
+    def _version_path(self, version: str) -> str:
+        return os.path.join(self.root, VERSIONS_DIR, version)
+
+    def _current_version(self):
+        try:
+            with open(os.path.join(self.root, CURRENT_FILE), "r", encoding="utf-8") as f:
+                return f.read().strip() or None
+        except FileNotFoundError:
+            return None
+
+    def reload_if_changed(self) -> bool:
+        """Переключается на версию из CURRENT, если она сменилась. Возвращает True при переключении."""
+        with self._reload_lock:
+            try:
+                version = self._current_version()
+                if version is None or (self.current is not None and version == self.current.version):
+                    return False
+                snapshot = ArtifactSnapshot(self._version_path(version))
+                snapshot.verify()
+            except Exception as e:
+                print(f"Новая версия артефактов отклонена: {e}")
+                return False
+
+            self.current = snapshot
+            print(f"Артефакты: переключились на версию {snapshot.version}.")
+        if self.on_switch is not None:
+            self.on_switch(snapshot)
+        return True
+
+    def _watch(self):
+        while not self._stop.wait(self.poll_interval):
+            self.reload_if_changed()
+
+    def start(self):
+        """Запускает фоновое наблюдение за указателем CURRENT."""
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._watch, name="artifacts-watcher", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.poll_interval)
+
+
+def _describe(path: str) -> dict:
+    entry = {"size": os.path.getsize(path), "sha256": file_sha256(path)}
+    entry["format"] = _FORMATS.get(os.path.splitext(path)[1].lower(), FORMAT_NPY)
+    if entry["format"] == FORMAT_NPY:
+        array = np.load(path, mmap_mode="r", allow_pickle=False)
+        entry.update(dtype=str(array.dtype), shape=list(array.shape))
+    return entry
+
+
+def switch_version(root: str, version: str):
+    """Атомарно делает версию активной: CURRENT переписывается через временный файл и os.replace."""
+    if not os.path.exists(os.path.join(root, VERSIONS_DIR, version, MANIFEST_FILE)):
+        raise ArtifactError(f"версия {version} не опубликована в {root}")
+    tmp = os.path.join(root, f".{CURRENT_FILE}.{os.getpid()}.tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(version)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, os.path.join(root, CURRENT_FILE))
+
+
+def publish(root: str, files: dict, version: str = None, activate: bool = True) -> str:
+    """
+    Публикует новую версию: файлы {имя артефакта: путь} копируются в versions/<version>/, для каждого считается sha256, затем
+    пишется манифест. Версия по умолчанию — хэш контрольных сумм.
+    """
+    staging = os.path.join(root, VERSIONS_DIR, f".staging-{os.getpid()}-{int(time.time() * 1000)}")
+    os.makedirs(staging)
+    entries = {}
+    try:
+        for name, source in sorted(files.items()):
+            target = name + os.path.splitext(source)[1]
+            destination = os.path.join(staging, target)
+            # Копия, а не жёсткая ссылка: перезапись исходника (np.save) не должна задеть опубликованную версию
+            shutil.copyfile(source, destination)
+            entries[name] = {"path": target, **_describe(destination)}
+
+        if version is None:
+            fingerprint = json.dumps({name: entry["sha256"] for name, entry in entries.items()}, sort_keys=True)
+            version = hashlib.sha256(fingerprint.encode("utf-8")).hexdigest()[:12]
+        manifest = {"version": version, "created_at": time.time(), "files": entries}
+        with open(os.path.join(staging, MANIFEST_FILE), "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+
+        final = os.path.join(root, VERSIONS_DIR, version)
+        if os.path.exists(final):
+            shutil.rmtree(staging)
+        else:
+            os.rename(staging, final)
+    except BaseException:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+
+    if activate:
+        switch_version(root, version)
+    return version
+
+
+def _parse_files(pairs: list) -> dict:
+    files = {}
+    for pair in pairs:
+        name, sep, path = pair.partition("=")
+        if not sep:
+            raise SystemExit(f"Неверный аргумент '{pair}', нужен формат имя=путь")
+        files[name] = path
+    return files
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Публикация и переключение версий артефактов веб-сервиса.")
+    parser.add_argument("--root", default=ARTIFACTS_DIR, help="Каталог реестра (ARTIFACTS_DIR).")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    pub = commands.add_parser("publish", help="Опубликовать новую версию и сделать её активной.")
+    pub.add_argument("files", nargs="*", help="Файлы вида имя=путь (.npy или .arrow).")
+    pub.add_argument("--als", default=None, help="Каталог выгрузки train_als (факторы пользователей + словарь); нужен --clusters с cluster_factors.")
+    pub.add_argument("--clusters", default=None, help="Каталог выгрузки cluster_users (кластеры всех пользователей).")
+    pub.add_argument("--profiles", default=None, help="Каталог выгрузки build_profiles (профили пользователей).")
+    pub.add_argument("--version", default=None, help="Имя версии (по умолчанию — хэш содержимого).")
+    pub.add_argument("--no-activate", action="store_true", help="Только опубликовать, не переключать CURRENT.")
+
+    switch = commands.add_parser("switch", help="Сделать активной уже опубликованную версию (откат).")
+    switch.add_argument("version")
+
+    commands.add_parser("list", help="Показать опубликованные версии.")
+
+    args = parser.parse_args()
+    if args.command == "publish":
+        if args.als and not (args.clusters and os.path.exists(os.path.join(args.clusters, CLUSTER_FILES["cluster_factors"]))):
+            parser.error("--als без cluster_factors бесполезен: запустите cluster_users --als и передайте его выгрузку в --clusters")
+        files = {}
+        if args.als:
+            files.update({name: os.path.join(args.als, path) for name, path in ALS_FILES.items()})
+        if args.clusters:
+            files.update({name: os.path.join(args.clusters, path) for name, path in CLUSTER_FILES.items()})
+        if args.profiles:
+            files.update({name: os.path.join(args.profiles, path) for name, path in PROFILE_FILES.items()})
+        files = {
+            name: path for name, path in files.items() if name not in OPTIONAL_FILES or os.path.exists(path)
+        }
+        files.update(_parse_files(args.files))
+        if not files:
+            parser.error("нечего публиковать: укажите файлы, --als, --clusters или --profiles")
+        version = publish(args.root, files, version=args.version, activate=not args.no_activate)
+        print(f"Опубликована версия {version}" + ("" if args.no_activate else " (активна)"))
+    elif args.command == "switch":
+        switch_version(args.root, args.version)
+        print(f"Активна версия {args.version}")
+    else:
+        registry = ArtifactRegistry(args.root)
+        active = registry.current.version if registry.current else None
+        versions_dir = os.path.join(args.root, VERSIONS_DIR)
+        for version in sorted(os.listdir(versions_dir)) if os.path.isdir(versions_dir) else []:
+            if not version.startswith("."):
+                print(("* " if version == active else "  ") + version)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+import csv
+import io
+import json
+import os
+
+# Размер чанка user_id для пакетного скоринга: ограничивает память независимо от размера входа
+BATCH_CHUNK_SIZE = 2048
+# Максимум user_id в JSON-теле пакетного запроса
+BATCH_MAX_USERS = int(os.environ.get("BATCH_MAX_USERS", 100_000))
+USER_ID_COLUMN = "user_id"
+
+FORMAT_NDJSON = "ndjson"
+FORMAT_ARROW = "arrow"
+MEDIA_TYPES = {
+    FORMAT_NDJSON: "application/x-ndjson",
+    FORMAT_ARROW: "application/vnd.apache.arrow.stream",
+}
+
+
+def iter_list_chunks(user_ids: list, chunk_size: int = BATCH_CHUNK_SIZE):
+    """Чанки из списка user_id, пришедшего в JSON."""
+    for start in range(0, len(user_ids), chunk_size):
+        yield user_ids[start:start + chunk_size]
+
+
+def iter_csv_chunks(fileobj, chunk_size: int = BATCH_CHUNK_SIZE):
+    """
+    Построчно читает CSV с колонкой user_id (или одной колонкой без заголовка).
+    В памяти держится только текущий чанк. Несколько колонок без user_id — ValueError.
+    """
+    reader = csv.reader(io.TextIOWrapper(fileobj, encoding="utf-8-sig", newline=""))
+    header = next(reader, None)
+    if header is None:
+        return
+
+    column = 0
+    chunk = []
+    if USER_ID_COLUMN in header:
+        column = header.index(USER_ID_COLUMN)
+    elif len(header) > 1:
+        raise ValueError(f"в CSV нет колонки {USER_ID_COLUMN}")
+    elif header and header[0]:
+        chunk.append(header[0])
+
+    for row in reader:
+        if len(row) > column and row[column]:
+            chunk.append(row[column])
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def iter_parquet_chunks(fileobj, chunk_size: int = BATCH_CHUNK_SIZE):
+    """Читает из Parquet только колонку user_id, по record batch за раз."""
+    import pyarrow.parquet as pq
+
+    try:
+        parquet = pq.ParquetFile(fileobj)
+    except Exception as e:
+        raise ValueError(f"не удалось открыть Parquet: {e}") from None
+    if USER_ID_COLUMN not in parquet.schema_arrow.names:
+        raise ValueError(f"в Parquet нет колонки {USER_ID_COLUMN}")
+    for batch in parquet.iter_batches(batch_size=chunk_size, columns=[USER_ID_COLUMN]):
+        yield [str(user_id) for user_id in batch.column(0).to_pylist() if user_id is not None]
+
+
+def iter_file_chunks(fileobj, filename: str, chunk_size: int = BATCH_CHUNK_SIZE):
+    """Выбираем ридер по расширению загруженного файла."""
+    name = (filename or "").lower()
+    if name.endswith((".parquet", ".pq")):
+        return iter_parquet_chunks(fileobj, chunk_size)
+    if name.endswith((".csv", ".txt")):
+        return iter_csv_chunks(fileobj, chunk_size)
+    raise ValueError("Поддерживаются только файлы .csv и .parquet")
+
+
+def encode_ndjson(user_ids: list, indices, scores, products: list) -> bytes:
+    """Одна строка JSON на пользователя."""
+    lines = []
+    for user_id, row_idx, row_scores in zip(user_ids, indices, scores):
+        items = [
+            {
+                "product_name": products[idx].product_name,
+                "product_type": products[idx].product_type,
+                "score": float(score),
+            }
+            for idx, score in zip(row_idx, row_scores)
+        ]
+        lines.append(json.dumps({"user_id": user_id, "items": items}, ensure_ascii=False))
+    return ("\n".join(lines) + "\n").encode("utf-8") if lines else b""
+
+
+class ArrowStreamEncoder:
+    """
+    Пишет результаты в Arrow IPC stream (длинный формат: user_id, rank, product_name, product_type, score).
+    Каждый чанк — отдельный record batch, байты отдаются сразу.
+    """
+
+    def __init__(self):
+        import pyarrow as pa
+
+        self.pa = pa
+        self.schema = pa.schema([
+            ("user_id", pa.string()),
+            ("rank", pa.int16()),
+            ("product_name", pa.string()),
+            ("product_type", pa.string()),
+            ("score", pa.float32()),
+        ])
+        self.sink = io.BytesIO()
+        self.writer = pa.ipc.new_stream(self.sink, self.schema)
+
+    def _drain(self) -> bytes:
+        data = self.sink.getvalue()
+        self.sink.seek(0)
+        self.sink.truncate()
+        return data
+
+    def encode(self, user_ids: list, indices, scores, products: list) -> bytes:
+        pa = self.pa
+        # Строки разной длины: у маленьких кластеров кандидатов меньше k
+        lengths = [len(row) for row in indices]
+        flat = [int(idx) for row in indices for idx in row]
+        batch = pa.record_batch([
+            pa.array([user_id for user_id, n in zip(user_ids, lengths) for _ in range(n)], pa.string()),
+            pa.array([rank for n in lengths for rank in range(1, n + 1)], pa.int16()),
+            pa.array([products[idx].product_name for idx in flat], pa.string()),
+            pa.array([products[idx].product_type for idx in flat], pa.string()),
+            pa.array([float(score) for row in scores for score in row], pa.float32()),
+        ], schema=self.schema)
+        self.writer.write_batch(batch)
+        return self._drain()
+
+    def close(self) -> bytes:
+        self.writer.close()
+        return self._drain()
@@ -0,0 +1,76 @@
+import json
+import os
+
+import numpy as np
+
+
+def _support_path(filename: str) -> str:
+    base_path = os.path.dirname(os.path.abspath(__file__))
+    project_root = os.path.dirname(os.path.dirname(base_path))
+    return os.path.join(project_root, "data", "support", filename)
+
+
+def load_cluster_mapping() -> dict:
+    """Загружаем соответствие соцдем-кластер -> список названий продуктов (data/support/mapping.json)."""
+    try:
+        with open(_support_path("mapping.json"), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except Exception as e:
+        print(f"Ошибка при загрузке mapping.json: {e}")
+        return {}
+
+
+def _normalize_name(name: str) -> str:
+    """Нормализация названия для нестрогого сопоставления (регистр, ё, виды кавычек, пробелы)."""
+    name = (name or "").casefold().replace("ё", "е")
+    for quote in "«»\"“”„'":
+        name = name.replace(quote, "")
+    return " ".join(name.split())
+
+
+class ClusterCandidateIndex:
+    """
+    Индекс кандидатов по соцдем-кластерам: названия продуктов из mapping.json
+    один раз резолвятся в id каталога и хранятся массивами int32.
+    Нерезолвленные названия печатаются при загрузке.
+    """
+
+    def __init__(self, catalog, mapping: dict, clusters: dict):
+        normalized = {_normalize_name(p.product_name): p.product_id for p in catalog.products}
+
+        self.cluster_ids = sorted(int(cluster_id) for cluster_id in clusters)
+        self.cluster_names = {int(cluster_id): info.get("name") for cluster_id, info in clusters.items()}
+        self.unresolved = {}
+        self._candidates = {}
+
+        size = (max(self.cluster_ids) + 1) if self.cluster_ids else 0
+        # mask[cluster, product] — продукт входит в кандидаты кластера (для пакетного скоринга)
+        self.mask = np.zeros((size, len(catalog)), dtype=bool)
+
+        for cluster_id in self.cluster_ids:
+            name = self.cluster_names[cluster_id]
+            ids, missing = [], []
+            for product_name in mapping.get(name, []):
+                product_id = catalog.by_name.get(product_name)
+                if product_id is None:
+                    product_id = normalized.get(_normalize_name(product_name))
+                if product_id is None:
+                    missing.append(product_name)
+                elif product_id not in ids:
+                    ids.append(product_id)
+
+            if missing:
+                self.unresolved[name] = missing
+            if not ids:
+                # Без кандидатов кластер скорится по всему каталогу
+                self.mask[cluster_id] = True
+                continue
+            self._candidates[cluster_id] = np.array(ids, dtype=np.int32)
+            self.mask[cluster_id, ids] = True
+
+        for name, missing in self.unresolved.items():
+            print(f"mapping.json: для кластера '{name}' не найдены продукты: {', '.join(missing)}")
+
+    def get(self, cluster_id: int):
+        """id продуктов-кандидатов кластера или None (скорить весь каталог)."""
+        return self._candidates.get(cluster_id)
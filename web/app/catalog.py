@@ -0,0 +1,138 @@
+import bisect
+import re
+
+import numpy as np
+
+_NUMBER = r"(\d+(?:[.,]\d+)?)"
+_RATE_RE = re.compile(_NUMBER + r"(?:\s*-\s*" + _NUMBER + r")?\s*%")
+_TERM_RE = re.compile(_NUMBER + r"(?:\s*-\s*" + _NUMBER + r")?\s*(лет|год|мес|дн|ден)")
+
+# Перевод единиц срока в месяцы
+_TERM_UNITS = {"лет": 12.0, "год": 12.0, "мес": 1.0, "дн": 1 / 30.4375, "ден": 1 / 30.4375}
+
+
+def _to_float(value) -> float:
+    if value is None:
+        return np.nan
+    try:
+        return float(str(value).replace(",", ".").replace(" ", ""))
+    except ValueError:
+        return np.nan
+
+
+def parse_rate(text) -> tuple:
+    """'27.9-39.9%' -> (27.9, 39.9); 'до 17%' / 'от 27.9%' -> (17.0, 17.0); иначе (nan, nan)."""
+    match = _RATE_RE.search(text or "")
+    if not match:
+        return np.nan, np.nan
+    low = _to_float(match.group(1))
+    high = _to_float(match.group(2)) if match.group(2) else low
+    return low, high
+
+
+def parse_term_months(text) -> tuple:
+    """'1-7 лет' -> (12, 84); '91-367 дней' -> (~3.0, ~12.06); 'бессрочный' -> (nan, nan)."""
+    match = _TERM_RE.search(text or "")
+    if not match:
+        return np.nan, np.nan
+    factor = _TERM_UNITS[match.group(3)]
+    low = _to_float(match.group(1)) * factor
+    high = (_to_float(match.group(2)) if match.group(2) else _to_float(match.group(1))) * factor
+    return low, high
+
+
+class Product:
+    """Продукт каталога: исходные поля + распарсенные числовые диапазоны."""
+
+    __slots__ = (
+        "product_id", "product_name", "product_type", "currency", "rate", "amount_min", "amount_max",
+        "term", "requirements", "source_url", "rate_range", "amount_range", "term_months",
+    )
+
+    def __init__(self, product_id: int, raw: dict):
+        self.product_id = product_id
+        self.product_name = raw.get("product_name")
+        self.product_type = raw.get("product_type")
+        self.currency = raw.get("currency")
+        self.rate = raw.get("rate")
+        self.amount_min = raw.get("amount_min")
+        self.amount_max = raw.get("amount_max")
+        self.term = raw.get("term")
+        self.requirements = raw.get("requirements")
+        self.source_url = raw.get("source_url")
+
+        self.rate_range = parse_rate(self.rate)
+        self.amount_range = (_to_float(self.amount_min), _to_float(self.amount_max))
+        self.term_months = parse_term_months(self.term)
+
+
+class _SortedIndex:
+    """Отсортированные значения столбца + id продуктов: диапазонный запрос через bisect."""
+
+    def __init__(self, values: np.ndarray):
+        known = np.flatnonzero(~np.isnan(values))
+        order = known[np.argsort(values[known], kind="stable")]
+        self.ids = order.astype(np.int32)
+        self.values = values[order].tolist()
+
+    def at_least(self, threshold: float) -> np.ndarray:
+        return self.ids[bisect.bisect_left(self.values, threshold):]
+
+    def at_most(self, threshold: float) -> np.ndarray:
+        return self.ids[:bisect.bisect_right(self.values, threshold)]
+
+
+class ProductCatalog:
+    """
+    Типизированный каталог продуктов: числовые поля распарсены один раз и лежат
+    в колонках numpy, есть индексы по product_type, названию, ставке и сроку.
+    """
+
+    def __init__(self, records: list):
+        self.products = [Product(i, raw) for i, raw in enumerate(records)]
+        self.product_types = sorted({p.product_type or "other" for p in self.products})
+
+        # Колонки (nan — значение не указано)
+        self.rate_min = np.array([p.rate_range[0] for p in self.products], dtype=np.float64)
+        self.rate_max = np.array([p.rate_range[1] for p in self.products], dtype=np.float64)
+        self.amount_min = np.array([p.amount_range[0] for p in self.products], dtype=np.float64)
+        self.amount_max = np.array([p.amount_range[1] for p in self.products], dtype=np.float64)
+        self.term_min_months = np.array([p.term_months[0] for p in self.products], dtype=np.float64)
+        self.term_max_months = np.array([p.term_months[1] for p in self.products], dtype=np.float64)
+
+        # Индексы
+        self.by_name = {p.product_name: p.product_id for p in self.products}
+        by_type = {}
+        for p in self.products:
+            by_type.setdefault(p.product_type or "other", []).append(p.product_id)
+        self.by_type = {t: np.array(ids, dtype=np.int32) for t, ids in by_type.items()}
+        self._rate_index = _SortedIndex(self.rate_max)
+        self._term_index = _SortedIndex(self.term_min_months)
+
+    def __len__(self) -> int:
+        return len(self.products)
+
+    def __getitem__(self, product_id: int) -> Product:
+        return self.products[product_id]
+
+    def get_by_name(self, name: str):
+        product_id = self.by_name.get(name)
+        return None if product_id is None else self.products[product_id]
+
+    def filter(self, product_type: str = None, min_rate: float = None, max_term_months: float = None) -> np.ndarray:
+        """
+        id продуктов, удовлетворяющих всем условиям:
+        тип совпадает, максимальная ставка >= min_rate, минимальный срок <= max_term_months.
+        """
+        result = None
+        if product_type is not None:
+            result = self.by_type.get(product_type, np.empty(0, dtype=np.int32))
+        if min_rate is not None:
+            ids = self._rate_index.at_least(min_rate)
+            result = ids if result is None else np.intersect1d(result, ids, assume_unique=True)
+        if max_term_months is not None:
+            ids = self._term_index.at_most(max_term_months)
+            result = ids if result is None else np.intersect1d(result, ids, assume_unique=True)
+        if result is None:
+            return np.arange(len(self.products), dtype=np.int32)
+        return np.sort(result)
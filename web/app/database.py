@@ -1,17 +1,116 @@
+import hashlib
 import json
+import os
+import threading
+import time
+from app.catalog import ProductCatalog
 
 PRODUCTS_FILE = "psb_products_updated.json"
+# Как часто фоновый поток проверяет файл каталога на изменения (сек)
+CATALOG_POLL_INTERVAL = float(os.environ.get("CATALOG_POLL_INTERVAL", 5.0))
 
-def load_products():
-    """Загружаем продукты из JSON файла."""
-    try:
-        with open(PRODUCTS_FILE, "r", encoding="utf-8") as f:
-            data = json.load(f)
-        print(f"Загружено {len(data)} банковских продуктов.")
-        return data
-    except Exception as e:
-        print(f"Ошибка при загрузке продуктов: {e}")
-        return []
-
-# Инициализируем базу данных при импорте модуля
-PRODUCTS_DB = load_products()
+
+def validate_products(data) -> list:
+    """Проверяем структуру новой версии каталога до того, как она станет активной."""
+    if not isinstance(data, list) or not data:
+        raise ValueError("каталог должен быть непустым списком продуктов")
+    for i, product in enumerate(data):
+        if not isinstance(product, dict):
+            raise ValueError(f"продукт #{i} не является объектом")
+        if not product.get("product_name") or not product.get("product_type"):
+            raise ValueError(f"у продукта #{i} нет product_name/product_type")
+    return data
+
+
+class CatalogSnapshot:
+    """Неизменяемая версия каталога вместе с производными структурами (движок скоринга)."""
+
+    __slots__ = ("version", "catalog", "engine", "loaded_at")
+
+    def __init__(self, version: str, catalog: ProductCatalog, engine=None):
+        self.version = version
+        self.catalog = catalog
+        self.engine = engine
+        self.loaded_at = time.time()
+
+
+class CatalogManager:
+    """
+    Следит за файлом каталога и подменяет активный снимок без перезапуска.
+    Новая версия парсится и валидируется в фоне, затем ссылка на снимок
+    заменяется одним присваиванием (copy-on-write): читатели берут
+    `manager.current` без блокировок и работают с согласованной версией.
+    """
+
+    def __init__(self, path: str = PRODUCTS_FILE, build_engine=None, poll_interval: float = CATALOG_POLL_INTERVAL):
+        self.path = path
+        self.build_engine = build_engine
+        self.poll_interval = poll_interval
+        self._stat = None
+        self._stop = threading.Event()
+        self._thread = None
+        self._reload_lock = threading.Lock()
+
+        try:
+            self.current = self._load()
+        except Exception as e:
+            print(f"Ошибка при загрузке продуктов: {e}")
+            self.current = self._snapshot("empty", [])
+
+    def _snapshot(self, version: str, records: list) -> CatalogSnapshot:
+        catalog = ProductCatalog(records)
+        engine = self.build_engine(catalog) if self.build_engine else None
+        return CatalogSnapshot(version, catalog, engine)
+
+    def _file_stat(self):
+        stat = os.stat(self.path)
+        return stat.st_mtime_ns, stat.st_size
+
+    def _load(self) -> CatalogSnapshot:
+        self._stat = self._file_stat()
+        with open(self.path, "rb") as f:
+            raw = f.read()
+        records = validate_products(json.loads(raw.decode("utf-8")))
+        version = hashlib.sha256(raw).hexdigest()[:12]
+        print(f"Загружено {len(records)} банковских продуктов (версия каталога {version}).")
+        return self._snapshot(version, records)
+
+    def reload_if_changed(self) -> bool:
+        """Перечитывает каталог, если файл изменился. Возвращает True, если версия сменилась."""
+        with self._reload_lock:
+            try:
+                if self._file_stat() == self._stat:
+                    return False
+                snapshot = self._load()
+            except Exception as e:
+                # Битая версия файла не должна ронять сервис: остаёмся на текущем снимке
+                print(f"Новая версия каталога отклонена: {e}")
+                return False
+
+            if snapshot.version == self.current.version:
+                return False
+            self.current = snapshot
+            return True
+
+    def rebuild_engine(self):
+        """Пересобирает движок для текущей версии каталога (например, после смены версии артефактов)."""
+        with self._reload_lock:
+            snapshot = self.current
+            engine = self.build_engine(snapshot.catalog) if self.build_engine else None
+            self.current = CatalogSnapshot(snapshot.version, snapshot.catalog, engine)
+
+    def _watch(self):
+        while not self._stop.wait(self.poll_interval):
+            self.reload_if_changed()
+
+    def start(self):
+        """Запускает фоновое наблюдение за файлом каталога."""
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._watch, name="catalog-watcher", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.poll_interval)
@@ -0,0 +1,338 @@
+import hashlib
+import os
+
+import numpy as np
+
+USER_FACTORS_FILE = os.environ.get("USER_FACTORS_FILE", "artifacts/user_factors.npz")
+
+TOP_K = 5
+# Размерность демо-векторов, когда обученных факторов нет совсем
+DEMO_DIM = 16
+
+
+def _stable_seed(value: str) -> int:
+    """Детерминированный seed из строки (не зависит от PYTHONHASHSEED)."""
+    digest = hashlib.blake2b(value.encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "little")
+
+
+def _stable_vector(key: str, dim: int = DEMO_DIM) -> np.ndarray:
+    rng = np.random.default_rng(_stable_seed(key))
+    return rng.standard_normal(dim, dtype=np.float32) / np.sqrt(dim)
+
+
+def build_product_factors(catalog, candidates=None, cluster_factors=None) -> np.ndarray:
+    """
+    Строит матрицу факторов продуктов [n_products, dim] в пространстве ALS-факторов пользователей:
+    продукт — средний фактор соцдем-кластеров, которым он предлагается (mapping.json),
+    продукт вне кандидатов — средний фактор всех кластеров.
+    Размерность задаёт модель (cluster_factors), а не каталог, поэтому факторы пользователей
+    переживают перезагрузку каталога. Без модели — демо: детерминированный вектор по названию продукта.
+    """
+    if cluster_factors is None:
+        factors = np.zeros((len(catalog), DEMO_DIM), dtype=np.float32)
+        for product in catalog.products:
+            factors[product.product_id] = _stable_vector(f"product:{product.product_name or product.product_id}")
+        return factors
+    cluster_factors = np.asarray(cluster_factors, dtype=np.float32)
+    factors = np.tile(_mean_vector(cluster_factors), (len(catalog), 1))
+    if candidates is not None and len(catalog):
+        ids = [c for c in candidates.cluster_ids if c < len(cluster_factors) and candidates.get(c) is not None]
+        if ids:
+            member = candidates.mask[ids].astype(np.float32)  # [кластеры, продукты]
+            counts = member.sum(axis=0)
+            offered = counts > 0
+            factors[offered] = (member.T @ cluster_factors[ids])[offered] / counts[offered, None]
+    return factors
+
+
+def _mean_vector(cluster_factors: np.ndarray) -> np.ndarray:
+    if not len(cluster_factors):
+        return np.zeros(cluster_factors.shape[1], dtype=np.float32)
+    return cluster_factors.mean(axis=0).astype(np.float32)
+
+
+def derive_cluster_factors(user_factors: np.ndarray, user_clusters: np.ndarray, chunk_size: int = 1 << 20):
+    """
+    Средний фактор пользователей каждого кластера по user_factors и выровненным с ними user_clusters
+    (npz или артефакты без cluster_factors). Матрица читается чанками, так что mmap не копируется целиком.
+    """
+    clusters = np.asarray(user_clusters)
+    known = clusters[clusters >= 0]
+    if not len(known):
+        return None
+    n_clusters = int(known.max()) + 1
+    sums = np.zeros((n_clusters, user_factors.shape[1]))
+    counts = np.zeros(n_clusters, dtype=np.int64)
+    for lo in range(0, len(clusters), chunk_size):
+        labels = clusters[lo:lo + chunk_size]
+        rows = np.flatnonzero(labels >= 0)
+        np.add.at(sums, labels[rows], np.asarray(user_factors[lo:lo + chunk_size], dtype=np.float64)[rows])
+        counts += np.bincount(labels[rows], minlength=n_clusters)
+    return (sums / np.maximum(counts, 1)[:, None]).astype(np.float32)
+
+
+def load_user_factors(artifacts=None, factors_file: str = USER_FACTORS_FILE) -> tuple:
+    """
+    Загружаем предрасчитанные факторы пользователей.
+    Если в активной версии артефактов есть user_factors (+ user_keys/user_key_ids, опционально
+    user_clusters), они отображаются в память через mmap и не копируются в каждый воркер;
+    поиск строки — бинарный поиск по отсортированным ключам.
+    Иначе — npz: user_ids, factors и опционально clusters.
+    Возвращает (индекс user_id -> строка, матрица факторов, кластеры) или (None, None, None).
+    """
+    if artifacts is not None and "user_factors" in artifacts:
+        try:
+            user_index = artifacts.key_index("user")
+            if user_index is None:
+                raise ValueError("нет user_keys/user_key_ids")
+            user_factors = artifacts.get("user_factors")
+            user_clusters = artifacts.get("user_clusters")
+            print(f"Факторы {len(user_index)} пользователей из артефактов версии {artifacts.version} (mmap).")
+            return user_index, user_factors, user_clusters
+        except Exception as e:
+            print(f"Ошибка при загрузке факторов из артефактов {artifacts.version}: {e}")
+
+    if not os.path.exists(factors_file):
+        return None, None, None
+    try:
+        with np.load(factors_file, allow_pickle=False) as data:
+            user_ids, user_factors = data["user_ids"], data["factors"]
+            user_clusters = data["clusters"].astype(np.int32) if "clusters" in data.files else None
+        print(f"Загружены факторы {len(user_ids)} пользователей.")
+        user_index = {str(uid): i for i, uid in enumerate(user_ids)}
+        return user_index, np.ascontiguousarray(user_factors, dtype=np.float32), user_clusters
+    except Exception as e:
+        print(f"Ошибка при загрузке факторов пользователей: {e}")
+        return None, None, None
+
+
+def load_user_clusters(artifacts=None) -> tuple:
+    """
+    Кластеры всех пользователей от recsys.clustering (cluster_keys/cluster_key_ids/clusters):
+    покрывают и пользователей без ALS-факторов, поиск — бинарный поиск по mmap-ключам.
+    Возвращает (индекс user_id -> строка, кластеры) или (None, None).
+    """
+    if artifacts is None or "clusters" not in artifacts:
+        return None, None
+    try:
+        cluster_index = artifacts.key_index("cluster")
+        if cluster_index is None:
+            raise ValueError("нет cluster_keys/cluster_key_ids")
+        clusters = artifacts.get("clusters")
+        print(f"Кластеры {len(cluster_index)} пользователей из артефактов версии {artifacts.version} (mmap).")
+        return cluster_index, clusters
+    except Exception as e:
+        print(f"Ошибка при загрузке кластеров из артефактов {artifacts.version}: {e}")
+        return None, None
+
+
+def load_profile_clusters(artifacts=None) -> tuple:
+    """
+    socdem_cluster пользователей из users.pq (build_profiles: profile_keys/profile_key_ids/profile_clusters):
+    по нему же строится сегмент профиля. Возвращает (индекс user_id -> строка, кластеры) или (None, None).
+    """
+    if artifacts is None or "profile_clusters" not in artifacts:
+        return None, None
+    try:
+        profile_index = artifacts.key_index("profile")
+        if profile_index is None:
+            raise ValueError("нет profile_keys/profile_key_ids")
+        return profile_index, artifacts.get("profile_clusters")
+    except Exception as e:
+        print(f"Ошибка при загрузке socdem_cluster из артефактов {artifacts.version}: {e}")
+        return None, None
+
+
+def load_cluster_factors(artifacts=None):
+    """
+    Средние ALS-факторы пользователей по соцдем-кластерам (cluster_users --als, cluster_factors.npy):
+    из них строятся факторы продуктов и векторы пользователей без факторов. Возвращает матрицу или None.
+    """
+    if artifacts is None or "cluster_factors" not in artifacts:
+        return None
+    try:
+        return artifacts.get("cluster_factors")
+    except Exception as e:
+        print(f"Ошибка при загрузке факторов кластеров из артефактов {artifacts.version}: {e}")
+        return None
+
+
+def _sigmoid(x: np.ndarray) -> np.ndarray:
+    return 1.0 / (1.0 + np.exp(-x))
+
+
+class RecommendationEngine:
+    """
+    Скоринговый движок: факторы продуктов и пользователей загружаются один раз,
+    скоринг запроса — одно матрично-векторное произведение + argpartition top-k.
+    Если задан индекс кандидатов, скорятся только продукты соцдем-кластера пользователя,
+    а для пользователей без факторов отдаётся заранее посчитанный top-k кластера
+    (вектор пользователя — средний фактор его кластера).
+    """
+
+    def __init__(self, catalog, user_index: dict = None, user_factors: np.ndarray = None,
+                 user_clusters: np.ndarray = None, candidates=None, cluster_index=None,
+                 cluster_factors: np.ndarray = None, socdem_index=None, socdem_clusters: np.ndarray = None):
+        self.catalog = catalog
+        self.candidates = candidates
+        self.product_factors = build_product_factors(catalog, candidates, cluster_factors)
+        self.dim = self.product_factors.shape[1]
+        self.cluster_factors = cluster_factors
+        # Без факторов кластеров (нет обученной модели) движок работает в демо-режиме
+        self.demo = cluster_factors is None
+        if self.demo:
+            print(
+                "ВНИМАНИЕ: нет cluster_factors и user_factors с кластерами — обученной модели нет, "
+                "рекомендации строятся по детерминированным демо-векторам (хэш user_id и названия продукта)."
+            )
+        self._default_vector = _mean_vector(np.asarray(cluster_factors, dtype=np.float32)) if not self.demo \
+            else np.zeros(self.dim, dtype=np.float32)
+
+        self.user_index = {}
+        self.user_factors = np.zeros((0, self.dim), dtype=np.float32)
+        self.cluster_index = {}
+        self.user_clusters = None
+        if user_factors is not None:
+            if user_factors.shape[1] != self.dim:
+                print(
+                    f"Размерность факторов пользователей {user_factors.shape[1]} "
+                    f"не совпадает с факторами кластеров ({self.dim}), используем векторы кластеров."
+                )
+            else:
+                self.user_factors = user_factors
+                self.user_index = user_index
+                self.cluster_index = user_index
+                self.user_clusters = user_clusters
+        if cluster_index is not None:
+            # отдельная модель кластеризации: свой индекс, не зависит от факторов
+            self.cluster_index = cluster_index
+            self.user_clusters = user_clusters
+        # socdem_cluster из users.pq (build_profiles) — тот же сегмент, что показывает профиль
+        self.socdem_index = socdem_index
+        self.socdem_clusters = socdem_clusters
+
+        # Подматрицы факторов кандидатов и cold-start top-k по кластерам считаются один раз
+        self._cluster_factors = {}
+        self._cluster_fallback = {}
+        if candidates is not None and len(catalog):
+            for cluster_id in candidates.cluster_ids:
+                ids = candidates.get(cluster_id)
+                factors = self.product_factors if ids is None else self.product_factors[ids]
+                self._cluster_factors[cluster_id] = factors
+                self._cluster_fallback[cluster_id] = self._rank(factors @ self._cluster_vector(cluster_id), ids, TOP_K)
+
+    def _cluster_vector(self, cluster_id) -> np.ndarray:
+        """Средний фактор пользователей кластера; для неизвестного кластера — среднее по всем."""
+        if self.demo:
+            return _stable_vector(f"cluster:{cluster_id}") if cluster_id is not None else self._default_vector
+        if cluster_id is not None and 0 <= cluster_id < len(self.cluster_factors):
+            return np.asarray(self.cluster_factors[cluster_id], dtype=np.float32)
+        return self._default_vector
+
+    def user_vector(self, user_id: str) -> np.ndarray:
+        """
+        Вектор пользователя: предрасчитанный ALS-фактор или средний фактор его кластера (cold-start).
+        В демо-режиме пользователь без кластера получает детерминированный вектор по user_id.
+        """
+        row = self.user_index.get(user_id)
+        if row is not None:
+            return self.user_factors[row]
+        cluster_id = self.user_cluster(user_id)
+        if self.demo and cluster_id is None:
+            return _stable_vector(f"user:{user_id}")
+        return self._cluster_vector(cluster_id)
+
+    def user_cluster(self, user_id: str):
+        """
+        Соцдем-кластер пользователя: socdem_cluster из users.pq, для пользователей без него — модель
+        кластеризации (её id сопоставлены socdem_cluster). None, если кластер неизвестен: тогда скорится весь каталог.
+        """
+        if self.candidates is None or not self.candidates.cluster_ids:
+            return None
+        for index, clusters in ((self.socdem_index, self.socdem_clusters), (self.cluster_index, self.user_clusters)):
+            row = index.get(user_id) if index is not None and clusters is not None else None
+            if row is not None and int(clusters[row]) in self.candidates.cluster_names:
+                return int(clusters[row])
+        return None
+
+    @staticmethod
+    def _rank(scores: np.ndarray, ids, k: int) -> tuple:
+        """top-k по вектору скоров; ids переводит позиции подмножества в id каталога."""
+        k = min(k, scores.shape[0])
+        if k == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        top_scores = _sigmoid(scores[top])
+        return (top if ids is None else ids[top]), top_scores
+
+    def top_k(self, user_id: str, k: int = TOP_K) -> tuple:
+        """Возвращает (индексы продуктов, скоры в [0, 1]) по убыванию релевантности."""
+        if self.product_factors.shape[0] == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+        cluster_id = self.user_cluster(user_id)
+        if cluster_id not in self._cluster_factors:
+            return self._rank(self.product_factors @ self.user_vector(user_id), None, k)
+
+        if user_id not in self.user_index and k == TOP_K:
+            # Cold-start: готовый top-k кластера, O(1)
+            return self._cluster_fallback[cluster_id]
+
+        scores = self._cluster_factors[cluster_id] @ self.user_vector(user_id)
+        return self._rank(scores, self.candidates.get(cluster_id), k)
+
+    def top_k_batch(self, user_ids: list, k: int = TOP_K) -> tuple:
+        """
+        Пакетный скоринг: одно матричное произведение [batch, dim] x [dim, n_products],
+        продукты вне кандидатов кластера пользователя маскируются.
+        Возвращает (индексы, скоры) — по строке на пользователя, по убыванию релевантности;
+        строка не длиннее числа кандидатов кластера, как и в top_k.
+        """
+        n = self.product_factors.shape[0]
+        k = min(k, n)
+        if k == 0 or not user_ids:
+            return [np.empty(0, dtype=np.int64)] * len(user_ids), [np.empty(0, dtype=np.float32)] * len(user_ids)
+
+        if self._cluster_factors:
+            clusters = [self.user_cluster(user_id) for user_id in user_ids]
+            # Для пользователей без факторов — вектор кластера, как в cold-start top_k
+            users = np.stack([self.user_vector(user_id) for user_id in user_ids])
+            scores = users @ self.product_factors.T
+            # Пользователи без кластера скорятся по всему каталогу
+            mask = np.ones((len(user_ids), n), dtype=bool)
+            known = np.array([cluster_id is not None for cluster_id in clusters])
+            if known.any():
+                mask[known] = self.candidates.mask[[cluster_id for cluster_id in clusters if cluster_id is not None]]
+            scores[~mask] = -np.inf
+            # Продукты с -inf (вне кандидатов) в выдачу не попадают
+            counts = np.minimum(mask.sum(axis=1), k)
+        else:
+            users = np.stack([self.user_vector(user_id) for user_id in user_ids])
+            scores = users @ self.product_factors.T
+            counts = np.full(len(user_ids), k)
+
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        top_scores = np.take_along_axis(scores, top, axis=1)
+        order = np.argsort(-top_scores, axis=1)
+        top = np.take_along_axis(top, order, axis=1)
+        top_scores = _sigmoid(np.take_along_axis(top_scores, order, axis=1))
+        return [row[:c] for row, c in zip(top, counts)], [row[:c] for row, c in zip(top_scores, counts)]
+
+    def recommend(self, user_id: str, k: int = TOP_K) -> list:
+        """Формирует элементы ответа в формате /api/recommend."""
+        indices, scores = self.top_k(user_id, k)
+        items = []
+        for idx, score in zip(indices, scores):
+            product = self.catalog[idx]
+            items.append({
+                "product_name": product.product_name,
+                "product_type": product.product_type,
+                "rate": product.rate,
+                "terms": product.term or "Не указан",
+                "requirements": product.requirements,
+                "url": product.source_url,
+                "score": float(score)
+            })
+        return items
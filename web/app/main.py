@@ -1,9 +1,24 @@
+from contextlib import asynccontextmanager
 import uvicorn
 from fastapi import FastAPI
 from fastapi.staticfiles import StaticFiles
 from app.routers import router
+from app.services import ARTIFACTS, CATALOG_MANAGER, SUMMARIES
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Горячая перезагрузка каталога: следим за psb_products_updated.json в фоне
+    CATALOG_MANAGER.start()
+    # Смена версии артефактов (указатель artifacts/CURRENT) подхватывается так же, в фоне
+    ARTIFACTS.start()
+    # Кэш LLM-описаний профилей дописывается пакетным пайплайном — перечитываем при изменении
+    SUMMARIES.start()
+    yield
+    SUMMARIES.stop()
+    ARTIFACTS.stop()
+    CATALOG_MANAGER.stop()
+
+app = FastAPI(lifespan=lifespan)
 
 # Подключаем статику (фронтенд)
 app.mount("/static", StaticFiles(directory="static"), name="static")
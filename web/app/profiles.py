@@ -0,0 +1,190 @@
+import asyncio
+import json
+import os
+import time
+from collections import OrderedDict
+
+PROFILE_CACHE_SIZE = int(os.environ.get("PROFILE_CACHE_SIZE", 100_000))
+PROFILE_CACHE_TTL = float(os.environ.get("PROFILE_CACHE_TTL", 600.0))
+
+NO_DATA = "Нет данных"
+# Уровень дохода (оценка) — секстиль средних трат в день среди всех пользователей
+INCOME_LEVELS = ["Низкий", "Ниже среднего", "Средний", "Выше среднего", "Высокий", "Очень высокий"]
+# Интересы из флагов обогащения; категории трат показываются как есть
+INTEREST_NAMES = {"auto": "Автомобили", "home": "Дом и ремонт"}
+
+
+def income_label(level) -> str:
+    return INCOME_LEVELS[level] if level is not None and 0 <= level < len(INCOME_LEVELS) else NO_DATA
+
+
+def interest_names(interests) -> list:
+    return [INTEREST_NAMES.get(name, name) for name in interests or []]
+
+
+class ProfileCache:
+    """
+    Ограниченный LRU-кэш с TTL. Используется только из event loop,
+    поэтому блокировки не нужны.
+    """
+
+    def __init__(self, maxsize: int = PROFILE_CACHE_SIZE, ttl: float = PROFILE_CACHE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key):
+        entry = self._data.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._data[key]
+            self.expirations += 1
+            self.misses += 1
+            return None
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        self._data[key] = (time.monotonic() + self.ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self):
+        self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class _LeaderCancelled(Exception):
+    """Построение профиля прервано отменой ведущего запроса; ожидающие повторяют попытку."""
+
+
+class ProfileProvider:
+    """
+    Отдаёт профили пользователей из кэша; промахи строятся через `runner`
+    (например, в пуле потоков). Конкурентные промахи по одному user_id
+    схлопываются в одно построение (single-flight).
+    """
+
+    def __init__(self, build, runner, cache: ProfileCache = None):
+        self.build = build
+        self.runner = runner
+        self.cache = cache or ProfileCache()
+        self._in_flight = {}
+        self.coalesced = 0
+        # Версия данных, по которой построены профили в кэше (задаёт вызывающий код через set_version)
+        self.version = None
+
+    def set_version(self, version) -> None:
+        """Новая версия данных: кэш сбрасывается, построения по старой версии в кэш уже не попадут."""
+        if version != self.version:
+            self.cache.clear()
+            self.version = version
+
+    async def get(self, user_id: str) -> dict:
+        while True:
+            profile = self.cache.get(user_id)
+            if profile is not None:
+                return profile
+
+            # Построение по старой версии не схлопывается с запросами новой
+            future = self._in_flight.get((self.version, user_id))
+            if future is None:
+                return await self._lead(user_id)
+            self.coalesced += 1
+            try:
+                return await asyncio.shield(future)
+            except _LeaderCancelled:
+                # Ведущий запрос отменён (клиент отключился): один из ожидающих станет новым ведущим
+                continue
+
+    async def _lead(self, user_id: str) -> dict:
+        version = self.version
+        key = (version, user_id)
+        future = asyncio.get_running_loop().create_future()
+        self._in_flight[key] = future
+        try:
+            profile = await self.runner(self.build, user_id)
+        except asyncio.CancelledError:
+            # Общий future не отменяем: иначе CancelledError получат все схлопнутые запросы
+            future.set_exception(_LeaderCancelled())
+            future.exception()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Исключение уже доставлено ожидающим; не даём asyncio ругаться на "never retrieved"
+            future.exception()
+            raise
+        else:
+            # Пока профиль строился, версия могла смениться: устаревший результат в кэш не кладём
+            if self.version == version:
+                self.cache.put(user_id, profile)
+            future.set_result(profile)
+            return profile
+        finally:
+            del self._in_flight[key]
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self.cache),
+            "maxsize": self.cache.maxsize,
+            "ttl_seconds": self.cache.ttl,
+            "hits": self.cache.hits,
+            "misses": self.cache.misses,
+            "evictions": self.cache.evictions,
+            "expirations": self.cache.expirations,
+            "coalesced": self.coalesced,
+        }
+
+
+class ProfileStore:
+    """
+    Профили пользователей из версии артефактов (recsys.scripts.build_profiles):
+    profiles.arrow открыт через pa.memory_map, строка ищется бинарным поиском по
+    отсортированным profile_keys. Таблица в память не загружается — чтение одной
+    строки трогает только её страницы.
+    """
+
+    def __init__(self, artifacts=None):
+        self.version = artifacts.version if artifacts is not None else None
+        self.index = None
+        self.table = None
+        self.meta = {}
+        if artifacts is None or "profiles" not in artifacts:
+            return
+        try:
+            self.index = artifacts.key_index("profile")
+            if self.index is None:
+                raise ValueError("нет profile_keys/profile_key_ids")
+            self.table = artifacts.get("profiles")
+            if self.table.num_rows != len(self.index):
+                raise ValueError(f"{self.table.num_rows} строк профилей, {len(self.index)} ключей")
+            metadata = self.table.schema.metadata or {}
+            self.meta = json.loads(metadata.get(b"profiles", b"{}"))
+            print(f"Профили {len(self.index)} пользователей из артефактов версии {self.version} (mmap).")
+        except Exception as e:
+            print(f"Ошибка при загрузке профилей из артефактов {self.version}: {e}")
+            self.index = self.table = None
+
+    def __len__(self) -> int:
+        return len(self.index) if self.index is not None else 0
+
+    def get(self, user_id: str):
+        """Колонки профиля пользователя (dict) или None, если его нет в таблице."""
+        if self.index is None:
+            return None
+        row = self.index.get(user_id)
+        if row is None:
+            return None
+        return self.table.slice(row, 1).to_pylist()[0]
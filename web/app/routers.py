@@ -1,7 +1,9 @@
-from fastapi import APIRouter
-from fastapi.responses import FileResponse
-from app.schemas import UserRequest
-from app.services import RecommendationService
+from typing import Literal, Optional
+from fastapi import APIRouter, File, HTTPException, Query, UploadFile
+from fastapi.responses import FileResponse, StreamingResponse
+from app.batch import MEDIA_TYPES, iter_file_chunks, iter_list_chunks
+from app.schemas import BatchRequest, UserRequest
+from app.services import CATALOG_MANAGER, ProductService, RecommendationService
 
 router = APIRouter(prefix='', tags=['Работа с рекомендациями'])
 
@@ -18,9 +20,51 @@ async def read_profile():
 @router.post("/api/recommend")
 async def get_recommendations(user: UserRequest):
     """API получения рекомендаций"""
-    return RecommendationService.get_recommendations(user.user_id)
+    return await RecommendationService.get_recommendations(user.user_id)
+
+@router.post("/api/recommend/batch")
+async def get_batch_recommendations(request: BatchRequest):
+    """API пакетных рекомендаций по списку user_id (поток NDJSON / Arrow IPC)"""
+    snapshot = CATALOG_MANAGER.current
+    stream = await RecommendationService.open_batch_stream(snapshot, iter_list_chunks(request.user_ids), request.format)
+    return StreamingResponse(
+        stream, media_type=MEDIA_TYPES[request.format], headers={"X-Catalog-Version": snapshot.version}
+    )
+
+@router.post("/api/recommend/batch/file")
+async def get_batch_recommendations_from_file(
+    file: UploadFile = File(...),
+    format: Literal["ndjson", "arrow"] = Query("ndjson"),
+):
+    """API пакетных рекомендаций по загруженному CSV/Parquet с колонкой user_id"""
+    try:
+        chunks = iter_file_chunks(file.file, file.filename)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    snapshot = CATALOG_MANAGER.current
+    stream = await RecommendationService.open_batch_stream(snapshot, chunks, format)
+    return StreamingResponse(stream, media_type=MEDIA_TYPES[format], headers={"X-Catalog-Version": snapshot.version})
+
+@router.get("/api/profile/cache/stats")
+async def get_profile_cache_stats():
+    """API статистики кэша профилей"""
+    return RecommendationService.get_profile_cache_stats()
 
 @router.get("/api/profile/{user_id}")
 async def get_profile(user_id: str):
     """API получения профиля пользователя"""
-    return RecommendationService.get_user_profile(user_id)
+    return await RecommendationService.get_user_profile(user_id)
+
+@router.get("/api/products")
+async def search_products(
+    product_type: Optional[str] = None,
+    min_rate: Optional[float] = None,
+    max_term_months: Optional[float] = None,
+):
+    """API поиска продуктов: тип, ставка от min_rate %, срок до max_term_months"""
+    return ProductService.search_products(product_type, min_rate, max_term_months)
+
+@router.get("/api/catalog")
+async def get_catalog_info():
+    """API текущей версии каталога продуктов"""
+    return ProductService.get_catalog_info()
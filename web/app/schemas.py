@@ -1,4 +1,11 @@
-from pydantic import BaseModel
+from typing import List, Literal
+from pydantic import BaseModel, Field
+from app.batch import BATCH_MAX_USERS
 
 class UserRequest(BaseModel):
-    user_id: str
\ No newline at end of file
+    user_id: str
+
+class BatchRequest(BaseModel):
+    # JSON-тело разбирается целиком, поэтому размер ограничен; большие выгрузки — через /api/recommend/batch/file
+    user_ids: List[str] = Field(..., max_length=BATCH_MAX_USERS)
+    format: Literal["ndjson", "arrow"] = "ndjson"
\ No newline at end of file
@@ -1,8 +1,31 @@
-import time
-import random
+import asyncio
+import itertools
 import json
 import os
-from app.database import PRODUCTS_DB
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from fastapi import HTTPException
+from app.artifacts import ArtifactRegistry
+from app.database import CatalogManager
+from app.engine import (
+    RecommendationEngine,
+    derive_cluster_factors,
+    load_cluster_factors,
+    load_profile_clusters,
+    load_user_clusters,
+    load_user_factors,
+)
+from app.candidates import ClusterCandidateIndex, load_cluster_mapping
+from app.batch import FORMAT_ARROW, ArrowStreamEncoder, encode_ndjson
+from app.profiles import NO_DATA, ProfileProvider, ProfileStore, income_label, interest_names
+from app.summaries import SummaryCache, template_key
+
+# Пул для CPU-bound скоринга: event loop не блокируется вычислениями
+SCORING_WORKERS = int(os.environ.get("SCORING_WORKERS", os.cpu_count() or 4))
+# Сколько запросов может ждать свободный воркер, прежде чем отвечаем 503
+MAX_PENDING = int(os.environ.get("SCORING_MAX_PENDING", SCORING_WORKERS * 64))
+
+SCORING_POOL = ThreadPoolExecutor(max_workers=SCORING_WORKERS, thread_name_prefix="scoring")
 
 def load_socdem_clusters():
     try:
@@ -22,82 +45,280 @@ def load_socdem_clusters():
 
 SOCDEM_CLUSTERS = load_socdem_clusters()
 
+
+def load_regions() -> dict:
+    """Код региона из users.pq -> название (data/support/region.json)."""
+    try:
+        project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        with open(os.path.join(project_root, "data", "support", "region.json"), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except Exception as e:
+        print(f"Error loading regions: {e}")
+        return {}
+
+
+REGIONS = load_regions()
+# Готовые LLM-описания профилей по ключам шаблонов; файл кэша отслеживается в фоне
+SUMMARIES = SummaryCache()
+
+# Реестр артефактов (mmap .npy/Arrow): при смене версии движок пересобирается
+# для текущего каталога, факторы продуктов — с каждой новой версией каталога
+ARTIFACTS = ArtifactRegistry(on_switch=lambda snapshot: CATALOG_MANAGER.rebuild_engine())
+CLUSTER_MAPPING = load_cluster_mapping()
+_USER_FACTORS = {}
+
+
+def user_factors_for(artifacts) -> tuple:
+    """
+    Факторы и кластеры пользователей и факторы кластеров версии артефактов; открываются один раз на версию,
+    а не на каждый каталог. Их размерность не зависит от каталога, новый каталог пересчитывает только факторы продуктов.
+    """
+    key = artifacts.version if artifacts is not None else None
+    if key not in _USER_FACTORS:
+        _USER_FACTORS.clear()
+        user_index, user_factors, factor_clusters = load_user_factors(artifacts)
+        cluster_index, clusters = load_user_clusters(artifacts)
+        cluster_factors = load_cluster_factors(artifacts)
+        if cluster_factors is None and user_factors is not None and factor_clusters is not None:
+            # npz или user_factors без cluster_factors: пространство продуктов строится по самим факторам
+            cluster_factors = derive_cluster_factors(user_factors, factor_clusters)
+            if cluster_factors is not None:
+                print(f"Факторы {len(cluster_factors)} кластеров посчитаны по факторам пользователей.")
+        _USER_FACTORS[key] = (
+            (user_index, user_factors, factor_clusters, cluster_index, clusters, cluster_factors)
+            + load_profile_clusters(artifacts)
+        )
+    return _USER_FACTORS[key]
+
+
+_PROFILE_STORES = {}
+# Профили строятся в потоках пула: открытие таблицы новой версии не должно гоняться
+_PROFILE_STORES_LOCK = threading.Lock()
+
+
+def profile_store_for(artifacts) -> ProfileStore:
+    """Таблица профилей версии артефактов; открывается один раз на версию (под блокировкой: вызывается из пула)."""
+    key = artifacts.version if artifacts is not None else None
+    with _PROFILE_STORES_LOCK:
+        store = _PROFILE_STORES.get(key)
+        if store is None:
+            _PROFILE_STORES.clear()
+            store = _PROFILE_STORES[key] = ProfileStore(artifacts)
+    return store
+
+
+def build_engine(catalog) -> RecommendationEngine:
+    """Движок для версии каталога: кандидаты кластеров резолвятся заново под каждую версию."""
+    candidates = ClusterCandidateIndex(catalog, CLUSTER_MAPPING, SOCDEM_CLUSTERS)
+    (user_index, user_factors, user_clusters, cluster_index, clusters, cluster_factors,
+     socdem_index, socdem_clusters) = user_factors_for(ARTIFACTS.current)
+    if cluster_index is not None:
+        user_clusters = clusters
+    return RecommendationEngine(
+        catalog, user_index, user_factors, user_clusters, candidates, cluster_index, cluster_factors,
+        socdem_index, socdem_clusters,
+    )
+
+
+CATALOG_MANAGER = CatalogManager(build_engine=build_engine)
+
+_slots = asyncio.Semaphore(SCORING_WORKERS)
+_pending = 0
+
+
+async def run_scoring(func, *args):
+    """
+    Выполняет CPU-bound функцию в пуле с backpressure:
+    не больше SCORING_WORKERS задач одновременно и не больше MAX_PENDING в очереди.
+    """
+    global _pending
+    if _pending >= MAX_PENDING:
+        raise HTTPException(status_code=503, detail="Сервис перегружен, повторите запрос позже")
+
+    _pending += 1
+    try:
+        return await _run_in_pool(func, *args)
+    finally:
+        _pending -= 1
+
+
+async def _run_in_pool(func, *args):
+    """Ждёт свободный слот пула и выполняет в нём функцию."""
+    async with _slots:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(SCORING_POOL, func, *args)
+
+
+def _score_next_chunk(engine, chunks, encode):
+    """Читает следующий чанк user_id, скорит его одним матричным произведением и кодирует."""
+    chunk = next(chunks, None)
+    if chunk is None:
+        return None
+    indices, scores = engine.top_k_batch(chunk)
+    return encode(chunk, indices, scores, engine.catalog.products)
+
+
+def build_user_profile(user_id: str) -> dict:
+    """
+    Профиль пользователя из данных: socdem_cluster и регион из users.pq, траты и топ-категории
+    из хранилища фичей (таблица профилей в артефактах, поиск строки — бинарный поиск по mmap).
+    Сегмент — socdem_cluster пользователя (по нему же движок отбирает кандидатов), без него — «Нет данных».
+    """
+    record = profile_store_for(ARTIFACTS.current).get(user_id) or {}
+
+    socdem_cluster = record.get("socdem_cluster")
+    cluster_info = SOCDEM_CLUSTERS.get(str(socdem_cluster)) if socdem_cluster is not None and socdem_cluster >= 0 else None
+    cluster = socdem_cluster if cluster_info is not None else None
+    if cluster_info is not None:
+        segment_name = cluster_info.get("russian_name", cluster_info.get("name"))
+        segment_desc = cluster_info.get("russian_description", cluster_info.get("description"))
+    else:
+        segment_name, segment_desc = NO_DATA, ""
+
+    level = record.get("income_level")
+    income = income_label(level)
+    region_code = record.get("region")
+    region = REGIONS.get(str(region_code), NO_DATA) if region_code is not None and region_code >= 0 else NO_DATA
+    top_interests = interest_names(record.get("interests"))
+    spend = {name: record.get(name) for name in ("total_amount", "mean_amount", "median_amount", "max_amount")}
+    days = record.get("days") or 0
+
+    # Описание берётся из кэша пакетной генерации (app.summaries), на пути запроса LLM не вызывается
+    llm_summary = SUMMARIES.get(template_key(cluster, level, record.get("interests")))
+    if llm_summary is None:
+        llm_summary = f"<b>Психотип: {segment_name}</b><br><br>"
+        if segment_desc:
+            llm_summary += f"{segment_desc} <br><br>"
+        llm_summary += f"Уровень дохода: {income.lower()}."
+        if top_interests:
+            llm_summary += f" Основные интересы: {', '.join(top_interests).lower()}."
+
+    return {
+        "user_id": user_id,
+        "full_name": f"Клиент {user_id}",
+        "has_data": bool(record),
+        "segment": segment_name,
+        "socdem_cluster": cluster,
+        "region": region,
+        "income_level": income,
+        "active_days": days,
+        "first_day": record["first_day"].isoformat() if record.get("first_day") else None,
+        "last_day": record["last_day"].isoformat() if record.get("last_day") else None,
+        "spend": spend,
+        "top_categories": record.get("top_categories") or [],
+        "top_interests": top_interests,
+        "llm_summary": llm_summary
+    }
+
+
+# Кэш профилей: промахи строятся в пуле, конкурентные запросы одного user_id схлопываются
+PROFILE_PROVIDER = ProfileProvider(build_user_profile, run_scoring)
+
+
 class RecommendationService:
     @classmethod
-    def get_recommendations(cls, user_id: str) -> dict:
+    async def get_recommendations(cls, user_id: str) -> dict:
         """
         Сервис рекомендаций банковских продуктов.
         """
-        time.sleep(random.uniform(0.5, 1.5))
-
-        if not PRODUCTS_DB:
+        snapshot = CATALOG_MANAGER.current
+        if not len(snapshot.catalog):
             return {"user_id": user_id, "items": [], "error": "База продуктов пуста"}
 
-        count = random.randint(3, 5)
-        recommendations = random.sample(PRODUCTS_DB, min(count, len(PRODUCTS_DB)))
-        
-        response_items = []
-        for product in recommendations:
-            score = random.uniform(0.6, 0.98)
-            
-            response_items.append({
-                "product_name": product.get("product_name"),
-                "product_type": product.get("product_type"),
-                "rate": product.get("rate"),
-                "terms": product.get("term") or "Не указан",
-                "requirements": product.get("requirements"),
-                "url": product.get("source_url"),
-                "score": score
-            })
-        
-        response_items.sort(key=lambda x: x["score"], reverse=True)
-        
-        return {"user_id": user_id, "items": response_items}
+        items = await run_scoring(snapshot.engine.recommend, user_id)
+        return {"user_id": user_id, "items": items, "catalog_version": snapshot.version}
 
     @classmethod
-    def get_user_profile(cls, user_id: str) -> dict:
+    async def open_batch_stream(cls, snapshot, chunks, output_format: str):
         """
-        Возвращает моковый профиль пользователя с 'LLM-generated' портретом.
+        Готовит пакетный поток до отправки заголовков ответа: при переполненной очереди
+        скоринга сразу 503 (как у одиночных запросов), а первый чанк читается заранее,
+        чтобы ошибки входа (нет колонки user_id, битый файл) стали 400, а не обрывом после 200.
+        Место в очереди занимает сам поток при старте: если ответ так и не начал
+        отправляться (клиент отключился), занимать и освобождать нечего.
         """
-        time.sleep(random.uniform(0.2, 0.6))
-        
-        random.seed(user_id)
-        
-        age = random.randint(21, 75)
-        
-        first_names = ["Александр", "Мария", "Дмитрий", "Елена", "Сергей", "Ольга", "Иван", "Татьяна", "Максим", "Анна"]
-        last_names = ["Иванов(а)", "Смирнов(а)", "Кузнецов(а)", "Попов(а)", "Васильев(а)", "Петров(а)", "Соколов(а)", "Михайлов(а)"]
-        full_name = f"{random.choice(first_names)} {random.choice(last_names)}"
+        if _pending >= MAX_PENDING:
+            raise HTTPException(status_code=503, detail="Сервис перегружен, повторите запрос позже")
 
-        cluster_id = str(random.randint(0, 4))
-        cluster_info = SOCDEM_CLUSTERS.get(cluster_id, SOCDEM_CLUSTERS.get("0"))
-        
-        segment_name = cluster_info.get("russian_name", cluster_info.get("name"))
-        segment_desc = cluster_info.get("russian_description", cluster_info.get("description"))
-        
-        income = random.choice(["Низкий", "Ниже среднего", "Средний", "Выше среднего", "Высокий", "Очень высокий"])
-        
-        interests_pool = ["Путешествия", "Инвестиции", "Спорт", "Автомобили", "Недвижимость", "Технологии", "Искусство", "Дача", "Дети", "Здоровье"]
-        top_interests = random.sample(interests_pool, k=random.randint(3, 5))
-        
-        risk_profile = random.choice(["Консервативный", "Умеренный", "Агрессивный"])
-        llm_summary = (
-            f"<b>Психотип: {segment_name}</b><br><br>"
-            f"{segment_desc} <br><br>"
-            f"Уровень дохода: {income.lower()}. "
-            f"Основные интересы: {', '.join(top_interests).lower()}. "
-            f"Риск-профиль: {risk_profile.lower()}."
-        )
+        try:
+            first = await _run_in_pool(next, chunks, None)
+        except (ValueError, UnicodeDecodeError, OSError) as e:
+            raise HTTPException(status_code=400, detail=f"Не удалось прочитать user_id: {e}")
+        if first is not None:
+            chunks = itertools.chain([first], chunks)
+        return cls.stream_batch_recommendations(snapshot, chunks, output_format)
 
+    @classmethod
+    async def stream_batch_recommendations(cls, snapshot, chunks, output_format: str):
+        """
+        Пакетные рекомендации для CRM-кампаний: чанки user_id скорятся в пуле
+        по очереди, результат отдаётся потоком (NDJSON или Arrow IPC).
+        В памяти одновременно только один чанк. Поток занимает место в очереди
+        скоринга на всё время отправки и освобождает его по завершении.
+        """
+        global _pending
+        _pending += 1
+        try:
+            # Весь поток скорится одной версией каталога, даже если она сменится посередине
+            engine = snapshot.engine
+            encoder = ArrowStreamEncoder() if output_format == FORMAT_ARROW else None
+            encode = encoder.encode if encoder else encode_ndjson
+
+            while True:
+                data = await _run_in_pool(_score_next_chunk, engine, chunks, encode)
+                if data is None:
+                    break
+                yield data
+
+            if encoder:
+                yield encoder.close()
+        finally:
+            _pending -= 1
+
+    @classmethod
+    async def get_user_profile(cls, user_id: str) -> dict:
+        """
+        Возвращает профиль пользователя (через LRU+TTL кэш).
+        После смены версии артефактов или кэша описаний кэш сбрасывается: профили строятся по новым данным.
+        """
+        version = (ARTIFACTS.current.version if ARTIFACTS.current is not None else None, SUMMARIES.version)
+        PROFILE_PROVIDER.set_version(version)
+        return await PROFILE_PROVIDER.get(user_id)
+
+    @classmethod
+    def get_profile_cache_stats(cls) -> dict:
+        """Счётчики кэша профилей: попадания, промахи, вытеснения."""
+        return PROFILE_PROVIDER.stats()
+
+
+class ProductService:
+    @classmethod
+    def search_products(cls, product_type: str = None, min_rate: float = None, max_term_months: float = None) -> dict:
+        """
+        Поиск по каталогу через индексы (тип, ставка, срок), без перебора продуктов.
+        """
+        snapshot = CATALOG_MANAGER.current
+        ids = snapshot.catalog.filter(product_type=product_type, min_rate=min_rate, max_term_months=max_term_months)
+        items = []
+        for product_id in ids:
+            product = snapshot.catalog[product_id]
+            items.append({
+                "product_name": product.product_name,
+                "product_type": product.product_type,
+                "rate": product.rate,
+                "terms": product.term or "Не указан",
+                "url": product.source_url,
+            })
+        return {"count": len(items), "items": items, "catalog_version": snapshot.version}
+
+    @classmethod
+    def get_catalog_info(cls) -> dict:
+        """Текущая активная версия каталога."""
+        snapshot = CATALOG_MANAGER.current
+        artifacts = ARTIFACTS.current
         return {
-            "user_id": user_id,
-            "full_name": full_name,
-            "age": age,
-            "segment": segment_name, 
-            "income_level": income,
-            "risk_profile": risk_profile,
-            "loyalty_points": random.randint(0, 150000),
-            "active_products_count": random.randint(1, 5),
-            "top_interests": top_interests,
-            "llm_summary": llm_summary
+            "catalog_version": snapshot.version,
+            "loaded_at": snapshot.loaded_at,
+            "products_count": len(snapshot.catalog),
+            "artifacts": artifacts.info() if artifacts is not None else None,
         }
@@ -0,0 +1,391 @@
+import argparse
+import asyncio
+import hashlib
+import html
+import json
+import os
+import re
+import shutil
+import threading
+import time
+
+from app.profiles import INTEREST_NAMES, NO_DATA, income_label
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+PROMPT_FILE = os.environ.get("SUMMARY_PROMPT_FILE", os.path.join(PROJECT_ROOT, "data", "prompts", "profile.md"))
+# Кэш готовых описаний (JSONL, подменяется пайплайном целиком): python -m app.summaries build
+SUMMARIES_FILE = os.environ.get("SUMMARIES_FILE", "artifacts/summaries.jsonl")
+SUMMARIES_POLL_INTERVAL = float(os.environ.get("SUMMARIES_POLL_INTERVAL", 10.0))
+
+# Бэкенд генерации: OpenAI-совместимый /chat/completions
+LLM_API_URL = os.environ.get("LLM_API_URL", "http://localhost:8080/v1")
+LLM_API_KEY = os.environ.get("LLM_API_KEY", "")
+LLM_MODEL = os.environ.get("LLM_MODEL", "gpt-4o-mini")
+
+# Интересы, от которых зависит описание: флаги обогащения (auto/home), а не категории трат
+SUMMARY_FLAGS = tuple(INTEREST_NAMES)
+
+
+def load_prompt(path: str = PROMPT_FILE) -> str:
+    with open(path, "r", encoding="utf-8") as f:
+        return f.read()
+
+
+def load_clusters() -> dict:
+    with open(os.path.join(PROJECT_ROOT, "data", "support", "socdem_cluster.json"), "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def template_key(cluster, income_level, interests) -> dict:
+    """
+    Ключ шаблона описания: кластер, уровень дохода и флаги интересов auto/home. Категории трат
+    в ключ не входят (их сочетаний слишком много), поэтому миллионы пользователей сводятся
+    к (кластеры + 1) x 7 x 4 ключам.
+    """
+    present = set(interests or [])
+    return {
+        "cluster": -1 if cluster is None else int(cluster),
+        "income_level": -1 if income_level is None else int(income_level),
+        **{flag: flag in present for flag in SUMMARY_FLAGS},
+    }
+
+
+def summary_digest(prompt_hash: str, key: dict) -> str:
+    """Адрес описания в кэше: sha256 от промпта и ключа (новый промпт — новые адреса)."""
+    payload = json.dumps(key, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(f"{prompt_hash}\n{payload}".encode("utf-8")).hexdigest()
+
+
+def prompt_hash(prompt: str) -> str:
+    return hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+
+
+def render_input(key: dict, clusters: dict) -> str:
+    """Входной текст для промпта profile.md."""
+    lines = []
+    info = clusters.get(str(key["cluster"]))
+    if info is not None:
+        lines.append(f"macro_group_code: {key['cluster']}, macro_group_name: {info.get('russian_name', info.get('name'))}")
+    income = income_label(key["income_level"])
+    if income != NO_DATA:
+        lines.append(f"income_level: {income.lower()}")
+    flags = [INTEREST_NAMES[flag] for flag in SUMMARY_FLAGS if key.get(flag)]
+    if flags:
+        lines.append(f"interests: {', '.join(flags).lower()}")
+    return "\n".join(lines)
+
+
+def markdown_to_html(text: str) -> str:
+    """Минимальный markdown из ответа модели -> HTML для profile.html (жирный, курсив, списки, абзацы)."""
+    text = html.escape(text.strip())
+    text = re.sub(r"\*\*(.+?)\*\*", r"<b>\1</b>", text)
+    text = re.sub(r"(?<!\*)\*(?!\s)(.+?)(?<!\s)\*", r"<i>\1</i>", text)
+    text = re.sub(r"^\s*[-*]\s+", "• ", text, flags=re.MULTILINE)
+    return text.replace("\n\n", "<br><br>").replace("\n", "<br>")
+
+
+def parse_response(raw: str) -> dict:
+    """JSON-ответ модели {profile_md, macro_group_md}; обёртка ```json ... ``` допускается."""
+    raw = raw.strip()
+    fenced = re.match(r"^```(?:json)?\s*(.*?)\s*```$", raw, flags=re.DOTALL)
+    if fenced:
+        raw = fenced.group(1)
+    data = json.loads(raw)
+    if not isinstance(data, dict) or not isinstance(data.get("profile_md"), str) or not isinstance(data.get("macro_group_md"), str):
+        raise ValueError("ответ модели без profile_md/macro_group_md")
+    return data
+
+
+class StubBackend:
+    """
+    Локальный бэкенд без сети (тесты, разработка): описание собирается из socdem_cluster.json
+    в том же JSON-формате, что требует промпт.
+    """
+
+    name = "stub"
+
+    def __init__(self, clusters: dict = None):
+        self.clusters = clusters if clusters is not None else load_clusters()
+
+    async def generate(self, prompt: str, text: str) -> str:
+        fields = dict(re.findall(r"(\w+): (.+?)(?=, \w+: |\n|$)", text))
+        info = self.clusters.get(fields.get("macro_group_code", ""), {})
+        name = info.get("russian_name", info.get("name", "не определена"))
+        paragraphs = [info.get("russian_description", info.get("description", ""))]
+        if "income_level" in fields:
+            paragraphs.append(f"Уровень дохода: {fields['income_level']}.")
+        if "interests" in fields:
+            paragraphs.append(f"Основные интересы: {fields['interests']}.")
+        return json.dumps(
+            {"profile_md": "\n\n".join(p for p in paragraphs if p), "macro_group_md": f"**Макрогруппа:** {name}"},
+            ensure_ascii=False,
+        )
+
+
+class OpenAIBackend:
+    """OpenAI-совместимый /chat/completions (vLLM, llama.cpp server, облачные API)."""
+
+    def __init__(self, url: str = LLM_API_URL, api_key: str = LLM_API_KEY, model: str = LLM_MODEL, timeout: float = 60.0):
+        import httpx
+
+        headers = {"Authorization": f"Bearer {api_key}"} if api_key else {}
+        self.name = f"openai:{model}"
+        self.model = model
+        self.client = httpx.AsyncClient(base_url=url, headers=headers, timeout=timeout)
+
+    async def generate(self, prompt: str, text: str) -> str:
+        response = await self.client.post("/chat/completions", json={
+            "model": self.model,
+            "messages": [{"role": "system", "content": prompt}, {"role": "user", "content": text}],
+            "temperature": 0.2,
+        })
+        response.raise_for_status()
+        return response.json()["choices"][0]["message"]["content"]
+
+    async def aclose(self):
+        await self.client.aclose()
+
+
+BACKENDS = {"stub": StubBackend, "openai": OpenAIBackend}
+
+
+def read_summaries(path: str) -> dict:
+    """digest -> HTML описания; при повторах берётся последняя запись, битые строки пропускаются."""
+    summaries = {}
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                    summaries[record["digest"]] = record["html"]
+                except (ValueError, KeyError, TypeError):
+                    continue
+    except FileNotFoundError:
+        pass
+    return summaries
+
+
+class SummaryCache:
+    """
+    Готовые описания профилей для веб-сервиса: файл кэша читается в dict один раз,
+    поиск по адресу — O(1), генерации на пути запроса нет. Как и каталог, файл
+    отслеживается в фоне; новая версия подменяет словарь одним присваиванием.
+    """
+
+    def __init__(self, path: str = SUMMARIES_FILE, prompt_file: str = PROMPT_FILE,
+                 poll_interval: float = SUMMARIES_POLL_INTERVAL):
+        self.path = path
+        self.poll_interval = poll_interval
+        self._stat = None
+        self._stop = threading.Event()
+        self._thread = None
+        self.current = {}
+        self.version = None
+        try:
+            self.prompt_hash = prompt_hash(load_prompt(prompt_file))
+        except OSError as e:
+            print(f"Ошибка при загрузке промпта описаний: {e}")
+            self.prompt_hash = None
+        self.reload_if_changed()
+
+    def _file_stat(self):
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def reload_if_changed(self) -> bool:
+        """Перечитывает кэш, если файл изменился. Возвращает True, если версия сменилась."""
+        stat = self._file_stat()
+        if stat == self._stat:
+            return False
+        self._stat = stat
+        self.current = read_summaries(self.path) if stat is not None else {}
+        self.version = f"{stat[0]}:{stat[1]}" if stat is not None else None
+        if stat is not None:
+            print(f"Загружено {len(self.current)} описаний профилей.")
+        return True
+
+    def get(self, key: dict):
+        """HTML описания для ключа шаблона или None, если пайплайн его ещё не сгенерировал."""
+        if self.prompt_hash is None:
+            return None
+        return self.current.get(summary_digest(self.prompt_hash, key))
+
+    def __len__(self) -> int:
+        return len(self.current)
+
+    def _watch(self):
+        while not self._stop.wait(self.poll_interval):
+            self.reload_if_changed()
+
+    def start(self):
+        """Запускает фоновое наблюдение за файлом кэша."""
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._watch, name="summaries-watcher", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.poll_interval)
+
+
+def profile_template_keys(profiles_dir: str, cluster_ids: list = None) -> list:
+    """
+    Уникальные ключи шаблонов по таблице профилей (выгрузка build_profiles). Кластер — socdem_cluster
+    профиля, как в веб-сервисе; флаги — наличие auto/home в interests. Дедупликация — np.unique
+    по record batch, Python видит только уникальные строки.
+    """
+    import numpy as np
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    cluster_ids = sorted(int(c) for c in (cluster_ids if cluster_ids is not None else load_clusters()))
+    unique = set()
+    with pa.memory_map(os.path.join(profiles_dir, "profiles.arrow")) as source:
+        reader = pa.ipc.open_file(source)
+        for i in range(reader.num_record_batches):
+            batch = reader.get_batch(i)
+            names = batch.schema.names
+            n = batch.num_rows
+            columns = []
+            for name in ("socdem_cluster", "income_level"):
+                if name in names:
+                    columns.append(pc.fill_null(batch[name], -1).to_numpy(zero_copy_only=False).astype(np.int64))
+                else:
+                    columns.append(np.full(n, -1, dtype=np.int64))
+            columns[0][~np.isin(columns[0], cluster_ids)] = -1
+            if "interests" in names:
+                values = pc.list_flatten(batch["interests"]).to_numpy(zero_copy_only=False)
+                parents = pc.list_parent_indices(batch["interests"]).to_numpy(zero_copy_only=False)
+            for flag in SUMMARY_FLAGS:
+                hit = np.zeros(n, dtype=np.int64)
+                if "interests" in names:
+                    hit[parents[values == flag]] = 1
+                columns.append(hit)
+            if n:
+                unique.update(map(tuple, np.unique(np.stack(columns, axis=1), axis=0).tolist()))
+
+    return [
+        template_key(cluster, income, [flag for flag, hit in zip(SUMMARY_FLAGS, hits) if hit])
+        for cluster, income, *hits in sorted(unique)
+    ]
+
+
+async def generate_summaries(keys: list, backend, path: str = SUMMARIES_FILE, prompt: str = None,
+                             clusters: dict = None, concurrency: int = 8, retries: int = 2) -> dict:
+    """
+    Генерирует описания для ключей, которых ещё нет в кэше: не больше `concurrency`
+    запросов к бэкенду одновременно, неудачные повторяются с экспоненциальной паузой.
+    Описания дописываются в копию кэша (`path`.building), которая в конце подменяет кэш
+    через os.replace: сервис перечитывает файл один раз за прогон, а не на каждую запись.
+    Прерванный прогон оставляет копию, и следующий продолжает с места остановки.
+    """
+    prompt = prompt if prompt is not None else load_prompt()
+    clusters = clusters if clusters is not None else load_clusters()
+    digest_of = prompt_hash(prompt)
+    building = f"{path}.building"
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    if not os.path.exists(building):
+        if os.path.exists(path):
+            shutil.copyfile(path, building)
+        else:
+            open(building, "w", encoding="utf-8").close()
+    done = set(read_summaries(building))
+
+    unique = {summary_digest(digest_of, key): key for key in keys}
+    todo = {digest: key for digest, key in unique.items() if digest not in done}
+    stats = {"keys": len(unique), "cached": len(unique) - len(todo), "generated": 0, "failed": 0}
+
+    queue = asyncio.Queue()
+    for item in todo.items():
+        queue.put_nowait(item)
+
+    start = time.perf_counter()
+    with open(building, "a", encoding="utf-8") as out:
+
+        async def worker():
+            while True:
+                try:
+                    digest, key = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                for attempt in range(retries + 1):
+                    try:
+                        data = parse_response(await backend.generate(prompt, render_input(key, clusters)))
+                        break
+                    except Exception as e:
+                        if attempt == retries:
+                            print(f"Не удалось сгенерировать описание {key}: {e}")
+                            stats["failed"] += 1
+                            data = None
+                        else:
+                            await asyncio.sleep(2 ** attempt)
+                if data is None:
+                    continue
+                record = {
+                    "digest": digest,
+                    "key": key,
+                    "html": f"{markdown_to_html(data['macro_group_md'])}<br><br>{markdown_to_html(data['profile_md'])}",
+                    "profile_md": data["profile_md"],
+                    "macro_group_md": data["macro_group_md"],
+                    "backend": backend.name,
+                    "created_at": time.time(),
+                }
+                out.write(json.dumps(record, ensure_ascii=False) + "\n")
+                out.flush()
+                stats["generated"] += 1
+
+        await asyncio.gather(*(worker() for _ in range(max(1, min(concurrency, len(todo))))))
+    if os.path.exists(path) and not stats["generated"] and os.path.getsize(building) == os.path.getsize(path):
+        # Ничего нового: не трогаем кэш, чтобы сервис не сбрасывал профили зря
+        os.remove(building)
+    else:
+        os.replace(building, path)
+    stats["seconds"] = time.perf_counter() - start
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Пакетная генерация LLM-описаний профилей в кэш веб-сервиса.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    build = commands.add_parser("build", help="Сгенерировать описания для всех ключей шаблонов из таблицы профилей.")
+    build.add_argument("--profiles", required=True, help="Каталог выгрузки build_profiles.")
+    build.add_argument("--output", default=SUMMARIES_FILE, help="Файл кэша описаний (SUMMARIES_FILE).")
+    build.add_argument("--prompt", default=PROMPT_FILE, help="Промпт (data/prompts/profile.md).")
+    build.add_argument("--backend", choices=sorted(BACKENDS), default="stub", help="Бэкенд генерации.")
+    build.add_argument("--concurrency", type=int, default=8, help="Одновременных запросов к бэкенду.")
+    build.add_argument("--retries", type=int, default=2, help="Повторов при ошибке бэкенда.")
+
+    commands.add_parser("stats", help="Сколько описаний в кэше.").add_argument("--output", default=SUMMARIES_FILE)
+
+    args = parser.parse_args()
+    if args.command == "build":
+        keys = profile_template_keys(args.profiles)
+        print(f"Уникальных ключей шаблонов: {len(keys)}")
+        backend = BACKENDS[args.backend]()
+
+        async def run():
+            try:
+                return await generate_summaries(
+                    keys, backend, args.output, load_prompt(args.prompt), concurrency=args.concurrency, retries=args.retries
+                )
+            finally:
+                if hasattr(backend, "aclose"):
+                    await backend.aclose()
+
+        stats = asyncio.run(run())
+        print(
+            f"Сгенерировано {stats['generated']}, уже в кэше {stats['cached']}, ошибок {stats['failed']} "
+            f"за {stats['seconds']:.1f} с"
+        )
+    elif args.command == "stats":
+        print(f"Описаний в кэше: {len(read_summaries(args.output))}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""Нагрузочный тест API рекомендаций.
+
+Пример (сервер уже запущен):
+python load_test.py --url http://localhost:8000 --clients 128 --duration 20
+"""
+import argparse
+import asyncio
+import random
+import time
+
+import httpx
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Нагрузочный тест /api/recommend и /api/profile.")
+    parser.add_argument("--url", default="http://localhost:8000", help="Адрес сервиса.")
+    parser.add_argument("--clients", type=int, default=128, help="Число конкурентных клиентов.")
+    parser.add_argument("--duration", type=float, default=20.0, help="Длительность теста, сек.")
+    parser.add_argument(
+        "--profile-share",
+        type=float,
+        default=0.2,
+        help="Доля запросов к /api/profile/{user_id} (остальные — /api/recommend).",
+    )
+    parser.add_argument("--users", type=int, default=100_000, help="Размер пула user_id.")
+    return parser.parse_args()
+
+
+async def client_loop(client: httpx.AsyncClient, args: argparse.Namespace, deadline: float, stats: dict) -> None:
+    rng = random.Random()
+    while time.perf_counter() < deadline:
+        user_id = str(rng.randrange(args.users))
+        started = time.perf_counter()
+        try:
+            if rng.random() < args.profile_share:
+                response = await client.get(f"/api/profile/{user_id}")
+                kind = "profile"
+            else:
+                response = await client.post("/api/recommend", json={"user_id": user_id})
+                kind = "recommend"
+        except httpx.HTTPError:
+            stats["errors"] += 1
+            continue
+
+        if response.status_code != 200:
+            stats["errors"] += 1
+            continue
+        stats[kind].append(time.perf_counter() - started)
+
+
+def percentile(values: list, q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+async def run(args: argparse.Namespace) -> None:
+    stats = {"recommend": [], "profile": [], "errors": 0}
+    limits = httpx.Limits(max_connections=args.clients, max_keepalive_connections=args.clients)
+    async with httpx.AsyncClient(base_url=args.url, limits=limits, timeout=30.0) as client:
+        started = time.perf_counter()
+        deadline = started + args.duration
+        await asyncio.gather(*(client_loop(client, args, deadline, stats) for _ in range(args.clients)))
+        elapsed = time.perf_counter() - started
+
+    total = len(stats["recommend"]) + len(stats["profile"])
+    print(f"Клиентов: {args.clients}, длительность: {elapsed:.1f} с")
+    print(f"Успешных запросов: {total} ({total / elapsed:.1f} RPS), ошибок: {stats['errors']}")
+    for kind in ("recommend", "profile"):
+        latencies = stats[kind]
+        print(
+            f"  {kind:<9} n={len(latencies):<7} "
+            f"p50={percentile(latencies, 0.50) * 1000:.1f} мс  "
+            f"p99={percentile(latencies, 0.99) * 1000:.1f} мс"
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(run(parse_args()))
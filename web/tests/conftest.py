@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Модули сервиса импортируются как app.*, как при запуске из web/
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
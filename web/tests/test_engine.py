@@ -0,0 +1,83 @@
+"""Пакетный скоринг (top_k_batch) должен совпадать с поштучным top_k."""
+import numpy as np
+import pytest
+
+from app.candidates import ClusterCandidateIndex
+from app.catalog import ProductCatalog
+from app.engine import TOP_K, RecommendationEngine
+
+# Наборы кластеров у продуктов разные, поэтому и факторы продуктов разные (без равных скоров)
+MAPPING = {
+    "A": ["p0", "p1", "p5"],
+    "B": ["p1", "p2", "p5"],
+    "C": [],  # без кандидатов — скорится весь каталог
+    "D": ["p2", "p3", "p0", "p5"],
+}
+CLUSTERS = {str(i): {"name": name} for i, name in enumerate(MAPPING)}
+
+USERS = [
+    "u0", "u1", "u2", "u3",  # есть факторы, кластеры A, B, C, D
+    "cold-socdem",  # нет факторов, socdem_cluster из профиля (B)
+    "cold-model",  # нет факторов, кластер от модели кластеризации (D)
+    "cold-none",  # кластер неизвестен — весь каталог
+]
+
+
+def _catalog():
+    return ProductCatalog([{"product_name": f"p{i}", "product_type": "deposit"} for i in range(6)])
+
+
+def _engine(demo: bool) -> RecommendationEngine:
+    catalog = _catalog()
+    rng = np.random.default_rng(0)
+    factors = {}
+    if not demo:
+        factors = {
+            "user_index": {f"u{i}": i for i in range(4)},
+            "user_factors": rng.normal(size=(4, 4)).astype(np.float32),
+            "cluster_factors": rng.normal(size=(len(CLUSTERS), 4)).astype(np.float32),
+        }
+    return RecommendationEngine(
+        catalog,
+        candidates=ClusterCandidateIndex(catalog, MAPPING, CLUSTERS),
+        cluster_index={"u0": 0, "u1": 1, "u2": 2, "u3": 3, "cold-model": 4},
+        user_clusters=np.array([0, 1, 2, 3, 3]),
+        socdem_index={"cold-socdem": 0},
+        socdem_clusters=np.array([1]),
+        **factors,
+    )
+
+
+@pytest.mark.parametrize("demo", [False, True])
+@pytest.mark.parametrize("k", [1, 2, TOP_K, 10])
+def test_top_k_batch_matches_top_k(demo, k):
+    engine = _engine(demo)
+    assert engine.demo == demo
+    batch_ids, batch_scores = engine.top_k_batch(USERS, k)
+    assert len(batch_ids) == len(USERS)
+    for user_id, ids, scores in zip(USERS, batch_ids, batch_scores):
+        expected_ids, expected_scores = engine.top_k(user_id, k)
+        np.testing.assert_array_equal(ids, expected_ids, err_msg=user_id)
+        np.testing.assert_allclose(scores, expected_scores, rtol=1e-5, err_msg=user_id)
+
+
+def test_candidates_limit_the_ranking():
+    engine = _engine(demo=False)
+    assert [engine.user_cluster(user_id) for user_id in USERS] == [0, 1, 2, 3, 1, 3, None]
+
+    ids, _ = engine.top_k_batch(USERS, 10)
+    assert sorted(ids[USERS.index("cold-socdem")].tolist()) == [1, 2, 5]
+    assert sorted(ids[USERS.index("u3")].tolist()) == [0, 2, 3, 5]
+    # кластер без кандидатов и неизвестный кластер — весь каталог
+    assert sorted(ids[USERS.index("u2")].tolist()) == list(range(6))
+    assert sorted(ids[USERS.index("cold-none")].tolist()) == list(range(6))
+
+
+def test_empty_batch_and_catalog():
+    engine = _engine(demo=False)
+    assert engine.top_k_batch([], TOP_K) == ([], [])
+
+    empty = RecommendationEngine(ProductCatalog([]))
+    ids, scores = empty.top_k_batch(["u0"], TOP_K)
+    assert len(ids[0]) == len(scores[0]) == 0
+    assert len(empty.top_k("u0")[0]) == 0